@@ -25,4 +25,7 @@ RESOURCES_PATH = Path(_resource_path("_resources"))
 LICENSES_PATH = Path(_resource_path("_licenses"))
 
 DEBUG = os.environ.get("DEBUG") is not None
-MOCK_SIMULATOR = os.environ.get("MOCK_SIMULATOR") is not None
+# Path of a recorded flight track to replay instead of connecting to the simulator
+MOCK_TRACK = os.environ.get("MOCK_TRACK")
+MOCK_TRACK_SPEED = float(os.environ.get("MOCK_TRACK_SPEED", 1.0))
+MOCK_SIMULATOR = os.environ.get("MOCK_SIMULATOR") is not None or bool(MOCK_TRACK)
@@ -1,7 +1,20 @@
 # MSFS Screenshot GeoTag
 
+import multiprocessing
 import sys
 
-from msfs_geoshot.app import run
+if __name__ == "__main__":
+    # catalog scans read images in worker processes, which must not start
+    # the app again
+    multiprocessing.freeze_support()
 
-sys.exit(run())
+    from msfs_geoshot.cli import COMMANDS
+
+    if sys.argv[1:2] and sys.argv[1] in COMMANDS:
+        from msfs_geoshot.cli import main
+
+        sys.exit(main(sys.argv[1:]))
+
+    from msfs_geoshot.app import run
+
+    sys.exit(run())
@@ -0,0 +1,198 @@
+"""
+Nearest airport to a position, from a bundled list of airports
+
+The list (built from OurAirports with tools/build_airport_index.py) is stored
+as a k-d tree of the airports' positions on the unit sphere. The straight
+distance between points on the sphere grows with their great-circle distance,
+so the nearest airport by one is the nearest by the other, and the tree never
+has to deal with the antimeridian or the poles.
+"""
+
+import math
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from . import RESOURCES_PATH
+from .geo import EARTH_RADIUS
+
+AIRPORT_INDEX_PATH = RESOURCES_PATH / "airports.npz"
+
+_version = 1
+# ranges of at most this many airports are searched exhaustively
+_leaf_size = 16
+
+
+class AirportIndexError(Exception):
+    pass
+
+
+class Airport(NamedTuple):
+    ident: str  # ICAO code, or else the code OurAirports assigned
+    name: str
+    latitude: float
+    longitude: float
+    distance: float  # m from the queried position
+
+
+class AirportIndex:
+    """Answers nearest airport queries from an index file
+
+    The tree is implicit: the node of a range of airports is the one in its
+    middle, splitting the others along the axis in split_axes[middle].
+    """
+
+    def __init__(self, path: Path = AIRPORT_INDEX_PATH):
+        try:
+            with np.load(path) as data:
+                if int(data["version"]) != _version:
+                    raise AirportIndexError(f"{path} is of another version")
+                self._points = data["points"]
+                self._split_axes = data["split_axes"]
+                self._label_offsets = data["label_offsets"]
+                self._labels = data["labels"].tobytes()
+        except (OSError, ValueError, KeyError) as e:
+            raise AirportIndexError(f"Could not open airport index {path}: {e}")
+        # nodes are visited one by one, which is faster on Python floats
+        self._node_points: List[Tuple[float, float, float]] = [
+            (x, y, z) for x, y, z in self._points.tolist()
+        ]
+        self._node_axes: List[int] = self._split_axes.tolist()
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def nearest(
+        self, latitude: float, longitude: float, max_distance: float = math.inf
+    ) -> Optional[Airport]:
+        """Nearest airport within max_distance m, if any"""
+        target = _to_unit_vector(latitude, longitude)
+        best_index = -1
+        best_chord = _chord_squared(max_distance)
+        points = self._points
+        # range of airports and a lower bound of their squared chord distance
+        stack: List[Tuple[int, int, float]] = [(0, len(points), 0.0)]
+        while stack:
+            start, end, bound = stack.pop()
+            if bound >= best_chord:
+                continue
+            if end - start <= _leaf_size:
+                if end > start:
+                    chords = ((points[start:end] - target) ** 2).sum(axis=1)
+                    index = int(np.argmin(chords))
+                    if chords[index] < best_chord:
+                        best_chord = float(chords[index])
+                        best_index = start + index
+                continue
+
+            middle = (start + end) // 2
+            point = self._node_points[middle]
+            chord = (
+                (point[0] - target[0]) ** 2
+                + (point[1] - target[1]) ** 2
+                + (point[2] - target[2]) ** 2
+            )
+            if chord < best_chord:
+                best_chord = chord
+                best_index = middle
+            axis = self._node_axes[middle]
+            delta = target[axis] - point[axis]
+            below = (start, middle)
+            above = (middle + 1, end)
+            near, far = (below, above) if delta < 0 else (above, below)
+            # the near side first, as it most likely holds the nearest one
+            stack.append((*far, max(bound, delta * delta)))
+            stack.append((*near, bound))
+
+        if best_index < 0:
+            return None
+        return self._get_airport(best_index, best_chord)
+
+    def _get_airport(self, index: int, chord_squared: float) -> Airport:
+        start, end = self._label_offsets[index : index + 2].tolist()
+        ident, _, name = self._labels[start:end].decode("utf-8").partition("\t")
+        x, y, z = self._node_points[index]
+        chord = math.sqrt(chord_squared)
+        return Airport(
+            ident=ident,
+            name=name,
+            latitude=math.degrees(math.asin(max(-1.0, min(1.0, z)))),
+            longitude=math.degrees(math.atan2(y, x)),
+            distance=2 * EARTH_RADIUS * math.asin(min(1.0, chord / 2)),
+        )
+
+
+def _to_unit_vector(latitude: float, longitude: float) -> Tuple[float, float, float]:
+    phi = math.radians(latitude)
+    lambda_ = math.radians(longitude)
+    return (
+        math.cos(phi) * math.cos(lambda_),
+        math.cos(phi) * math.sin(lambda_),
+        math.sin(phi),
+    )
+
+
+def _chord_squared(distance: float) -> float:
+    """Squared straight distance on the unit sphere for a great-circle
+    distance in m"""
+    if distance >= math.pi * EARTH_RADIUS:
+        return math.inf
+    return (2 * math.sin(distance / EARTH_RADIUS / 2)) ** 2
+
+
+def write_airport_index(path: Path, airports: Iterable[Tuple[str, str, float, float]]):
+    """Build the k-d tree of airports and write it to an index file
+
+    Args:
+        airports: Ident, name, latitude and longitude of each airport
+    """
+    labels: List[bytes] = []
+    vectors: List[Tuple[float, float, float]] = []
+    for ident, name, latitude, longitude in airports:
+        labels.append(f"{ident}\t{name}".encode("utf-8"))
+        vectors.append(_to_unit_vector(latitude, longitude))
+    points = np.array(vectors, dtype=np.float64).reshape(-1, 3)
+
+    order = np.arange(len(points))
+    split_axes = np.zeros(len(points), dtype=np.uint8)
+    ranges = [(0, len(points))]
+    while ranges:
+        start, end = ranges.pop()
+        if end - start <= _leaf_size:
+            continue
+        indices = order[start:end]
+        range_points = points[indices]
+        # split along the axis the airports are spread the widest
+        axis = int(np.argmax(range_points.max(axis=0) - range_points.min(axis=0)))
+        middle = (start + end) // 2
+        partition = np.argpartition(range_points[:, axis], middle - start)
+        order[start:end] = indices[partition]
+        split_axes[middle] = axis
+        ranges.append((start, middle))
+        ranges.append((middle + 1, end))
+
+    sorted_labels = [labels[index] for index in order.tolist()]
+    label_offsets = np.concatenate(
+        ([0], np.cumsum([len(label) for label in sorted_labels], dtype=np.int64))
+    ).astype(np.uint32)
+    with path.open("wb") as index_file:
+        np.savez(
+            index_file,
+            version=np.array(_version),
+            points=points[order],
+            split_axes=split_axes,
+            label_offsets=label_offsets,
+            labels=np.frombuffer(b"".join(sorted_labels), dtype=np.uint8),
+        )
+
+
+def get_default_airport_index() -> Optional[AirportIndex]:
+    """The bundled airport index, None if it is not installed"""
+    if not AIRPORT_INDEX_PATH.is_file():
+        return None
+    try:
+        return AirportIndex()
+    except AirportIndexError as e:
+        print(e)
+        return None
@@ -1,26 +1,51 @@
 import sys
+from datetime import datetime
+from pathlib import Path
 from typing import List
 
 import multiexit
-from PyQt5.QtCore import QAbstractEventDispatcher, QThreadPool
+from PyQt5.QtCore import QAbstractEventDispatcher, QStandardPaths, QThreadPool
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QApplication, QStyle
 from pyqtkeybind import keybinder
 
-from . import DEBUG, RESOURCES_PATH, __app_name__, __version__
-from .gui.controller import ScreenShotController
+from . import (
+    DEBUG,
+    MOCK_SIMULATOR,
+    MOCK_TRACK,
+    MOCK_TRACK_SPEED,
+    RESOURCES_PATH,
+    __app_name__,
+    __version__,
+)
+from .catalog import CATALOG_FILE_NAME, Catalog, CatalogError
+from .geocoding import GEOCODE_CACHE_FILE_NAME, CachedGeocoder, get_default_geocoder
+from .gui.controller import ScreenShotController, ScreenShotResult
 from .gui.credits import show_credits
 from .gui.error_handler import ErrorHandler, show_error
 from .gui.feedback import FeedbackDialog
 from .gui.hotkeys import GlobalHotkeyService, HotkeyID, WindowsEventFilter
 from .gui.main_window import MainWindow
+from .gui.renamer import RENAME_JOURNAL_FILE_NAME, DeferredRenamer
 from .gui.settings import AppSettings
+from .gui.threading import Runner
 from .gui.thumbnails import ThumbnailMaker
 from .gui.tray_icon import AppTrayIcon
+from .gui.watcher import FolderWatcher
 from .metadata import MetadataService
-from .names import FileNameComposer
+from .names import FileNameComposer, FileNameTemplate
+from .prefetch import GeocodePrefetcher
 from .screenshots import ScreenshotService
-from .sim import SimService
+from .sim import SimConnectSource, SimService, SimServiceError
+from .timezones import get_default_timezone_index
+from .tracks import (
+    TRACK_FILE_EXTENSION,
+    ReplaySource,
+    TrackFileError,
+    export_gpx,
+    export_kml,
+    load_track,
+)
 
 
 class Application(QApplication):
@@ -43,18 +68,50 @@ def run():
     icon_tray = QIcon(str(RESOURCES_PATH / "tray.png"))
     app.setWindowIcon(icon_window)
 
-    sim_service = SimService()
+    if MOCK_TRACK:
+        from .debug import FakeWindowBackend
+
+        sim_service = SimService(
+            source=ReplaySource(
+                load_track(Path(MOCK_TRACK)),
+                speed=MOCK_TRACK_SPEED,
+                aircraft_type="Replay",
+            ),
+            window_backend=FakeWindowBackend(),
+            parent=app,
+        )
+    elif MOCK_SIMULATOR:
+        from .debug import MockSimConnect
+
+        sim_service = SimService(
+            source=SimConnectSource(
+                process_watcher=None, session_factory=MockSimConnect
+            ),
+            parent=app,
+        )
+    else:
+        sim_service = SimService(parent=app)
     metadata_service = MetadataService()
-    file_name_composer = FileNameComposer()
-    screenshot_service = ScreenshotService(file_name_composer)
     app_settings = AppSettings(app)
 
+    data_folder = Path(QStandardPaths.writableLocation(QStandardPaths.AppDataLocation))
+    data_folder.mkdir(parents=True, exist_ok=True)
+    catalog = Catalog(data_folder / CATALOG_FILE_NAME)
+
+    geocoder = get_default_geocoder(cache_path=data_folder / GEOCODE_CACHE_FILE_NAME)
+    file_name_composer = FileNameComposer(geocoder)
+    screenshot_service = ScreenshotService(file_name_composer)
+    renamer = DeferredRenamer(
+        file_name_composer, data_folder / RENAME_JOURNAL_FILE_NAME, parent=app
+    )
+
     screenshot_controller = ScreenShotController(
         sim_service=sim_service,
         metadata_service=metadata_service,
         screenshot_service=screenshot_service,
         file_name_composer=file_name_composer,
         settings=app_settings,
+        renamer=renamer,
         parent=app,
     )
 
@@ -68,6 +125,9 @@ def run():
         thread_pool=QThreadPool.globalInstance(), thumbnail_height=96, parent=app
     )
 
+    sim_service.connected.connect(main_window.on_sim_connected)  # type: ignore
+    sim_service.disconnected.connect(main_window.on_sim_disconnected)  # type: ignore
+
     screenshot_controller.sim_window_found.connect(main_window.on_sim_window_found)  # type: ignore
     screenshot_controller.screenshot_taken.connect(main_window.on_screenshot_taken)  # type: ignore
     screenshot_controller.error.connect(main_window.on_screenshot_error)  # type: ignore
@@ -75,8 +135,42 @@ def run():
     screenshot_controller.screenshot_taken.connect(
         lambda result: thumbnail_maker.create_thumbnail(str(result.path))  # type: ignore
     )
+
+    def on_screenshot_taken(result: ScreenShotResult):
+        try:
+            catalog.add(result.path, result.metadata)
+        except (CatalogError, OSError) as e:
+            print(f"Could not add screenshot to catalog: {e}")
+
+    screenshot_controller.screenshot_taken.connect(on_screenshot_taken)  # type: ignore
+
+    def on_screenshot_renamed(old_path: Path, new_path: Path):
+        try:
+            catalog.move(old_path, new_path)
+        except (CatalogError, OSError) as e:
+            print(f"Could not update screenshot in catalog: {e}")
+
+    screenshot_controller.screenshot_renamed.connect(on_screenshot_renamed)  # type: ignore
+    screenshot_controller.screenshot_renamed.connect(main_window.on_screenshot_renamed)  # type: ignore
+
     thumbnail_maker.thumb_ready.connect(main_window.on_thumbnail_ready)  # type: ignore
 
+    folder_watcher = FolderWatcher(parent=app)
+    folder_watcher.file_ready.connect(screenshot_controller.tag_screenshot_file)  # type: ignore
+    # images this app saves or renames are not to be tagged again
+    screenshot_controller.file_saved.connect(folder_watcher.mark_known)  # type: ignore
+    main_window.watch_folder_changed.connect(folder_watcher.watch)  # type: ignore
+
+    def on_location_timezone_changed(enabled: bool):
+        # the index is only loaded while it is used
+        sim_service.timezones = get_default_timezone_index() if enabled else None
+
+    on_location_timezone_changed(app_settings.location_timezone)
+    main_window.location_timezone_changed.connect(on_location_timezone_changed)  # type: ignore
+
+    main_window.file_name_template_changed.connect(
+        screenshot_controller.set_file_name_template  # type: ignore
+    )
     main_window.screenshot_requested.connect(screenshot_controller.take_screenshot)  # type: ignore
     main_window.credits_requested.connect(lambda: show_credits(main_window))
 
@@ -84,6 +178,28 @@ def run():
     main_window.closed.connect(tray_icon_widget.hide)
     tray_icon_widget.quit_requested.connect(main_window.quit)  # type: ignore
 
+    def on_track_recording_toggled(enabled: bool):
+        if enabled:
+            file_name = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            try:
+                sim_service.start_recording(
+                    app_settings.screenshot_folder
+                    / "Tracks"
+                    / f"{file_name}.{TRACK_FILE_EXTENSION}"
+                )
+            except (TrackFileError, OSError, SimServiceError) as e:
+                print(f"Could not start recording flight track: {e}")
+                tray_icon_widget.set_track_recording(False)
+            return
+        track_path = sim_service.stop_recording()
+        if track_path:
+            for export, suffix in ((export_gpx, ".gpx"), (export_kml, ".kml")):
+                runner = Runner(export, track_path, track_path.with_suffix(suffix))
+                runner.signals.error.connect(print)  # type: ignore
+                QThreadPool.globalInstance().start(runner)  # type: ignore
+
+    tray_icon_widget.track_recording_toggled.connect(on_track_recording_toggled)  # type: ignore
+
     keybinder.init()
 
     # For whatever reason, this only works when run in the context of this function:
@@ -96,8 +212,32 @@ def run():
     # Hotkey not unbound will not be usable until system restart, so be extra careful:
     main_window.closed.connect(hotkey_service.unbind_all_hotkeys)
 
+    app.aboutToQuit.connect(sim_service.stop)
+    app.aboutToQuit.connect(metadata_service.close)
+    app.aboutToQuit.connect(renamer.stop)
+    app.aboutToQuit.connect(catalog.close)
+
+    if isinstance(geocoder, CachedGeocoder):
+        # locations ahead on the route are cached before screenshots need them
+        prefetcher = GeocodePrefetcher(geocoder, sim_service.get_latest_sample)
+        prefetcher.is_enabled = screenshot_controller.file_name_template.uses_field(
+            "geocode"
+        )
+
+        def on_file_name_template_changed(template: FileNameTemplate):
+            prefetcher.is_enabled = template.uses_field("geocode")
+
+        main_window.file_name_template_changed.connect(on_file_name_template_changed)  # type: ignore
+        prefetcher.start()
+        app.aboutToQuit.connect(prefetcher.stop)
+
+        if DEBUG:
+            app.aboutToQuit.connect(lambda: print(geocoder.stats))
+        app.aboutToQuit.connect(geocoder.close)
+
     def on_signal_exit():
         hotkey_service.unbind_all_hotkeys()
+        sim_service.stop()
         tray_icon_widget.hide()
         app.exit()
         sys.exit(1)
@@ -115,6 +255,19 @@ def run():
         lambda hotkey_id, key: hotkey_service.bind_hotkey(hotkey_id, key, main_window)
     )
 
+    sim_service.start()
+    # also renames screenshots left with a provisional name by the last session
+    renamer.start()
+
+    if app_settings.watch_folder_enabled:
+        folder_watcher.watch(app_settings.watch_folder)
+
+    # pick up screenshots added, changed or removed while the app was not running
+    catalog_folders = set(catalog.folders) | {app_settings.screenshot_folder.resolve()}
+    scan_runner = Runner(catalog.scan, catalog_folders)
+    scan_runner.signals.error.connect(print)  # type: ignore
+    QThreadPool.globalInstance().start(scan_runner)
+
     app_settings.times_launched += 1
 
     tray_icon_widget.show()
@@ -0,0 +1,787 @@
+"""
+Searchable index of the screenshots taken with the app
+
+The catalog is a SQLite database holding one row per image with the position,
+capture time and aircraft title read from its EXIF data (or XMP sidecar). An
+R-tree over the positions answers spatial queries without scanning the table.
+
+Folders are scanned incrementally: only images whose modification time or size
+changed since the last scan are read again, in parallel worker processes for
+large scans.
+"""
+
+import math
+import os
+import sqlite3
+import struct
+import threading
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from PIL import Image
+
+from . import DEBUG
+from .geo import EARTH_RADIUS, haversine_distance, normalize_longitude
+from .metadata import EXIF_DATE_FORMAT, Metadata, get_sidecar_path
+
+CATALOG_FILE_NAME = "catalog.sqlite"
+
+_SCHEMA_VERSION = 1
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".tif", ".tiff"}
+
+# scans with fewer changed files are not worth starting worker processes
+_min_parallel_scan_size = 256
+_scan_chunk_size = 64
+_scan_window_size = 4096
+_write_batch_size = 512
+# time ranges with fewer shots are faster to search without the R-tree
+_max_time_range_scan = 5000
+
+_schema = """
+CREATE TABLE IF NOT EXISTS shots (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    capture_time REAL,
+    latitude REAL,
+    longitude REAL,
+    altitude REAL,
+    title TEXT COLLATE NOCASE
+);
+CREATE INDEX IF NOT EXISTS shots_capture_time ON shots (capture_time);
+CREATE INDEX IF NOT EXISTS shots_title ON shots (title);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS shots_position USING rtree (
+    id, min_latitude, max_latitude, min_longitude, max_longitude
+);
+
+-- keep the R-tree in sync with the positions in shots
+CREATE TRIGGER IF NOT EXISTS shots_inserted AFTER INSERT ON shots
+WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL
+BEGIN
+    INSERT INTO shots_position VALUES (
+        new.id, new.latitude, new.latitude, new.longitude, new.longitude
+    );
+END;
+CREATE TRIGGER IF NOT EXISTS shots_moved AFTER UPDATE OF latitude, longitude
+ON shots
+BEGIN
+    DELETE FROM shots_position WHERE id = old.id;
+    INSERT INTO shots_position
+    SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+    WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+END;
+CREATE TRIGGER IF NOT EXISTS shots_deleted AFTER DELETE ON shots
+BEGIN
+    DELETE FROM shots_position WHERE id = old.id;
+END;
+
+CREATE TABLE IF NOT EXISTS folders (path TEXT PRIMARY KEY);
+"""
+
+_upsert_statement = """
+INSERT INTO shots (
+    path, mtime_ns, size, capture_time, latitude, longitude, altitude, title
+)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (path) DO UPDATE SET
+    mtime_ns = excluded.mtime_ns,
+    size = excluded.size,
+    capture_time = excluded.capture_time,
+    latitude = excluded.latitude,
+    longitude = excluded.longitude,
+    altitude = excluded.altitude,
+    title = excluded.title
+"""
+
+_entry_columns = (
+    "path, mtime_ns, size, capture_time, latitude, longitude, altitude, title"
+)
+
+
+class CatalogError(Exception):
+    pass
+
+
+class CatalogEntry(NamedTuple):
+    path: str
+    mtime_ns: int  # of the file the entry was read from
+    size: int
+    capture_time: Optional[float]  # s since epoch
+    latitude: Optional[float]  # degrees
+    longitude: Optional[float]  # degrees
+    altitude: Optional[float]  # m
+    title: Optional[str]  # aircraft title
+
+
+class BoundingBox(NamedTuple):
+    """Area between two parallels and two meridians, in degrees
+
+    west may be greater than east for boxes crossing the antimeridian.
+    """
+
+    south: float
+    west: float
+    north: float
+    east: float
+
+
+class ScanResult(NamedTuple):
+    added: int
+    updated: int
+    removed: int
+    unchanged: int
+
+
+class FileSignature(NamedTuple):
+    """Tells whether an image changed since it was read"""
+
+    mtime_ns: int
+    size: int
+
+
+class ImageTags(NamedTuple):
+    """Tags read back from an image, named like the Metadata fields they were
+    written from"""
+
+    AllDates: Optional[str]  # "YYYY:mm:dd HH:MM:SS", local time
+    OffsetTime: Optional[str]  # "±HH:MM"
+    GPSLatitude: Optional[float]  # degrees
+    GPSLongitude: Optional[float]  # degrees
+    GPSAltitude: Optional[float]  # m
+    GPSImgDirection: Optional[float]  # degrees
+    ImageDescription: Optional[str]  # aircraft title
+
+    @property
+    def capture_time(self) -> Optional[float]:
+        """s since epoch"""
+        return _parse_exif_date(self.AllDates, self.OffsetTime)
+
+
+class Catalog:
+    """SQLite backed screenshot index
+
+    Methods may be called from any thread, a scan running in the background
+    only holds the database while writing a batch of entries.
+    """
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._is_closed = False
+        try:
+            self._connection = sqlite3.connect(
+                str(path), check_same_thread=False, isolation_level=None
+            )
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.execute("PRAGMA synchronous = NORMAL")
+            self._connection.executescript(_schema)
+            self._connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        except sqlite3.Error as e:
+            raise CatalogError(f"Could not open catalog {path}: {e}") from e
+
+    @property
+    def folders(self) -> List[Path]:
+        """Folders scanned into the catalog so far"""
+        with self._lock:
+            rows = self._connection.execute("SELECT path FROM folders").fetchall()
+        return [Path(path) for path, in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._connection.execute("SELECT COUNT(*) FROM shots").fetchone()
+        return count
+
+    def add(self, path: Path, metadata: Optional[Metadata]):
+        """Add or update a screenshot whose metadata is already known"""
+        self.update([entry_from_metadata(path, metadata)])
+
+    def update(self, entries: Iterable[CatalogEntry]):
+        """Insert entries, replacing the ones with the same path"""
+        with self._lock:
+            self._check_open()
+            try:
+                with self._transaction():
+                    self._connection.executemany(_upsert_statement, entries)
+            except sqlite3.Error as e:
+                raise CatalogError(f"Could not update catalog: {e}") from e
+
+    def move(self, old_path: Path, new_path: Path):
+        """Update the path of a renamed screenshot"""
+        with self._lock:
+            self._check_open()
+            try:
+                self._connection.execute(
+                    "UPDATE OR REPLACE shots SET path = ? WHERE path = ?",
+                    (str(new_path.resolve()), str(old_path.resolve())),
+                )
+            except sqlite3.Error as e:
+                raise CatalogError(f"Could not update catalog: {e}") from e
+
+    def remove(self, paths: Iterable[str]):
+        with self._lock:
+            self._check_open()
+            try:
+                with self._transaction():
+                    self._connection.executemany(
+                        "DELETE FROM shots WHERE path = ?",
+                        ((path,) for path in paths),
+                    )
+            except sqlite3.Error as e:
+                raise CatalogError(f"Could not update catalog: {e}") from e
+
+    def scan(
+        self, folders: Iterable[Path], max_workers: Optional[int] = None
+    ) -> ScanResult:
+        """Bring the catalog up to date with the images in folders
+
+        Folders are searched recursively. Only new or modified images are
+        read, images that no longer exist are removed.
+
+        Args:
+            max_workers: Number of processes reading images, defaults to the
+                number of CPUs. 1 reads them in the calling thread.
+        """
+        files: Dict[str, FileSignature] = {}
+        known: Dict[str, FileSignature] = {}
+        for folder in folders:
+            root = str(folder.resolve())
+            files.update(find_images(root))
+            known.update(self._get_signatures(root))
+            with self._lock:
+                self._check_open()
+                self._connection.execute(
+                    "INSERT OR IGNORE INTO folders VALUES (?)", (root,)
+                )
+
+        removed = [path for path in known if path not in files]
+        changed = [
+            (path, signature)
+            for path, signature in files.items()
+            if known.get(path) != signature
+        ]
+        self.remove(removed)
+
+        for batch in _batched(read_images(changed, max_workers)):
+            if self._is_closed:
+                raise CatalogError("Catalog was closed during scan")
+            self.update(batch)
+
+        updated = sum(1 for path, _ in changed if path in known)
+        result = ScanResult(
+            added=len(changed) - updated,
+            updated=updated,
+            removed=len(removed),
+            unchanged=len(files) - len(changed),
+        )
+        if DEBUG:
+            print(f"Catalog scan: {result}")
+        return result
+
+    def query(
+        self,
+        bounding_box: Optional[BoundingBox] = None,
+        center: Optional[Tuple[float, float]] = None,
+        radius: Optional[float] = None,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+        title: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[CatalogEntry]:
+        """Find screenshots matching all given criteria, by capture time
+
+        Args:
+            bounding_box: Area the screenshot was taken in
+            center: Latitude and longitude in degrees, along with radius (m)
+                the great-circle distance from it the screenshot was taken
+                within
+            start_time: Earliest capture time, s since epoch
+            end_time: Latest capture time, s since epoch
+            title: Start of the aircraft title, case-insensitive
+            limit: Maximum number of entries returned
+        """
+        if (center is None) != (radius is None):
+            raise ValueError("center and radius must be given together")
+
+        conditions: List[str] = []
+        parameters: List[object] = []
+
+        if start_time is not None:
+            conditions.append("capture_time >= ?")
+            parameters.append(start_time)
+        if end_time is not None:
+            conditions.append("capture_time <= ?")
+            parameters.append(end_time)
+
+        boxes: List[BoundingBox] = []
+        if bounding_box:
+            boxes.append(bounding_box)
+        if center is not None and radius is not None:
+            boxes.append(_get_radius_bounding_box(*center, radius))
+        # SQLite cannot tell which index is more selective, so a short time
+        # range is searched by time and the R-tree is only used otherwise
+        use_position_index = bool(boxes) and (
+            (start_time is None and end_time is None)
+            or self._count_between(start_time, end_time) > _max_time_range_scan
+        )
+        for box in boxes:
+            longitude_ranges = _split_longitude_range(box.west, box.east)
+            if use_position_index:
+                # the R-tree stores single precision, so it pre-selects and
+                # the exact coordinates decide
+                conditions.append(
+                    "id IN ("
+                    + " UNION ALL ".join(
+                        "SELECT id FROM shots_position"
+                        " WHERE max_latitude >= ? AND min_latitude <= ?"
+                        " AND max_longitude >= ? AND min_longitude <= ?"
+                        for _ in longitude_ranges
+                    )
+                    + ")"
+                )
+                for west, east in longitude_ranges:
+                    parameters += [box.south, box.north, west, east]
+            conditions.append("latitude BETWEEN ? AND ?")
+            conditions.append(
+                "("
+                + " OR ".join("longitude BETWEEN ? AND ?" for _ in longitude_ranges)
+                + ")"
+            )
+            parameters += [box.south, box.north]
+            for west, east in longitude_ranges:
+                parameters += [west, east]
+
+        if title:
+            # prefix matches can use the NOCASE index
+            conditions.append("title LIKE ? ESCAPE '\\'")
+            parameters.append(_escape_like(title) + "%")
+
+        statement = f"SELECT {_entry_columns} FROM shots"
+        if conditions:
+            statement += " WHERE " + " AND ".join(conditions)
+        statement += " ORDER BY capture_time"
+        if limit is not None and center is None:
+            statement += f" LIMIT {int(limit)}"
+
+        with self._lock:
+            self._check_open()
+            rows = self._connection.execute(statement, parameters).fetchall()
+        entries = [CatalogEntry(*row) for row in rows]
+
+        if center is not None and radius is not None:
+            entries = [
+                entry
+                for entry in entries
+                if entry.latitude is not None
+                and entry.longitude is not None
+                and haversine_distance(*center, entry.latitude, entry.longitude)
+                <= radius
+            ][:limit]
+        return entries
+
+    def close(self):
+        self._is_closed = True
+        with self._lock:
+            self._connection.close()
+
+    def _count_between(
+        self, start_time: Optional[float], end_time: Optional[float]
+    ) -> int:
+        with self._lock:
+            self._check_open()
+            (count,) = self._connection.execute(
+                "SELECT COUNT(*) FROM shots" " WHERE capture_time BETWEEN ? AND ?",
+                (
+                    -math.inf if start_time is None else start_time,
+                    math.inf if end_time is None else end_time,
+                ),
+            ).fetchone()
+        return count
+
+    def _check_open(self):
+        if self._is_closed:
+            raise CatalogError("Catalog is closed")
+
+    def _transaction(self) -> "_Transaction":
+        return _Transaction(self._connection)
+
+    def _get_signatures(self, root: str) -> Iterator[Tuple[str, FileSignature]]:
+        # paths below root, as a range so that the path index is used
+        with self._lock:
+            self._check_open()
+            rows = self._connection.execute(
+                "SELECT path, mtime_ns, size FROM shots WHERE path >= ? AND path < ?",
+                (root + os.sep, root + chr(ord(os.sep) + 1)),
+            ).fetchall()
+        for path, mtime_ns, size in rows:
+            yield path, FileSignature(mtime_ns, size)
+
+
+class _Transaction:
+    def __init__(self, connection: sqlite3.Connection):
+        self._connection = connection
+
+    def __enter__(self):
+        self._connection.execute("BEGIN")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._connection.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def entry_from_metadata(path: Path, metadata: Optional[Metadata]) -> CatalogEntry:
+    resolved_path = str(path.resolve())
+    signature = _get_signature(resolved_path)
+    if not metadata:
+        return CatalogEntry(resolved_path, *signature, None, None, None, None, None)
+    return CatalogEntry(
+        path=resolved_path,
+        mtime_ns=signature.mtime_ns,
+        size=signature.size,
+        # the date written to the image rather than capture_time, so that
+        # entries match the ones read by scans
+        capture_time=_parse_exif_date(metadata.AllDates, metadata.OffsetTime),
+        latitude=metadata.GPSLatitude,
+        longitude=metadata.GPSLongitude,
+        altitude=metadata.GPSAltitude,
+        title=metadata.ImageDescription or metadata.Description,
+    )
+
+
+def read_images(
+    files: Sequence[Tuple[str, FileSignature]], max_workers: Optional[int] = None
+) -> Iterator[CatalogEntry]:
+    """Read the catalog entries of images, in order
+
+    Args:
+        files: Paths and signatures as returned by find_images()
+        max_workers: Number of processes reading images, defaults to the
+            number of CPUs. 1 reads them in the calling thread.
+    """
+    return map_images(read_catalog_entry, files, max_workers)
+
+
+def map_images(
+    reader: Callable[[Any], Any], items: Sequence[Any], max_workers: Optional[int]
+) -> Iterator[Any]:
+    """Apply reader to each of items, in worker processes if there are many
+
+    Results are yielded in order. reader must be a module level function, so
+    that it can be sent to the workers.
+    """
+    if max_workers == 1 or len(items) < _min_parallel_scan_size:
+        yield from map(reader, items)
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # submitted a window at a time, so that memory use does not grow with
+        # the number of images
+        for start in range(0, len(items), _scan_window_size):
+            yield from executor.map(
+                reader,
+                items[start : start + _scan_window_size],
+                chunksize=_scan_chunk_size,
+            )
+
+
+def read_catalog_entry(file: Tuple[str, FileSignature]) -> CatalogEntry:
+    """Read the catalog entry of an image from its tags
+
+    Images that cannot be read get an entry without metadata, so that they
+    are not read again until they change.
+    """
+    path, signature = file
+    tags = read_image_tags(path)
+    return CatalogEntry(
+        path,
+        *signature,
+        capture_time=tags.capture_time,
+        latitude=tags.GPSLatitude,
+        longitude=tags.GPSLongitude,
+        altitude=tags.GPSAltitude,
+        title=tags.ImageDescription,
+    )
+
+
+def read_image_tags(path: str) -> ImageTags:
+    """Read the tags of an image from its EXIF data, or its XMP sidecar if the
+    image has no position
+
+    Only the headers of the image are read, not the pixel data.
+    """
+    tags = _read_exif(path)
+    sidecar_path = get_sidecar_path(Path(path))
+    if tags.GPSLatitude is None and sidecar_path.is_file():
+        tags = _read_xmp_sidecar(sidecar_path)
+    return tags
+
+
+_no_tags = ImageTags(None, None, None, None, None, None, None)
+
+
+def _read_exif(path: str) -> ImageTags:
+    try:
+        with Image.open(path) as image:
+            if image.format == "PNG" and "exif" not in image.info:
+                # getexif() would decode all pixels to look behind them
+                exif = Image.Exif()
+                exif_data = _find_png_exif(path)
+                if exif_data:
+                    exif.load(exif_data)
+            else:
+                exif = image.getexif()
+            exif_ifd = exif.get_ifd(0x8769)
+            gps_ifd = exif.get_ifd(0x8825)
+    except Exception as e:
+        if DEBUG:
+            print(f"Could not read EXIF data of {path}: {e}")
+        return _no_tags
+
+    altitude = gps_ifd.get(0x0006)
+    if altitude is not None:
+        altitude = float(altitude)
+        if gps_ifd.get(0x0005) in (1, b"\x01"):  # below sea level
+            altitude = -altitude
+    heading = gps_ifd.get(0x0011)
+    return ImageTags(
+        AllDates=_strip(exif_ifd.get(0x9003) or exif.get(0x0132)),
+        OffsetTime=_strip(exif_ifd.get(0x9011)),
+        GPSLatitude=_dms_to_degrees(gps_ifd.get(0x0002), gps_ifd.get(0x0001), "S"),
+        GPSLongitude=_dms_to_degrees(gps_ifd.get(0x0004), gps_ifd.get(0x0003), "W"),
+        GPSAltitude=altitude,
+        GPSImgDirection=float(heading) if heading is not None else None,
+        ImageDescription=exif.get(0x010E) or None,
+    )
+
+
+def _find_png_exif(path: str) -> Optional[bytes]:
+    """The eXIf chunk of a PNG, skipping over the chunks before it unread"""
+    with open(path, "rb") as image_file:
+        image_file.seek(8)  # signature
+        while True:
+            header = image_file.read(8)
+            if len(header) < 8:
+                return None
+            length, chunk_type = struct.unpack(">I4s", header)
+            if chunk_type == b"eXIf":
+                return image_file.read(length)
+            if chunk_type == b"IEND":
+                return None
+            image_file.seek(length + 4, os.SEEK_CUR)  # data and CRC
+
+
+def _strip(value: Optional[str]) -> Optional[str]:
+    # EXIF strings may be padded with spaces or NULs
+    if not isinstance(value, str):
+        return None
+    return value.strip(" \x00") or None
+
+
+def _parse_exif_date(date: Optional[str], offset: Optional[str]) -> Optional[float]:
+    if not date:
+        return None
+    try:
+        if offset:
+            return datetime.strptime(
+                f"{date.strip()}{offset.strip()}", f"{EXIF_DATE_FORMAT}%z"
+            ).timestamp()
+        # local time of the machine the screenshot was taken on, best guess
+        return datetime.strptime(date.strip(), EXIF_DATE_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+
+def _dms_to_degrees(
+    dms: Optional[Sequence[float]], ref: Optional[str], negative_ref: str
+) -> Optional[float]:
+    if not dms or len(dms) != 3:
+        return None
+    degrees = float(dms[0]) + float(dms[1]) / 60 + float(dms[2]) / 3600
+    return -degrees if ref and ref.strip() == negative_ref else degrees
+
+
+_xmp_namespaces = {
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "exif": "http://ns.adobe.com/exif/1.0/",
+}
+
+
+def _read_xmp_sidecar(path: Path) -> ImageTags:
+    try:
+        root = ElementTree.parse(path).getroot()
+    except (OSError, ElementTree.ParseError) as e:
+        if DEBUG:
+            print(f"Could not read sidecar {path}: {e}")
+        return _no_tags
+
+    def find_text(name: str) -> Optional[str]:
+        element = root.find(f".//{name}", _xmp_namespaces)
+        return element.text if element is not None else None
+
+    date: Optional[str] = None
+    offset: Optional[str] = None
+    date_text = find_text("exif:DateTimeOriginal")
+    if date_text:
+        try:
+            parsed_date = datetime.fromisoformat(date_text)
+        except ValueError:
+            pass
+        else:
+            date = parsed_date.strftime(EXIF_DATE_FORMAT)
+            if parsed_date.tzinfo is not None:
+                # "+HH:MM"
+                offset = parsed_date.isoformat()[-6:]
+
+    altitude = _parse_xmp_rational(find_text("exif:GPSAltitude"))
+    if altitude is not None and find_text("exif:GPSAltitudeRef") == "1":
+        altitude = -altitude
+
+    return ImageTags(
+        AllDates=date,
+        OffsetTime=offset,
+        GPSLatitude=_parse_xmp_coordinate(find_text("exif:GPSLatitude")),
+        GPSLongitude=_parse_xmp_coordinate(find_text("exif:GPSLongitude")),
+        GPSAltitude=altitude,
+        GPSImgDirection=_parse_xmp_rational(find_text("exif:GPSImgDirection")),
+        ImageDescription=find_text("dc:description/rdf:Alt/rdf:li"),
+    )
+
+
+def _parse_xmp_rational(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    numerator, _, denominator = value.partition("/")
+    try:
+        return float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def _parse_xmp_coordinate(value: Optional[str]) -> Optional[float]:
+    # "DDD,MM.mmmmmmK" or "DDD,MM,SSK"
+    if not value or value[-1] not in "NSEW":
+        return None
+    try:
+        parts = [float(part) for part in value[:-1].split(",")]
+    except ValueError:
+        return None
+    degrees = sum(part / 60**index for index, part in enumerate(parts))
+    return -degrees if value[-1] in "SW" else degrees
+
+
+def find_images(
+    root: str, recursive: bool = True
+) -> Iterator[Tuple[str, FileSignature]]:
+    """Images in root and, if recursive, its subfolders with their signatures
+
+    The signature of an image with a sidecar covers the sidecar too, so that
+    editing either causes the image to be read again.
+    """
+    sidecars: Dict[str, FileSignature] = {}
+    images: Dict[str, FileSignature] = {}
+    directories = [root]
+    while directories:
+        try:
+            with os.scandir(directories.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            directories.append(entry.path)
+                        continue
+                    suffix = os.path.splitext(entry.name)[1].lower()
+                    if suffix in IMAGE_SUFFIXES:
+                        images[entry.path] = _entry_signature(entry)
+                    elif suffix == ".xmp":
+                        sidecars[os.path.splitext(entry.path)[0]] = _entry_signature(
+                            entry
+                        )
+        except OSError as e:
+            print(f"Could not scan {e.filename}: {e.strerror}")
+
+    for path, signature in images.items():
+        sidecar_signature = sidecars.get(os.path.splitext(path)[0])
+        if sidecar_signature:
+            signature = FileSignature(
+                max(signature.mtime_ns, sidecar_signature.mtime_ns),
+                signature.size + sidecar_signature.size,
+            )
+        yield path, signature
+
+
+def _entry_signature(entry: os.DirEntry) -> FileSignature:
+    # cached from the directory listing on Windows
+    stat = entry.stat()
+    return FileSignature(stat.st_mtime_ns, stat.st_size)
+
+
+def _get_signature(path: str) -> FileSignature:
+    stat = os.stat(path)
+    signature = FileSignature(stat.st_mtime_ns, stat.st_size)
+    try:
+        sidecar_stat = os.stat(get_sidecar_path(Path(path)))
+    except OSError:
+        return signature
+    return FileSignature(
+        max(signature.mtime_ns, sidecar_stat.st_mtime_ns),
+        signature.size + sidecar_stat.st_size,
+    )
+
+
+def _get_radius_bounding_box(
+    latitude: float, longitude: float, radius: float
+) -> BoundingBox:
+    angular_radius = radius / EARTH_RADIUS
+    delta_latitude = math.degrees(angular_radius)
+    south = latitude - delta_latitude
+    north = latitude + delta_latitude
+    if south <= -90 or north >= 90 or angular_radius >= math.pi / 2:
+        # circle contains a pole
+        return BoundingBox(max(south, -90.0), -180.0, min(north, 90.0), 180.0)
+    delta_longitude = math.degrees(
+        math.asin(min(1.0, math.sin(angular_radius) / math.cos(math.radians(latitude))))
+    )
+    if delta_longitude >= 180:
+        return BoundingBox(south, -180.0, north, 180.0)
+    return BoundingBox(
+        south,
+        normalize_longitude(longitude - delta_longitude),
+        north,
+        normalize_longitude(longitude + delta_longitude),
+    )
+
+
+def _split_longitude_range(west: float, east: float) -> List[Tuple[float, float]]:
+    if west <= east:
+        return [(west, east)]
+    # crosses the antimeridian
+    return [(west, 180.0), (-180.0, east)]
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _batched(entries: Iterable[CatalogEntry]) -> Iterator[List[CatalogEntry]]:
+    batch: List[CatalogEntry] = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= _write_batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
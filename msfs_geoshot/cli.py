@@ -0,0 +1,164 @@
+"""
+Command line interface for tasks run without the GUI
+
+    python -m msfs_geoshot geotag FOLDER TRACK [--offset SECONDS] ...
+    python -m msfs_geoshot export FOLDER [--geojson PATH] [--kml PATH] ...
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import List
+
+COMMANDS = {"geotag", "export"}
+
+
+def _run_geotag(arguments: argparse.Namespace) -> int:
+    from .geotag import ClockOffset, GeotagError, geotag_folder
+
+    def on_clock_offset(clock_offset: ClockOffset):
+        source = (
+            f"{clock_offset.anchor_count} geotagged image(s)"
+            if clock_offset.anchor_count
+            else "track coverage"
+        )
+        print(
+            f"Estimated clock offset: {clock_offset.seconds:+.0f} s (from {source}, "
+            f"{clock_offset.covered_count} image(s) covered by the track)"
+        )
+
+    def on_progress(done: int, total: int):
+        if done % 100 == 0 or done == total:
+            print(f"\r{done}/{total} images", end="", flush=True)
+
+    try:
+        result = geotag_folder(
+            folder=arguments.folder,
+            track_path=arguments.track,
+            clock_offset=arguments.offset,
+            workers=arguments.workers,
+            recursive=arguments.recursive,
+            overwrite=arguments.overwrite,
+            max_gap=arguments.max_gap,
+            aircraft_type=arguments.aircraft,
+            exiftool_command=arguments.exiftool,
+            on_progress=on_progress,
+            on_clock_offset=on_clock_offset,
+        )
+    except KeyboardInterrupt:
+        print("\nInterrupted, run the same command again to resume")
+        return 130
+    except (GeotagError, OSError) as e:
+        print(f"Could not geotag images: {e}", file=sys.stderr)
+        return 1
+
+    print(
+        f"\nTagged {result.tagged} image(s), {result.resumed} in an earlier run. "
+        f"Skipped {result.already_tagged} already geotagged and "
+        f"{result.outside_track} not covered by the track."
+    )
+    if result.failed:
+        print(
+            f"Could not write {result.failed} image(s), run the same command "
+            "again to retry",
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+def _run_export(arguments: argparse.Namespace) -> int:
+    from .export import export_folder
+
+    def on_progress(done: int, total: int):
+        print(f"\r{done}/{total} images", end="", flush=True)
+
+    try:
+        result = export_folder(
+            folder=arguments.folder,
+            geojson_path=arguments.geojson,
+            kml_path=arguments.kml,
+            recursive=arguments.recursive,
+            max_workers=arguments.workers,
+            on_progress=on_progress,
+        )
+    except KeyboardInterrupt:
+        print("\nInterrupted")
+        return 130
+    except OSError as e:
+        print(f"Could not export images: {e}", file=sys.stderr)
+        return 1
+
+    print(
+        f"\nExported {result.exported} image(s), skipped "
+        f"{result.without_position} without a position."
+    )
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="msfs_geoshot")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    geotag_parser = subparsers.add_parser(
+        "geotag",
+        help="Geotag existing images from a recorded flight track",
+        description="Match images to positions on a flight track recorded with "
+        "GeoShot by their capture time, and write them to the images.",
+    )
+    geotag_parser.add_argument("folder", type=Path, help="Folder of images")
+    geotag_parser.add_argument("track", type=Path, help="Track (.gstrack) file")
+    geotag_parser.add_argument(
+        "--offset",
+        type=float,
+        help="Seconds to add to image times to get track times, "
+        "estimated by default",
+    )
+    geotag_parser.add_argument(
+        "--workers", type=int, default=4, help="Number of exiftool processes"
+    )
+    geotag_parser.add_argument(
+        "--recursive", action="store_true", help="Include subfolders"
+    )
+    geotag_parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Also tag images that already have a position",
+    )
+    geotag_parser.add_argument(
+        "--max-gap",
+        type=float,
+        default=60.0,
+        help="Longest gap in the track to interpolate across, in s",
+    )
+    geotag_parser.add_argument("--aircraft", help="Aircraft title to write")
+    geotag_parser.add_argument(
+        "--exiftool", nargs="+", help="Command to run exiftool with"
+    )
+    geotag_parser.set_defaults(run=_run_geotag)
+
+    export_parser = subparsers.add_parser(
+        "export",
+        help="Export the positions of geotagged images to GeoJSON and KML",
+        description="Read the position, heading, altitude and aircraft of every "
+        "image in a folder and write them to GeoJSON and/or KML, ordered by date.",
+    )
+    export_parser.add_argument("folder", type=Path, help="Folder of images")
+    export_parser.add_argument("--geojson", type=Path, help="GeoJSON file to write")
+    export_parser.add_argument(
+        "--kml", type=Path, help="KML file of photo placemarks to write"
+    )
+    export_parser.add_argument(
+        "--recursive", action="store_true", help="Include subfolders"
+    )
+    export_parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of processes reading images, the number of CPUs by default",
+    )
+    export_parser.set_defaults(run=_run_export)
+
+    arguments = parser.parse_args(argv)
+    if arguments.command == "export" and not (arguments.geojson or arguments.kml):
+        parser.error("export needs --geojson and/or --kml")
+    return arguments.run(arguments)
@@ -0,0 +1,69 @@
+"""
+Serialization of Metadata into every format it is written in
+
+All formats are produced from the same MetadataRecord, so the Metadata
+instance is only read once per shot.
+"""
+
+import json
+from typing import List, Optional
+
+from .exif import encode_exif, encode_xmp
+from .metadata import METADATA_SCHEMA, Metadata, MetadataRecord, MetadataSchema
+
+
+class EncodedMetadata:
+    __slots__ = ("exiftool_arguments", "exif", "xmp", "json")
+
+    def __init__(
+        self,
+        exiftool_arguments: Optional[List[str]],
+        exif: Optional[bytes],
+        xmp: Optional[bytes],
+        json: Optional[str],
+    ):
+        self.exiftool_arguments = exiftool_arguments
+        self.exif = exif
+        self.xmp = xmp
+        self.json = json
+
+
+class MetadataCodec:
+    def __init__(self, schema: MetadataSchema = METADATA_SCHEMA):
+        self._schema = schema
+
+    def record(self, metadata: Metadata) -> MetadataRecord:
+        return self._schema.record(metadata)
+
+    def encode(
+        self,
+        metadata: Metadata,
+        with_exiftool_arguments: bool = True,
+        with_exif: bool = True,
+        with_xmp: bool = True,
+        with_json: bool = True,
+        xmp_include_exif: bool = False,
+    ) -> EncodedMetadata:
+        """Encode metadata into the requested formats in one pass
+
+        Args:
+            xmp_include_exif: Also put the EXIF tags into the XMP packet, e.g.
+                for sidecars
+        """
+        record = self._schema.record(metadata)
+        return EncodedMetadata(
+            exiftool_arguments=(
+                self._schema.exiftool_arguments(record)
+                if with_exiftool_arguments
+                else None
+            ),
+            exif=encode_exif(record) if with_exif else None,
+            xmp=encode_xmp(record, include_exif=xmp_include_exif) if with_xmp else None,
+            json=self.to_json(record) if with_json else None,
+        )
+
+    def to_json(self, record: MetadataRecord) -> str:
+        return _json_encoder.encode(dict(record.items()))
+
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
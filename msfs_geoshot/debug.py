@@ -1,8 +1,15 @@
+import math
 import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
 
+from .geo import destination_point
 from .metadata import EXIF_DATE_FORMAT, Metadata
+from .simvars import SimVarDefinition, SimVarPeriod, SimVarType
+from .telemetry import TelemetrySample
 from .time import get_datetime_string
-from .windows import WindowRectangle
+from .tracks import TrackRecorder
+from .window_cache import WindowBackend, WindowRectangle
 
 
 def get_mock_metadata() -> Metadata:
@@ -21,3 +28,143 @@ def get_mock_metadata() -> Metadata:
 
 def get_mock_window_rectangle() -> WindowRectangle:
     return WindowRectangle(0, 0, 1920, 1200)
+
+
+_mock_sim_values: Dict[str, Any] = {
+    "latitude": 60.0,
+    "longitude": 60.0,
+    "altitude": 100.0,
+    "speed": 55.0,
+    "heading": 0.0,
+    "dest_latitude": 60.5,
+    "dest_longitude": 60.5,
+    "aircraft_type": b"Mock Aircraft",
+}
+
+
+class MockSimConnect:
+    """Stand-in for a batched SimConnect session
+
+    Counts request/response round trips and optionally simulates their
+    latency, so that request strategies can be compared without a simulator.
+    """
+
+    def __init__(
+        self,
+        definition: SimVarDefinition,
+        values: Optional[Dict[str, Any]] = None,
+        latency: float = 0.0,  # s per round trip
+    ):
+        self.round_trips = 0
+        self.quit = 0
+        self._definition = definition
+        self._latency = latency
+        self._subscription_period: Optional[SimVarPeriod] = None
+        self.values = dict(values or _mock_sim_values)
+        for sim_var in definition.sim_vars:
+            if sim_var.field not in self.values:
+                self.values[sim_var.field] = (
+                    b"" if sim_var.data_type == SimVarType.string256 else 0.0
+                )
+
+    def request(self, timeout: float = 1.0) -> Dict[str, Any]:
+        self.round_trips += 1
+        if self._latency:
+            time.sleep(self._latency)
+        return self._definition.decode(self._definition.encode(self.values))
+
+    def subscribe(self, period: SimVarPeriod):
+        self._subscription_period = period
+
+    def receive(self, timeout: float = 1.0) -> Dict[str, Any]:
+        # pushed by the simulator, no request involved
+        return self._definition.decode(self._definition.encode(self.values))
+
+    def exit(self):
+        self.quit = 1
+
+
+class FakeWindow(NamedTuple):
+    process_id: int
+    title: str
+    rectangle: WindowRectangle  # outer bounds
+    border: int = 8  # width of decorations around the client area
+
+
+class FakeWindowBackend(WindowBackend):
+    """In-memory stand-in for the Win32 window backend
+
+    Counts the expensive operations, so that the hit/miss behavior of
+    WindowCache can be checked without a desktop.
+    """
+
+    def __init__(self, windows: Optional[Dict[int, FakeWindow]] = None):
+        self.windows: Dict[int, FakeWindow] = dict(windows or {})
+        self.enumerations = 0
+        self.client_rectangle_queries = 0
+
+    def get_window_ids(self, process_id: int) -> List[int]:
+        self.enumerations += 1
+        return [
+            window_id
+            for window_id, window in self.windows.items()
+            if window.process_id == process_id
+        ]
+
+    def get_window_title(self, window_id: int) -> str:
+        return self.windows[window_id].title
+
+    def get_window_process_id(self, window_id: int) -> Optional[int]:
+        window = self.windows.get(window_id)
+        return window.process_id if window else None
+
+    def get_outer_rectangle(self, window_id: int) -> WindowRectangle:
+        return self.windows[window_id].rectangle
+
+    def get_client_rectangle(self, window_id: int) -> WindowRectangle:
+        self.client_rectangle_queries += 1
+        window = self.windows[window_id]
+        left, top, right, bottom = window.rectangle
+        border = window.border
+        return WindowRectangle(
+            left + border, top + border, right - border, bottom - border
+        )
+
+    def move_window(self, window_id: int, rectangle: WindowRectangle):
+        self.windows[window_id] = self.windows[window_id]._replace(rectangle=rectangle)
+
+    def close_window(self, window_id: int):
+        del self.windows[window_id]
+
+
+def create_synthetic_track(
+    path: Path,
+    duration: float = 3600.0,  # s
+    rate: float = 10.0,  # Hz
+    start_time: float = 1632650400.0,  # 2021-09-26 10:00 UTC
+) -> Path:
+    """Write a track circling over the Alps, low and fast, for replays"""
+    track_recorder = TrackRecorder(path)
+    latitude, longitude = 46.5, 8.0
+    speed = 120.0  # m/s
+    turn_rate = math.radians(0.5)  # rad/s
+    for index in range(int(duration * rate)):
+        heading = (index / rate * turn_rate) % (2 * math.pi)
+        track_recorder.add(
+            TelemetrySample(
+                timestamp=start_time + index / rate,
+                latitude=latitude,
+                longitude=longitude,
+                altitude=1500.0 + 300.0 * math.sin(index / rate / 60.0),
+                speed=speed,
+                heading=heading,
+                dest_latitude=None,
+                dest_longitude=None,
+                aircraft_type=None,
+            )
+        )
+        latitude, longitude = destination_point(
+            latitude, longitude, heading, speed / rate
+        )
+    track_recorder.close()
+    return path
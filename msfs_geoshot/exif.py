@@ -0,0 +1,315 @@
+"""
+In-process encoding of Metadata into EXIF and XMP
+
+Produces the same tags exiftool writes in MetadataService.write_data, as bytes
+that can be handed to Pillow when saving an image, so that the image is only
+written once.
+"""
+
+import struct
+from datetime import datetime
+from fractions import Fraction
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple, Union
+from xml.sax.saxutils import escape
+
+from . import __app_name__, __version__
+from .metadata import EXIF_DATE_FORMAT, Metadata, MetadataRecord
+
+EXIF_HEADER = b"Exif\x00\x00"
+XMP_NAMESPACE = b"http://ns.adobe.com/xap/1.0/\x00"
+
+# TIFF field types
+_BYTE = 1
+_ASCII = 2
+_LONG = 4
+_RATIONAL = 5
+_UNDEFINED = 7
+
+# IFD pointer tags
+_EXIF_IFD = 0x8769
+_GPS_IFD = 0x8825
+
+_max_jpeg_segment_size = 0xFFFF - 2
+
+
+class ExifEncodingError(Exception):
+    pass
+
+
+class _Entry(NamedTuple):
+    tag: int
+    field_type: int
+    value_count: int
+    data: bytes
+
+
+def _ascii(value: str) -> Tuple[int, int, bytes]:
+    data = value.encode("utf-8") + b"\x00"
+    return _ASCII, len(data), data
+
+
+def _byte(*values: int) -> Tuple[int, int, bytes]:
+    return _BYTE, len(values), bytes(values)
+
+
+def _rational(*values: float) -> Tuple[int, int, bytes]:
+    data = b""
+    for value in values:
+        # numerator has to fit 32 bits too, e.g. for altitudes above 4294 m
+        max_denominator = max(1, min(1000000, 0xFFFFFFFF // (int(abs(value)) + 1)))
+        fraction = Fraction(abs(value)).limit_denominator(max_denominator)
+        data += struct.pack("<II", fraction.numerator, fraction.denominator)
+    return _RATIONAL, len(values), data
+
+
+def _degrees_to_dms(value: float) -> Tuple[float, float, float]:
+    # rounded up front, so that seconds never round up to 60
+    total_seconds = round(abs(value) * 3600, 4)
+    degrees, remainder = divmod(total_seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return int(degrees), int(minutes), round(seconds, 4)
+
+
+def _dms(value: float) -> Tuple[int, int, bytes]:
+    return _rational(*_degrees_to_dms(value))
+
+
+_MetadataLike = Union[Metadata, MetadataRecord]
+_EntryEncoder = Callable[[_MetadataLike], Optional[Tuple[int, int, bytes]]]
+
+
+def _field(
+    field_name: str, encode: Callable[..., Tuple[int, int, bytes]]
+) -> _EntryEncoder:
+    def encoder(metadata: _MetadataLike) -> Optional[Tuple[int, int, bytes]]:
+        value = getattr(metadata, field_name)
+        return None if value is None else encode(value)
+
+    return encoder
+
+
+def _constant(*encoded: Any) -> _EntryEncoder:
+    return lambda metadata: encoded  # type: ignore
+
+
+# tag, encoder; tags of each IFD in ascending order
+_ifd0_encoders: List[Tuple[int, _EntryEncoder]] = [
+    (0x010E, _field("ImageDescription", _ascii)),
+    (0x010F, _field("Make", _ascii)),
+    (0x0110, _field("Model", _ascii)),
+    (0x0132, _field("AllDates", _ascii)),  # ModifyDate
+]
+
+_exif_ifd_encoders: List[Tuple[int, _EntryEncoder]] = [
+    (0x9000, _constant(_UNDEFINED, 4, b"0232")),  # ExifVersion
+    (0x9003, _field("AllDates", _ascii)),  # DateTimeOriginal
+    (0x9004, _field("AllDates", _ascii)),  # CreateDate
+    (0x9010, _field("OffsetTime", _ascii)),
+    (0x9011, _field("OffsetTimeOriginal", _ascii)),
+    (0x9012, _field("OffsetTimeDigitalized", _ascii)),
+]
+
+_gps_ifd_encoders: List[Tuple[int, _EntryEncoder]] = [
+    (0x0000, _constant(*_byte(2, 3, 0, 0))),  # GPSVersionID
+    (0x0001, _field("GPSLatitudeRef", _ascii)),
+    (0x0002, _field("GPSLatitude", _dms)),
+    (0x0003, _field("GPSLongitudeRef", _ascii)),
+    (0x0004, _field("GPSLongitude", _dms)),
+    (0x0005, _field("GPSAltitudeRef", _byte)),
+    (0x0006, _field("GPSAltitude", _rational)),
+    (0x000C, _field("GPSSpeedRef", _ascii)),
+    (0x000D, _field("GPSSpeed", _rational)),
+    (0x0010, _field("GPSImgDirectionRef", _ascii)),
+    (0x0011, _field("GPSImgDirection", _rational)),
+    (0x0013, _field("GPSDestLatitudeRef", _ascii)),
+    (0x0014, _field("GPSDestLatitude", _dms)),
+    (0x0015, _field("GPSDestLongitudeRef", _ascii)),
+    (0x0016, _field("GPSDestLongitude", _dms)),
+]
+
+
+def _encode_entries(
+    encoders: List[Tuple[int, _EntryEncoder]], metadata: _MetadataLike
+) -> List[_Entry]:
+    entries = []
+    for tag, encoder in encoders:
+        encoded = encoder(metadata)
+        if encoded is not None:
+            entries.append(_Entry(tag, *encoded))
+    return entries
+
+
+def _ifd_size(entries: List[_Entry]) -> int:
+    size = 2 + 12 * len(entries) + 4
+    for entry in entries:
+        if len(entry.data) > 4:
+            size += len(entry.data) + len(entry.data) % 2
+    return size
+
+
+def _encode_ifd(entries: List[_Entry], offset: int) -> bytes:
+    """Encode an IFD located at offset (relative to the TIFF header)"""
+    data_offset = offset + 2 + 12 * len(entries) + 4
+    directory = struct.pack("<H", len(entries))
+    data_area = b""
+    for entry in entries:
+        directory += struct.pack("<HHI", entry.tag, entry.field_type, entry.value_count)
+        if len(entry.data) <= 4:
+            directory += entry.data.ljust(4, b"\x00")
+        else:
+            directory += struct.pack("<I", data_offset + len(data_area))
+            data_area += entry.data
+            if len(entry.data) % 2:
+                data_area += b"\x00"  # values start on word boundaries
+    directory += struct.pack("<I", 0)  # no next IFD
+    return directory + data_area
+
+
+def encode_exif(metadata: _MetadataLike) -> bytes:
+    """Encode metadata as an EXIF block, including the Exif\\0\\0 header"""
+    ifd0_entries = _encode_entries(_ifd0_encoders, metadata)
+    exif_entries = _encode_entries(_exif_ifd_encoders, metadata)
+    gps_entries = _encode_entries(_gps_ifd_encoders, metadata)
+
+    ifd0_offset = 8
+    # pointers are LONG values, so the size is known before their values are
+    ifd0_size = _ifd_size(ifd0_entries) + 2 * 12
+    exif_offset = ifd0_offset + ifd0_size
+    gps_offset = exif_offset + _ifd_size(exif_entries)
+
+    ifd0_entries += [
+        _Entry(_EXIF_IFD, _LONG, 1, struct.pack("<I", exif_offset)),
+        _Entry(_GPS_IFD, _LONG, 1, struct.pack("<I", gps_offset)),
+    ]
+    ifd0_entries.sort(key=lambda entry: entry.tag)
+
+    tiff = (
+        b"II*\x00"
+        + struct.pack("<I", ifd0_offset)
+        + _encode_ifd(ifd0_entries, ifd0_offset)
+        + _encode_ifd(exif_entries, exif_offset)
+        + _encode_ifd(gps_entries, gps_offset)
+    )
+    if len(EXIF_HEADER) + len(tiff) > _max_jpeg_segment_size:
+        raise ExifEncodingError("EXIF data is too long")
+    return EXIF_HEADER + tiff
+
+
+def _xmp_date(metadata: _MetadataLike) -> str:
+    date = datetime.strptime(metadata.AllDates, EXIF_DATE_FORMAT)
+    return date.isoformat() + metadata.OffsetTime
+
+
+def _xmp_coordinate(value: float, positive_ref: str, negative_ref: str) -> str:
+    # XMP GPSCoordinate, "DDD,MM.mmmmmmK"
+    degrees = int(abs(value))
+    minutes = (abs(value) - degrees) * 60
+    return f"{degrees},{minutes:.6f}{positive_ref if value >= 0 else negative_ref}"
+
+
+def _xmp_rational(value: float) -> str:
+    fraction = Fraction(abs(value)).limit_denominator(1000000)
+    return f"{fraction.numerator}/{fraction.denominator}"
+
+
+def _xmp_latitude(value: float) -> str:
+    return _xmp_coordinate(value, "N", "S")
+
+
+def _xmp_longitude(value: float) -> str:
+    return _xmp_coordinate(value, "E", "W")
+
+
+# field, XMP property, formatter of the property's value
+_xmp_properties: List[Tuple[str, str, Callable[[Any], str]]] = [
+    (
+        "Description",
+        "dc:description",
+        lambda value: '<rdf:Alt><rdf:li xml:lang="x-default">'
+        f"{escape(value)}</rdf:li></rdf:Alt>",
+    ),
+    (
+        "Creator",
+        "dc:creator",
+        lambda value: f"<rdf:Seq><rdf:li>{escape(value)}</rdf:li></rdf:Seq>",
+    ),
+    ("Source", "dc:source", escape),
+]
+
+# EXIF tags in their XMP form, dates aside
+_xmp_exif_properties: List[Tuple[str, str, Callable[[Any], str]]] = [
+    ("Make", "tiff:Make", escape),
+    ("Model", "tiff:Model", escape),
+    ("GPSLatitude", "exif:GPSLatitude", _xmp_latitude),
+    ("GPSLongitude", "exif:GPSLongitude", _xmp_longitude),
+    ("GPSAltitudeRef", "exif:GPSAltitudeRef", str),
+    ("GPSAltitude", "exif:GPSAltitude", _xmp_rational),
+    ("GPSSpeedRef", "exif:GPSSpeedRef", str),
+    ("GPSSpeed", "exif:GPSSpeed", _xmp_rational),
+    ("GPSImgDirectionRef", "exif:GPSImgDirectionRef", str),
+    ("GPSImgDirection", "exif:GPSImgDirection", _xmp_rational),
+    ("GPSDestLatitude", "exif:GPSDestLatitude", _xmp_latitude),
+    ("GPSDestLongitude", "exif:GPSDestLongitude", _xmp_longitude),
+]
+
+_xmp_date_properties = [
+    "xmp:CreateDate",
+    "xmp:ModifyDate",
+    "exif:DateTimeOriginal",
+    "photoshop:DateCreated",
+]
+
+
+def _format_xmp_properties(
+    properties: List[Tuple[str, str, Callable[[Any], str]]], metadata: _MetadataLike
+) -> List[str]:
+    formatted = []
+    for field_name, name, format_value in properties:
+        value = getattr(metadata, field_name)
+        if value is not None:
+            formatted.append(f"<{name}>{format_value(value)}</{name}>")
+    return formatted
+
+
+def encode_xmp(metadata: _MetadataLike, include_exif: bool = False) -> bytes:
+    """Encode metadata as an XMP packet
+
+    Args:
+        include_exif: Also include the EXIF tags (date, GPS, camera) in their
+            XMP form, for files that carry no EXIF block such as sidecars
+    """
+    properties = _format_xmp_properties(_xmp_properties, metadata)
+
+    if include_exif:
+        if metadata.AllDates is not None and metadata.OffsetTime is not None:
+            date = _xmp_date(metadata)
+            properties += [f"<{name}>{date}</{name}>" for name in _xmp_date_properties]
+        properties.append("<exif:GPSVersionID>2.3.0.0</exif:GPSVersionID>")
+        properties += _format_xmp_properties(_xmp_exif_properties, metadata)
+
+    body = "\n   ".join(properties)
+    packet = (
+        '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>\n'
+        f'<x:xmpmeta xmlns:x="adobe:ns:meta/" x:xmptk="{__app_name__} {__version__}">\n'
+        ' <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">\n'
+        '  <rdf:Description rdf:about=""\n'
+        '    xmlns:dc="http://purl.org/dc/elements/1.1/"\n'
+        '    xmlns:xmp="http://ns.adobe.com/xap/1.0/"\n'
+        '    xmlns:exif="http://ns.adobe.com/exif/1.0/"\n'
+        '    xmlns:tiff="http://ns.adobe.com/tiff/1.0/"\n'
+        '    xmlns:photoshop="http://ns.adobe.com/photoshop/1.0/">\n'
+        f"   {body}\n"
+        "  </rdf:Description>\n"
+        " </rdf:RDF>\n"
+        "</x:xmpmeta>\n"
+        '<?xpacket end="w"?>'
+    )
+    return packet.encode("utf-8")
+
+
+def jpeg_xmp_segment(xmp: bytes) -> bytes:
+    """Wrap an XMP packet into a JPEG APP1 segment"""
+    length = 2 + len(XMP_NAMESPACE) + len(xmp)
+    if length > _max_jpeg_segment_size + 2:
+        raise ExifEncodingError("XMP data is too long")
+    return b"\xff\xe1" + struct.pack(">H", length) + XMP_NAMESPACE + xmp
@@ -0,0 +1,208 @@
+import queue
+import re
+import subprocess
+import threading
+from typing import List, Optional, Sequence
+
+from . import DEBUG
+
+# Keeps the console window of exiftool.exe hidden, Windows-only
+_creation_flags = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+
+_updated_pattern = re.compile(r"(\d+) image files? (?:updated|unchanged)")
+_failed_pattern = re.compile(r"(\d+) files? weren't updated due to errors")
+
+
+class ExifToolError(Exception):
+    pass
+
+
+class ExifTool:
+    """A long-running exiftool process fed argument blocks over stdin
+
+    Starting exiftool (Perl) costs a few hundred milliseconds, so instead of
+    spawning it per file, a single instance is kept running in -stay_open mode.
+    Each block of arguments is terminated by -execute{N}, after which exiftool
+    prints {readyN} once done, N telling the responses apart. Crashed or hung
+    processes are replaced on the next call.
+    """
+
+    def __init__(
+        self,
+        command: Sequence[str],
+        common_arguments: Sequence[str] = (),
+        timeout: float = 30.0,  # s
+    ):
+        """
+        Args:
+            command: exiftool executable (and interpreter, if any)
+            common_arguments: Arguments applied to every block
+        """
+        self._command = list(command)
+        self._common_arguments = list(common_arguments)
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._process: Optional[subprocess.Popen] = None
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._execution_id = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def execute(self, arguments: Sequence[str]) -> str:
+        """Run one block of arguments
+
+        Returns:
+            Combined stdout and stderr output of the block
+
+        Raises:
+            ExifToolError: If exiftool could not be run or did not respond
+        """
+        return self.execute_many([arguments])[0]
+
+    def execute_many(self, blocks: Sequence[Sequence[str]]) -> List[str]:
+        """Run several blocks of arguments in one go
+
+        All blocks are sent before the first response is read, so exiftool
+        works through them without waiting for us in between.
+
+        Returns:
+            Output of each block, in order
+        """
+        with self._lock:
+            try:
+                return self._execute_many(blocks)
+            except ExifToolError as e:
+                if DEBUG:
+                    print(f"{e}, restarting exiftool")
+                self._terminate()
+            # retry once with a fresh process, in case the old one had crashed
+            try:
+                return self._execute_many(blocks)
+            except ExifToolError:
+                self._terminate()
+                raise
+
+    def write(self, arguments: Sequence[str]) -> bool:
+        """Run a block of arguments writing to a single file
+
+        Returns:
+            Whether the file was written without errors
+        """
+        return self.write_many([arguments])[0]
+
+    def write_many(self, blocks: Sequence[Sequence[str]]) -> List[bool]:
+        """Run blocks of arguments writing to a single file each
+
+        Returns:
+            Whether each file was written without errors
+        """
+        outputs = self.execute_many(blocks)
+        if DEBUG:
+            for output in outputs:
+                print(output)
+        return [is_write_successful(output) for output in outputs]
+
+    def close(self):
+        with self._lock:
+            process = self._process
+            if not process:
+                return
+            try:
+                if process.poll() is None and process.stdin:
+                    process.stdin.write("-stay_open\nFalse\n")
+                    process.stdin.flush()
+                    process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+            self._terminate()
+
+    def _execute_many(self, blocks: Sequence[Sequence[str]]) -> List[str]:
+        process = self._start()
+
+        execution_ids = []
+        data = ""
+        for arguments in blocks:
+            self._execution_id += 1
+            execution_ids.append(self._execution_id)
+            lines = self._common_arguments + list(arguments)
+            if any("\n" in argument for argument in lines):
+                raise ValueError("Arguments must not contain line breaks")
+            data += "\n".join(lines + [f"-execute{self._execution_id}"]) + "\n"
+
+        try:
+            assert process.stdin
+            process.stdin.write(data)
+            process.stdin.flush()
+        except OSError as e:
+            raise ExifToolError(f"Could not send arguments to exiftool: {e}")
+
+        return [self._read_output(execution_id) for execution_id in execution_ids]
+
+    def _read_output(self, execution_id: int) -> str:
+        ready_marker = f"{{ready{execution_id}}}"
+        output: List[str] = []
+        while True:
+            try:
+                line = self._lines.get(timeout=self._timeout)
+            except queue.Empty:
+                raise ExifToolError("exiftool did not respond in time")
+            if line is None:
+                raise ExifToolError("exiftool exited unexpectedly")
+            if line.rstrip() == ready_marker:
+                return "".join(output)
+            output.append(line)
+
+    def _start(self) -> subprocess.Popen:
+        if self._process and self._process.poll() is None:
+            return self._process
+        self._terminate()
+
+        try:
+            process = subprocess.Popen(
+                self._command + ["-stay_open", "True", "-@", "-"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+                creationflags=_creation_flags,
+            )
+        except OSError as e:
+            raise ExifToolError(f"Could not start exiftool: {e}")
+
+        lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        threading.Thread(
+            target=_read_lines, args=(process, lines), name="ExifTool", daemon=True
+        ).start()
+        self._process = process
+        self._lines = lines
+        return process
+
+    def _terminate(self):
+        process = self._process
+        self._process = None
+        if not process:
+            return
+        if process.poll() is None:
+            process.kill()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+
+
+def _read_lines(process: subprocess.Popen, lines: "queue.Queue[Optional[str]]"):
+    assert process.stdout
+    for line in process.stdout:
+        lines.put(line)
+    lines.put(None)  # end of output, the process has exited
+
+
+def is_write_successful(output: str) -> bool:
+    """Whether exiftool's summary for a block reports all files as written"""
+    if any(int(count) for count in _failed_pattern.findall(output)):
+        return False
+    return any(int(count) for count in _updated_pattern.findall(output))
@@ -0,0 +1,233 @@
+"""
+Export of the positions of a folder of screenshots to GeoJSON and KML
+
+Tags are read from the image headers (or XMP sidecars) in worker processes,
+never from the pixel data, and written out as they come in. Images are
+ordered by date in runs sorted in memory, which are spilled to temporary
+files and merged, so memory use does not grow with the size of the folder.
+Properties are named after the Metadata fields the tags were written from.
+"""
+
+import heapq
+import json
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from tempfile import TemporaryFile
+from typing import IO, Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from .catalog import ImageTags, find_images, map_images, read_image_tags
+from .metadata import EXIF_DATE_FORMAT
+
+# images sorted in memory at a time
+_sort_run_size = 10000
+_photo_width = 400  # px, in KML balloons
+
+
+class ExportResult(NamedTuple):
+    exported: int
+    without_position: int
+
+
+_Record = Tuple[str, ImageTags]
+
+
+def export_folder(
+    folder: Path,
+    geojson_path: Optional[Path] = None,
+    kml_path: Optional[Path] = None,
+    recursive: bool = False,
+    max_workers: Optional[int] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> ExportResult:
+    """Write the geotagged images in folder to GeoJSON and/or KML, by date
+
+    Args:
+        max_workers: Number of processes reading images, defaults to the
+            number of CPUs
+        on_progress: Called with the number of images read and to read
+    """
+    paths = sorted(path for path, _ in find_images(str(folder), recursive=recursive))
+    counts = {"without_position": 0}
+
+    def read_positioned() -> Iterator[_Record]:
+        for index, (path, tags) in enumerate(
+            zip(paths, map_images(read_image_tags, paths, max_workers)), start=1
+        ):
+            if on_progress and (index % 1000 == 0 or index == len(paths)):
+                on_progress(index, len(paths))
+            if tags.GPSLatitude is None or tags.GPSLongitude is None:
+                counts["without_position"] += 1
+                continue
+            yield path, tags
+
+    writers: List[_Writer] = []
+    try:
+        if geojson_path:
+            writers.append(_GeoJsonWriter(geojson_path))
+        if kml_path:
+            writers.append(_KmlWriter(kml_path, title=folder.resolve().name))
+        exported = 0
+        for path, tags in _sorted_by_date(read_positioned()):
+            for writer in writers:
+                writer.add(path, tags)
+            exported += 1
+    finally:
+        for writer in writers:
+            writer.close()
+
+    return ExportResult(exported, counts["without_position"])
+
+
+def _date_key(record: _Record) -> Tuple[bool, str, str]:
+    # "YYYY:mm:dd HH:MM:SS" sorts like the dates, images without one last
+    path, tags = record
+    return tags.AllDates is None, tags.AllDates or "", path
+
+
+def _sorted_by_date(records: Iterable[_Record]) -> Iterator[_Record]:
+    runs: List[IO[str]] = []
+    run: List[_Record] = []
+    try:
+        for record in records:
+            run.append(record)
+            if len(run) >= _sort_run_size:
+                runs.append(_spill(run))
+                run = []
+        run.sort(key=_date_key)
+        if not runs:
+            yield from run
+            return
+        yield from heapq.merge(
+            iter(run), *(_load(run_file) for run_file in runs), key=_date_key
+        )
+    finally:
+        for run_file in runs:
+            run_file.close()
+
+
+def _spill(run: List[_Record]) -> IO[str]:
+    run_file = TemporaryFile("w+", encoding="utf-8")
+    run.sort(key=_date_key)
+    run_file.writelines(f"{json.dumps([path, *tags])}\n" for path, tags in run)
+    run_file.seek(0)
+    return run_file
+
+
+def _load(run_file: IO[str]) -> Iterator[_Record]:
+    for line in run_file:
+        path, *values = json.loads(line)
+        yield path, ImageTags(*values)
+
+
+class _Writer(ABC):
+    @abstractmethod
+    def add(self, path: str, tags: ImageTags):
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+
+class _GeoJsonWriter(_Writer):
+    """Streams a FeatureCollection of points, one feature per line"""
+
+    def __init__(self, path: Path):
+        self._file = path.open("w", encoding="utf-8")
+        self._file.write('{"type": "FeatureCollection", "features": [\n')
+        self._separator = ""
+
+    def add(self, path: str, tags: ImageTags):
+        coordinates = [tags.GPSLongitude, tags.GPSLatitude]
+        if tags.GPSAltitude is not None:
+            coordinates.append(tags.GPSAltitude)
+        # SourceFile like in exiftool's JSON output
+        properties = {"SourceFile": path}
+        properties.update(
+            (name, value) for name, value in tags._asdict().items() if value is not None
+        )
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": coordinates},
+            "properties": properties,
+        }
+        self._file.write(self._separator)
+        self._file.write(json.dumps(feature, ensure_ascii=False))
+        self._separator = ",\n"
+
+    def close(self):
+        self._file.write("\n]}\n")
+        self._file.close()
+
+
+class _KmlWriter(_Writer):
+    """Streams a Document of photo placemarks showing the image in their
+    balloon, pointing in the direction the image was taken"""
+
+    def __init__(self, path: Path, title: str):
+        self._file = path.open("w", encoding="utf-8")
+        self._file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+            f"<Document><name>{escape(title)}</name>\n"
+        )
+
+    def add(self, path: str, tags: ImageTags):
+        balloon = (
+            f'<img src="{escape(Path(os.path.abspath(path)).as_uri())}" '
+            f'width="{_photo_width}"/>'
+        )
+        if tags.ImageDescription:
+            balloon += f"<br/>{escape(tags.ImageDescription)}"
+        parts = [
+            f"<Placemark><name>{escape(os.path.basename(path))}</name>",
+            f"<description>{escape(balloon)}</description>",
+        ]
+        when = _kml_time(tags)
+        if when:
+            parts.append(f"<TimeStamp><when>{when}</when></TimeStamp>")
+        if tags.GPSImgDirection is not None:
+            parts.append(
+                "<Style><IconStyle>"
+                f"<heading>{tags.GPSImgDirection:.1f}</heading>"
+                "</IconStyle></Style>"
+            )
+        parts.append("<ExtendedData>")
+        parts.extend(
+            f'<Data name="{name}"><value>{escape(str(value))}</value></Data>'
+            for name, value in tags._asdict().items()
+            if value is not None
+        )
+        parts.append("</ExtendedData>")
+        if tags.GPSAltitude is not None:
+            parts.append(
+                "<Point><altitudeMode>absolute</altitudeMode><coordinates>"
+                f"{tags.GPSLongitude:.6f},{tags.GPSLatitude:.6f},{tags.GPSAltitude:.1f}"
+                "</coordinates></Point>"
+            )
+        else:
+            parts.append(
+                "<Point><coordinates>"
+                f"{tags.GPSLongitude:.6f},{tags.GPSLatitude:.6f}"
+                "</coordinates></Point>"
+            )
+        parts.append("</Placemark>\n")
+        self._file.write("".join(parts))
+
+    def close(self):
+        self._file.write("</Document>\n</kml>\n")
+        self._file.close()
+
+
+def _kml_time(tags: ImageTags) -> Optional[str]:
+    # local time with its offset, as written to the image
+    if not tags.AllDates:
+        return None
+    try:
+        date = datetime.strptime(tags.AllDates, EXIF_DATE_FORMAT)
+    except ValueError:
+        return None
+    return date.isoformat() + (tags.OffsetTime or "")
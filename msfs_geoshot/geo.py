@@ -0,0 +1,70 @@
+import math
+from typing import Tuple
+
+EARTH_RADIUS = 6371008.8  # m, mean radius
+
+
+def haversine_distance(
+    latitude_a: float, longitude_a: float, latitude_b: float, longitude_b: float
+) -> float:
+    """Great-circle distance in m between two points given in degrees"""
+    phi_a = math.radians(latitude_a)
+    phi_b = math.radians(latitude_b)
+    delta_phi = phi_b - phi_a
+    delta_lambda = math.radians(longitude_b - longitude_a)
+    a = (
+        math.sin(delta_phi / 2) ** 2
+        + math.cos(phi_a) * math.cos(phi_b) * math.sin(delta_lambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def destination_point(
+    latitude: float, longitude: float, bearing: float, distance: float
+) -> Tuple[float, float]:
+    """Point reached from a start point in degrees when travelling along a
+    great circle with initial bearing (radians) for distance (m)"""
+    phi = math.radians(latitude)
+    lambda_ = math.radians(longitude)
+    delta = distance / EARTH_RADIUS
+
+    sin_phi_2 = math.sin(phi) * math.cos(delta) + math.cos(phi) * math.sin(
+        delta
+    ) * math.cos(bearing)
+    phi_2 = math.asin(max(-1.0, min(1.0, sin_phi_2)))
+    lambda_2 = lambda_ + math.atan2(
+        math.sin(bearing) * math.sin(delta) * math.cos(phi),
+        math.cos(delta) - math.sin(phi) * sin_phi_2,
+    )
+    return math.degrees(phi_2), normalize_longitude(math.degrees(lambda_2))
+
+
+def initial_bearing(
+    latitude_a: float, longitude_a: float, latitude_b: float, longitude_b: float
+) -> float:
+    """Bearing (radians) to set out on from point a to follow the great circle
+    to point b, both given in degrees"""
+    phi_a = math.radians(latitude_a)
+    phi_b = math.radians(latitude_b)
+    delta_lambda = math.radians(longitude_b - longitude_a)
+    return math.atan2(
+        math.sin(delta_lambda) * math.cos(phi_b),
+        math.cos(phi_a) * math.sin(phi_b)
+        - math.sin(phi_a) * math.cos(phi_b) * math.cos(delta_lambda),
+    ) % (2 * math.pi)
+
+
+def normalize_longitude(longitude: float) -> float:
+    return (longitude + 180.0) % 360.0 - 180.0
+
+
+def interpolate_longitude(longitude_a: float, longitude_b: float, t: float) -> float:
+    """Linear interpolation taking the shorter way across the antimeridian"""
+    delta = normalize_longitude(longitude_b - longitude_a)
+    return normalize_longitude(longitude_a + delta * t)
+
+
+def interpolate_angle(angle_a: float, angle_b: float, t: float) -> float:
+    """Linear interpolation of angles in radians along the shorter arc"""
+    delta = (angle_b - angle_a + math.pi) % (2 * math.pi) - math.pi
+    return (angle_a + delta * t) % (2 * math.pi)
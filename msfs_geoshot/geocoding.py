@@ -0,0 +1,605 @@
+"""
+Reverse geocoding of positions into "Country-State-City" location strings
+
+The offline geocoder answers from a bundled index of places (built from
+GeoNames with tools/build_place_index.py) without any network access. The
+index is memory-mapped, so opening it is instant and only the pages around
+the queried positions are ever read from disk. Places are sorted by the grid
+cell they lie in, so the candidates around a position are a few contiguous
+slices of the coordinate arrays.
+
+Nominatim is used instead when the index is not available. Its results are
+cached per cell of a grid, in memory and in a database, as consecutive
+screenshots are mostly taken within a few km of each other.
+"""
+
+import math
+import mmap
+import sqlite3
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from numpy.typing import DTypeLike
+
+from . import RESOURCES_PATH
+from .geo import EARTH_RADIUS
+
+PLACE_INDEX_PATH = RESOURCES_PATH / "places.bin"
+GEOCODE_CACHE_FILE_NAME = "geocodes.sqlite"
+
+# magic, place count, region count, grid rows, grid columns, cell size (deg),
+# size of the string data
+_header = struct.Struct("<8sIIIIdQ")
+_magic = b"GSPLACE1"
+_alignment = 8
+
+
+class GeocoderError(Exception):
+    """The lookup itself failed, e.g. because the network is down"""
+
+
+class NetworkRequiredError(GeocoderError):
+    """The lookup needs a network request, which was not allowed"""
+
+
+class Geocoder(ABC):
+    @abstractmethod
+    def reverse(
+        self, latitude: float, longitude: float, offline_only: bool = False
+    ) -> Optional[str]:
+        """Location string like "Country-State-City", None if there is no
+        place at the position, e.g. over the ocean
+
+        Args:
+            offline_only: Fail rather than wait for a network request
+
+        Raises:
+            NetworkRequiredError: if offline_only and the location is not
+                known without a network request
+            GeocoderError: if the lookup failed
+        """
+
+
+class Place(NamedTuple):
+    name: str
+    region: str  # "Country-State", or "Country"
+    latitude: float
+    longitude: float
+    distance: float  # m from the queried position
+
+
+class OfflineGeocoder(Geocoder):
+    """Names the nearest place in a place index within max_distance"""
+
+    def __init__(self, path: Path = PLACE_INDEX_PATH, max_distance: float = 50000.0):
+        self._max_distance = max_distance  # m
+        try:
+            with path.open("rb") as index_file:
+                self._buffer = mmap.mmap(
+                    index_file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+        except (OSError, ValueError) as e:
+            raise GeocoderError(f"Could not open place index {path}: {e}")
+
+        try:
+            (
+                magic,
+                place_count,
+                region_count,
+                self._rows,
+                self._columns,
+                self._cell_size,
+                string_size,
+            ) = _header.unpack_from(self._buffer)
+        except struct.error:
+            magic = None
+        if magic != _magic:
+            self._buffer.close()
+            raise GeocoderError(f"{path} is not a place index")
+
+        sections = _Sections(self._buffer, _header.size)
+        self._cell_starts = sections.take(np.uint32, self._rows * self._columns + 1)
+        self._latitudes = sections.take(np.float32, place_count)
+        self._longitudes = sections.take(np.float32, place_count)
+        self._region_ids = sections.take(np.uint32, place_count)
+        self._name_offsets = sections.take(np.uint32, place_count + 1)
+        self._region_offsets = sections.take(np.uint32, region_count + 1)
+        self._strings = sections.take(np.uint8, string_size)
+
+    def __len__(self) -> int:
+        return len(self._latitudes)
+
+    def reverse(
+        self, latitude: float, longitude: float, offline_only: bool = False
+    ) -> Optional[str]:
+        place = self.nearest_place(latitude, longitude)
+        if not place:
+            return None
+        return f"{place.region}-{place.name}".replace(" ", "_")
+
+    def nearest_place(self, latitude: float, longitude: float) -> Optional[Place]:
+        indices = self._get_candidates(latitude, longitude)
+        if not len(indices):
+            return None
+
+        phi = math.radians(latitude)
+        candidate_phis = np.radians(self._latitudes[indices].astype(np.float64))
+        delta_lambdas = np.radians(
+            self._longitudes[indices].astype(np.float64) - longitude
+        )
+        a = (
+            np.sin((candidate_phis - phi) / 2) ** 2
+            + math.cos(phi) * np.cos(candidate_phis) * np.sin(delta_lambdas / 2) ** 2
+        )
+        distances = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        nearest = int(np.argmin(distances))
+        if distances[nearest] > self._max_distance:
+            return None
+
+        index = int(indices[nearest])
+        region_id = int(self._region_ids[index])
+        return Place(
+            name=self._get_string(self._name_offsets, index),
+            region=self._get_string(self._region_offsets, region_id),
+            latitude=float(self._latitudes[index]),
+            longitude=float(self._longitudes[index]),
+            distance=float(distances[nearest]),
+        )
+
+    def close(self):
+        # arrays are views of the buffer, so they have to go first
+        del self._cell_starts, self._latitudes, self._longitudes, self._region_ids
+        del self._name_offsets, self._region_offsets, self._strings
+        self._buffer.close()
+
+    def _get_candidates(self, latitude: float, longitude: float) -> np.ndarray:
+        """Indices of the places in the cells within max_distance"""
+        delta_latitude = math.degrees(self._max_distance / EARTH_RADIUS)
+        first_row = max(0, int((latitude - delta_latitude + 90) // self._cell_size))
+        last_row = min(
+            self._rows - 1, int((latitude + delta_latitude + 90) // self._cell_size)
+        )
+
+        # widest at the edge closest to a pole
+        cos_latitude = math.cos(math.radians(min(90.0, abs(latitude) + delta_latitude)))
+        if cos_latitude * 180.0 <= delta_latitude:
+            column_ranges = [(0, self._columns - 1)]
+        else:
+            delta_longitude = delta_latitude / cos_latitude
+            first_column = int((longitude - delta_longitude + 180) // self._cell_size)
+            last_column = int((longitude + delta_longitude + 180) // self._cell_size)
+            column_ranges = _wrap_column_range(first_column, last_column, self._columns)
+
+        starts = self._cell_starts
+        slices = [
+            np.arange(
+                starts[row * self._columns + first],
+                starts[row * self._columns + last + 1],
+            )
+            for row in range(first_row, last_row + 1)
+            for first, last in column_ranges
+        ]
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+    def _get_string(self, offsets: np.ndarray, index: int) -> str:
+        start, end = int(offsets[index]), int(offsets[index + 1])
+        return self._strings[start:end].tobytes().decode("utf-8")
+
+
+def _wrap_column_range(first: int, last: int, columns: int) -> List[Tuple[int, int]]:
+    if last - first + 1 >= columns:
+        return [(0, columns - 1)]
+    first %= columns
+    last %= columns
+    if first <= last:
+        return [(first, last)]
+    # crosses the antimeridian
+    return [(first, columns - 1), (0, last)]
+
+
+class _Sections:
+    """Reads consecutive aligned arrays from a buffer without copying"""
+
+    def __init__(self, buffer: mmap.mmap, offset: int):
+        self._buffer = buffer
+        self._offset = offset
+
+    def take(self, dtype: DTypeLike, count: int) -> np.ndarray:
+        offset = -(-self._offset // _alignment) * _alignment
+        array: np.ndarray = np.frombuffer(
+            self._buffer, dtype=dtype, count=count, offset=offset
+        )
+        self._offset = offset + array.nbytes
+        return array
+
+
+def write_place_index(
+    path: Path,
+    places: Iterable[Tuple[float, float, str, str]],
+    cell_size: float = 1.0,
+):
+    """Pack places into an index file for OfflineGeocoder
+
+    Args:
+        places: Latitude, longitude, name and region ("Country-State") of
+            each place
+        cell_size: Of the grid the places are bucketed in, degrees
+    """
+    rows = math.ceil(180 / cell_size)
+    columns = math.ceil(360 / cell_size)
+
+    region_ids: Dict[str, int] = {}
+    cells: List[int] = []
+    latitudes: List[float] = []
+    longitudes: List[float] = []
+    place_regions: List[int] = []
+    names: List[bytes] = []
+    for latitude, longitude, name, region in places:
+        row = min(rows - 1, int((latitude + 90) // cell_size))
+        column = int(((longitude + 180) % 360) // cell_size)
+        cells.append(row * columns + column)
+        latitudes.append(latitude)
+        longitudes.append(longitude)
+        place_regions.append(region_ids.setdefault(region, len(region_ids)))
+        names.append(name.encode("utf-8"))
+
+    order = np.argsort(np.array(cells, dtype=np.int64), kind="stable")
+    sorted_cells = np.array(cells, dtype=np.int64)[order]
+    cell_starts = np.searchsorted(
+        sorted_cells, np.arange(rows * columns + 1), side="left"
+    ).astype(np.uint32)
+
+    sorted_names = [names[index] for index in order.tolist()]
+    region_names = [region.encode("utf-8") for region in region_ids]
+    name_data = b"".join(sorted_names)
+    name_offsets = np.concatenate(
+        ([0], np.cumsum([len(name) for name in sorted_names], dtype=np.int64))
+    ).astype(np.uint32)
+    region_offsets = (
+        np.concatenate(
+            ([0], np.cumsum([len(region) for region in region_names], dtype=np.int64))
+        )
+        + len(name_data)
+    ).astype(np.uint32)
+    strings = name_data + b"".join(region_names)
+
+    arrays: List[np.ndarray] = [
+        cell_starts,
+        np.array(latitudes, dtype=np.float32)[order],
+        np.array(longitudes, dtype=np.float32)[order],
+        np.array(place_regions, dtype=np.uint32)[order],
+        name_offsets,
+        region_offsets,
+        np.frombuffer(strings, dtype=np.uint8),
+    ]
+    with path.open("wb") as index_file:
+        index_file.write(
+            _header.pack(
+                _magic,
+                len(order),
+                len(region_names),
+                rows,
+                columns,
+                cell_size,
+                len(strings),
+            )
+        )
+        offset = _header.size
+        for array in arrays:
+            padding = -offset % _alignment
+            index_file.write(b"\0" * padding)
+            index_file.write(array.tobytes())
+            offset += padding + array.nbytes
+
+
+class TokenBucket:
+    """Allows rate acquisitions per second on average, capacity at once"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Take a token, waiting up to timeout s (forever if None) for one"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._capacity, self._tokens + (now - self._updated) * self._rate
+                )
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return True
+                wait = (1.0 - self._tokens) / self._rate
+            if deadline is not None:
+                if now + wait > deadline:
+                    return False
+            time.sleep(wait)
+
+
+class GeocodeCacheStats(NamedTuple):
+    hits: int  # including negative hits
+    negative_hits: int  # cached "no place" or failure
+    misses: int  # looked up with the wrapped geocoder
+    coalesced: int  # waited for the lookup of another thread in the same cell
+    evictions: int  # from memory
+    size: int  # entries in memory
+
+
+_cache_schema = """
+CREATE TABLE IF NOT EXISTS geocodes (
+    cell_size REAL NOT NULL,
+    cell_row INTEGER NOT NULL,
+    cell_column INTEGER NOT NULL,
+    location TEXT,
+    expires REAL,
+    PRIMARY KEY (cell_size, cell_row, cell_column)
+);
+"""
+
+
+class _CacheValue(NamedTuple):
+    location: Optional[str]  # None for no place
+    expires: Optional[float]  # time.time(), None for never
+    error: Optional[str] = None  # of a failed lookup
+
+
+class _Flight:
+    """A lookup in progress, which others in the same cell wait for"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.location: Optional[str] = None
+        self.error: Optional[GeocoderError] = None
+
+
+class CachedGeocoder(Geocoder):
+    """Caches the results of another geocoder per cell of a lat/lon grid
+
+    Least recently used cells are evicted from memory past max_entries. With
+    a path, results are also kept in a database, so they outlive the app.
+    Positions without a place, e.g. over the ocean, are cached for
+    negative_ttl. Failed lookups are cached for failure_ttl and in memory
+    only, they fail again without waiting out an outage on every screenshot.
+
+    Methods may be called from any thread. Lookups of the wrapped geocoder
+    run outside the lock, concurrent ones in the same cell collapse into a
+    single lookup whose result all callers get.
+    """
+
+    def __init__(
+        self,
+        geocoder: Geocoder,
+        path: Optional[Path] = None,
+        cell_size: float = 0.02,  # deg, about 2 km
+        max_entries: int = 4096,
+        negative_ttl: float = 7 * 24 * 3600.0,  # s
+        failure_ttl: float = 300.0,  # s
+    ):
+        self._geocoder = geocoder
+        self._cell_size = cell_size
+        self._max_entries = max_entries
+        self._negative_ttl = negative_ttl
+        self._failure_ttl = failure_ttl
+        self._entries: "OrderedDict[Tuple[int, int], _CacheValue]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+        self._flights: Dict[Tuple[int, int], _Flight] = {}
+
+        self._connection: Optional[sqlite3.Connection] = None
+        if path:
+            try:
+                self._connection = sqlite3.connect(
+                    str(path), check_same_thread=False, isolation_level=None
+                )
+                self._connection.executescript(_cache_schema)
+                self._connection.execute(
+                    "DELETE FROM geocodes WHERE expires < ?", (time.time(),)
+                )
+            except sqlite3.Error as e:
+                print(f"Could not open geocode cache {path}: {e}")
+                self._connection = None
+
+    @property
+    def cell_size(self) -> float:
+        return self._cell_size
+
+    @property
+    def stats(self) -> GeocodeCacheStats:
+        with self._lock:
+            return GeocodeCacheStats(
+                hits=self._hits,
+                negative_hits=self._negative_hits,
+                misses=self._misses,
+                coalesced=self._coalesced,
+                evictions=self._evictions,
+                size=len(self._entries),
+            )
+
+    def is_cached(self, latitude: float, longitude: float) -> bool:
+        """Whether the result for the cell of a position is cached, a failure
+        included, without counting as a hit or miss"""
+        cell = self.cell(latitude, longitude)
+        with self._lock:
+            return cell in self._flights or self._get(cell) is not None
+
+    def cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        """Row and column of the grid cell of a position"""
+        return (
+            math.floor(latitude / self._cell_size),
+            math.floor(((longitude + 180.0) % 360.0 - 180.0) / self._cell_size),
+        )
+
+    def reverse(
+        self, latitude: float, longitude: float, offline_only: bool = False
+    ) -> Optional[str]:
+        cell = self.cell(latitude, longitude)
+        owns_flight = False
+        with self._lock:
+            value = self._get(cell)
+            if value is not None:
+                self._hits += 1
+                if value.location is None:
+                    self._negative_hits += 1
+                if value.error is not None:
+                    raise GeocoderError(value.error)
+                return value.location
+
+            flight = self._flights.get(cell)
+            if flight is not None:
+                if offline_only:
+                    raise NetworkRequiredError("Lookup in progress")
+                self._coalesced += 1
+            elif not offline_only:
+                # offline lookups are not shared, they may end with
+                # NetworkRequiredError
+                self._flights[cell] = _Flight()
+                owns_flight = True
+
+        if flight is not None:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.location
+
+        try:
+            location = self._look_up(cell, offline_only)
+        except GeocoderError as e:
+            if owns_flight:
+                self._land(cell, None, e)
+            raise
+        if owns_flight:
+            self._land(cell, location, None)
+        return location
+
+    def _look_up(self, cell: Tuple[int, int], offline_only: bool) -> Optional[str]:
+        # positions within a cell share its result, so look up its center
+        center_latitude = (cell[0] + 0.5) * self._cell_size
+        center_longitude = (cell[1] + 0.5) * self._cell_size
+        try:
+            location = self._geocoder.reverse(
+                center_latitude, center_longitude, offline_only=offline_only
+            )
+        except NetworkRequiredError:
+            raise
+        except GeocoderError as e:
+            with self._lock:
+                self._misses += 1
+                self._put(
+                    cell, _CacheValue(None, time.time() + self._failure_ttl, str(e))
+                )
+            raise
+
+        value = _CacheValue(
+            location, None if location else time.time() + self._negative_ttl
+        )
+        with self._lock:
+            self._misses += 1
+            self._put(cell, value)
+            self._store(cell, value)
+        return location
+
+    def _land(
+        self,
+        cell: Tuple[int, int],
+        location: Optional[str],
+        error: Optional[GeocoderError],
+    ):
+        """Hand the result of a lookup to those waiting for it"""
+        with self._lock:
+            flight = self._flights.pop(cell, None)
+        if flight is not None:
+            flight.location = location
+            flight.error = error
+            flight.done.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._connection:
+                try:
+                    self._connection.execute(
+                        "DELETE FROM geocodes WHERE cell_size = ?", (self._cell_size,)
+                    )
+                except sqlite3.Error as e:
+                    print(f"Could not clear geocode cache: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._connection:
+                self._connection.close()
+                self._connection = None
+
+    def _get(self, cell: Tuple[int, int]) -> Optional[_CacheValue]:
+        value = self._entries.get(cell)
+        if value is None:
+            value = self._load(cell)
+            if value is None:
+                return None
+            self._put(cell, value)
+        if value.expires is not None and value.expires <= time.time():
+            del self._entries[cell]
+            return None
+        self._entries.move_to_end(cell)
+        return value
+
+    def _put(self, cell: Tuple[int, int], value: _CacheValue):
+        self._entries[cell] = value
+        self._entries.move_to_end(cell)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def _load(self, cell: Tuple[int, int]) -> Optional[_CacheValue]:
+        if not self._connection:
+            return None
+        try:
+            row = self._connection.execute(
+                "SELECT location, expires FROM geocodes"
+                " WHERE cell_size = ? AND cell_row = ? AND cell_column = ?",
+                (self._cell_size, *cell),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Could not read geocode cache: {e}")
+            return None
+        return _CacheValue(*row) if row else None
+
+    def _store(self, cell: Tuple[int, int], value: _CacheValue):
+        if not self._connection:
+            return
+        try:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?, ?)",
+                (self._cell_size, *cell, value.location, value.expires),
+            )
+        except sqlite3.Error as e:
+            print(f"Could not write geocode cache: {e}")
+
+
+def get_default_geocoder(cache_path: Optional[Path] = None) -> Geocoder:
+    """The offline geocoder if the place index is installed, else Nominatim
+    with its results cached, in the database at cache_path if given"""
+    if PLACE_INDEX_PATH.is_file():
+        try:
+            return OfflineGeocoder()
+        except GeocoderError as e:
+            print(e)
+    # imported here, as geopy is only needed without the offline index
+    from .nominatim import NominatimGeocoder
+
+    return CachedGeocoder(NominatimGeocoder(), path=cache_path)
@@ -0,0 +1,341 @@
+"""
+Retroactive geotagging of screenshots from a recorded flight track
+
+Screenshots taken with other tools (the simulator's own capture, the Xbox Game
+Bar, OBS, ...) carry no position. They are matched to a track recorded with
+GeoShot by their capture time, read from their EXIF data, file name or
+modification time, in that order of preference.
+
+The clock the images were timestamped with may be off from the one the track
+was recorded with, e.g. by a timezone. The offset is estimated from images
+that are already geotagged, or else chosen so that the track covers as many
+images as possible.
+
+Progress is kept in a journal in the folder, so that an interrupted run picks
+up where it stopped.
+"""
+
+import math
+import os
+import threading
+from pathlib import Path
+from typing import (
+    Callable,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    TextIO,
+    Tuple,
+)
+
+import numpy as np
+
+from . import DEBUG
+from .catalog import FileSignature, find_images, read_images
+from .geo import EARTH_RADIUS
+from .metadata import MetadataService, sample_to_metadata
+from .time import parse_file_name_time
+from .telemetry import TelemetryError
+from .tracks import Track, TrackFileError, load_track, sample_track
+
+JOURNAL_FILE_NAME = ".geoshot-geotag.journal"
+
+# UTC offsets range from -12 to +14 h, in steps of at least 15 min
+_max_clock_offset = 14 * 3600  # s
+_clock_offset_step = 15 * 60  # s
+# already geotagged images farther from the track do not tell the offset
+_max_anchor_distance = 500.0  # m
+
+
+class GeotagError(Exception):
+    pass
+
+
+class GeotagImage(NamedTuple):
+    path: str
+    image_time: float  # s since epoch, by the clock the image was taken with
+    latitude: Optional[float]  # if already geotagged
+    longitude: Optional[float]
+
+
+class ClockOffset(NamedTuple):
+    seconds: float  # added to image times to get track times
+    anchor_count: int  # geotagged images the offset was derived from
+    covered_count: int  # images the track covers with the offset
+
+
+class GeotagResult(NamedTuple):
+    tagged: int
+    already_tagged: int
+    outside_track: int
+    failed: int
+    resumed: int  # done by an interrupted earlier run
+
+
+def read_geotag_images(
+    files: Sequence[Tuple[str, FileSignature]], max_workers: Optional[int] = None
+) -> Iterator[GeotagImage]:
+    """Read the capture times of images as found by find_images()"""
+    for entry in read_images(files, max_workers):
+        image_time = entry.capture_time
+        if image_time is None:
+            image_time = parse_file_name_time(os.path.basename(entry.path))
+        if image_time is None:
+            image_time = entry.mtime_ns / 1e9
+        yield GeotagImage(entry.path, image_time, entry.latitude, entry.longitude)
+
+
+def estimate_clock_offset(track: Track, images: Sequence[GeotagImage]) -> ClockOffset:
+    """Estimate the offset between the image clock and the track clock
+
+    Each already geotagged image close to the track yields the offset between
+    its capture time and the time the track passed its position, their median
+    is used. Without such images, the offset is assumed to be a timezone
+    difference, and the one with which the track covers the most images
+    wins, the smallest in case of a tie.
+    """
+    times = track["time"]
+    if len(times) < 2:
+        raise GeotagError("Track is too short")
+
+    anchor_offsets = []
+    for image in images:
+        if image.latitude is None or image.longitude is None:
+            continue
+        distance, index = _nearest_track_point(track, image.latitude, image.longitude)
+        if distance <= _max_anchor_distance:
+            anchor_offsets.append(float(times[index]) - image.image_time)
+
+    image_times = np.sort(np.array([image.image_time for image in images]))
+    if anchor_offsets:
+        offset = float(np.median(anchor_offsets))
+        return ClockOffset(
+            offset,
+            len(anchor_offsets),
+            int(_count_covered(image_times, times, np.array([offset]))[0]),
+        )
+
+    candidates = np.arange(
+        -_max_clock_offset, _max_clock_offset + 1, _clock_offset_step, dtype=float
+    )
+    counts = _count_covered(image_times, times, candidates)
+    if not counts.max():
+        raise GeotagError("The track does not cover any of the images")
+    best = np.flatnonzero(counts == counts.max())
+    offset = float(candidates[best[np.argmin(np.abs(candidates[best]))]])
+    return ClockOffset(offset, 0, int(counts.max()))
+
+
+def _nearest_track_point(
+    track: Track, latitude: float, longitude: float
+) -> Tuple[float, int]:
+    """Distance in m to the closest point of the track, and its index"""
+    # equirectangular approximation, accurate enough at these distances
+    delta_latitude = np.radians(track["latitude"] - latitude)
+    delta_longitude = np.radians(
+        (track["longitude"] - longitude + 180.0) % 360.0 - 180.0
+    ) * math.cos(math.radians(latitude))
+    distances = np.hypot(delta_latitude, delta_longitude) * EARTH_RADIUS
+    index = int(np.argmin(distances))
+    return float(distances[index]), index
+
+
+def _count_covered(
+    image_times: np.ndarray, track_times: np.ndarray, offsets: np.ndarray
+) -> np.ndarray:
+    """Number of (sorted) image times within the track for each offset"""
+    start, end = track_times[0], track_times[-1]
+    return np.searchsorted(image_times, end - offsets, side="right") - np.searchsorted(
+        image_times, start - offsets, side="left"
+    )
+
+
+class GeotagJournal:
+    """Record of the images tagged so far by a run
+
+    Lines are appended and flushed as images are done, a line cut short by a
+    crash is ignored.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.track_path: Optional[str] = None
+        self.clock_offset: Optional[float] = None
+        self.done: Set[str] = set()
+        self._file: Optional[TextIO] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> bool:
+        """Read the journal of an interrupted run, returns whether there is one"""
+        try:
+            data = self.path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return False
+        for line in data.splitlines(keepends=True):
+            if not line.endswith("\n"):
+                break
+            key, _, value = line.rstrip("\n").partition("\t")
+            if key == "track":
+                self.track_path = value
+            elif key == "offset":
+                self.clock_offset = float(value)
+            elif key == "done":
+                self.done.add(value)
+        return self.track_path is not None and self.clock_offset is not None
+
+    def start(self, track_path: str, clock_offset: float):
+        self.track_path = track_path
+        self.clock_offset = clock_offset
+        self.done = set()
+        self._file = self.path.open("w", encoding="utf-8")
+        self._file.write(f"track\t{track_path}\noffset\t{clock_offset!r}\n")
+        self._file.flush()
+
+    def resume(self):
+        self._file = self.path.open("a", encoding="utf-8")
+
+    def record(self, image_path: str):
+        with self._lock:
+            if self._file:
+                self._file.write(f"done\t{image_path}\n")
+                self._file.flush()
+
+    def close(self, is_complete: bool):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+        if is_complete:
+            self.path.unlink(missing_ok=True)
+
+
+def geotag_folder(
+    folder: Path,
+    track_path: Path,
+    clock_offset: Optional[float] = None,
+    workers: int = 4,
+    recursive: bool = False,
+    overwrite: bool = False,
+    max_gap: float = 60.0,
+    aircraft_type: Optional[str] = None,
+    exiftool_command: Optional[Sequence[str]] = None,
+    max_pending: int = 256,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    on_clock_offset: Optional[Callable[[ClockOffset], None]] = None,
+) -> GeotagResult:
+    """Write positions from a track to the images in a folder
+
+    Images are written by several exiftool processes kept running in
+    parallel. Metadata is only created for the images about to be written,
+    with at most max_pending writes queued, so memory use does not grow with
+    the number of images.
+
+    Args:
+        clock_offset: s added to image times to get track times, estimated
+            if not given
+        overwrite: Also tag images that already have a position
+        max_gap: Longest gap in the track (s) to interpolate across
+        on_progress: Called with the number of images done and to do, from
+            writer threads
+        on_clock_offset: Called with the estimated offset before writing
+
+    Raises:
+        GeotagError: If the track cannot be read or used
+    """
+    try:
+        track = load_track(track_path)
+    except TrackFileError as e:
+        raise GeotagError(f"Could not read track {track_path}: {e}") from e
+    if len(track["time"]) < 2:
+        raise GeotagError("Track is too short")
+
+    journal = GeotagJournal(folder / JOURNAL_FILE_NAME)
+    resumed = (
+        journal.load()
+        and journal.track_path == str(track_path.resolve())
+        and (clock_offset is None or clock_offset == journal.clock_offset)
+    )
+
+    files = sorted(find_images(str(folder), recursive=recursive))
+    if resumed:
+        files = [file for file in files if file[0] not in journal.done]
+    images = list(read_geotag_images(files))
+
+    if resumed:
+        assert journal.clock_offset is not None
+        clock_offset = journal.clock_offset
+        journal.resume()
+    else:
+        if clock_offset is None:
+            estimate = estimate_clock_offset(track, images)
+            if on_clock_offset:
+                on_clock_offset(estimate)
+            clock_offset = estimate.seconds
+        journal.start(str(track_path.resolve()), clock_offset)
+
+    counts = {"tagged": 0, "failed": 0}
+    to_write = [image for image in images if overwrite or image.latitude is None]
+    already_tagged = len(images) - len(to_write)
+    outside_track = 0
+    counts_lock = threading.Lock()
+    pending = threading.BoundedSemaphore(max_pending)
+
+    def on_done(image_path: Path, is_successful: bool):
+        with counts_lock:
+            counts["tagged" if is_successful else "failed"] += 1
+            done = counts["tagged"] + counts["failed"] + outside_track
+        if is_successful:
+            journal.record(str(image_path))
+        pending.release()
+        if on_progress:
+            on_progress(done, len(to_write))
+
+    services = [MetadataService(exiftool_command) for _ in range(max(1, workers))]
+    is_complete = False
+    try:
+        for index, image in enumerate(to_write):
+            try:
+                sample = sample_track(
+                    track,
+                    image.image_time + clock_offset,
+                    max_gap=max_gap,
+                    aircraft_type=aircraft_type,
+                )
+            except TelemetryError as e:
+                raise GeotagError(f"Could not read track {track_path}: {e}") from e
+            if sample is None:
+                if DEBUG:
+                    print(f"Track does not cover {image.path}")
+                with counts_lock:
+                    outside_track += 1
+                continue
+            pending.acquire()
+            services[index % len(services)].write_data_async(
+                image_path=Path(image.path),
+                metadata=sample_to_metadata(sample),
+                on_done=on_done,
+            )
+        is_complete = True
+    finally:
+        # lets queued writes finish, also when interrupted
+        _close_all(services)
+        journal.close(is_complete=is_complete and not counts["failed"])
+
+    return GeotagResult(
+        tagged=counts["tagged"],
+        already_tagged=already_tagged,
+        outside_track=outside_track,
+        failed=counts["failed"],
+        resumed=len(journal.done) if resumed else 0,
+    )
+
+
+def _close_all(services: Iterable[MetadataService]):
+    threads = [threading.Thread(target=service.close) for service in services]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
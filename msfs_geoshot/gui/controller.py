@@ -7,12 +7,13 @@ from typing import Optional
 from msfs_geoshot.gui.settings import AppSettings
 from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
 
-from .. import MOCK_SIMULATOR
-from ..metadata import Metadata, MetadataService
-from ..names import FileNameComposer
+from .. import DEBUG, MOCK_SIMULATOR
+from ..metadata import Metadata, MetadataService, get_sidecar_path
+from ..names import FileNameComposer, FileNameTemplate, PendingName
 from ..screenshots import ScreenshotService
 from ..sim import SimService, SimServiceError
-from ..windows import get_window_rectangle, raise_window_to_foreground
+from .renamer import DeferredRenamer, get_free_path
+from .watcher import get_creation_time
 
 
 @dataclass
@@ -25,6 +26,10 @@ class ScreenShotController(QObject):
 
     sim_window_found = pyqtSignal()
     screenshot_taken = pyqtSignal(ScreenShotResult)
+    # emitted as soon as an image is stored under a new name
+    file_saved = pyqtSignal(Path)
+    # old and new path of an image renamed once its location was looked up
+    screenshot_renamed = pyqtSignal(Path, Path)
     error = pyqtSignal(str)
 
     def __init__(
@@ -34,14 +39,34 @@ class ScreenShotController(QObject):
         screenshot_service: ScreenshotService,
         file_name_composer: FileNameComposer,
         settings: AppSettings,
+        renamer: Optional[DeferredRenamer] = None,
         parent: Optional[QObject] = None,
     ):
+        """
+        Args:
+            renamer: Looks up locations for file names in the background, if
+                given. Else they are looked up before saving.
+        """
         super().__init__(parent)
         self._sim_service = sim_service
         self._metadata_service = metadata_service
         self._screenshot_service = screenshot_service
         self._file_name_composer = file_name_composer
         self._settings = settings
+        self._file_name_template = self._compile_file_name_template()
+        self._renamer = renamer
+        if renamer:
+            renamer.renamed.connect(self._on_renamed)  # type: ignore
+
+    @property
+    def file_name_template(self) -> FileNameTemplate:
+        return self._file_name_template
+
+    @pyqtSlot(object)
+    def set_file_name_template(self, template: FileNameTemplate):
+        """Use the formats of template from now on, which were checked when
+        it was compiled"""
+        self._file_name_template = template
 
     @pyqtSlot()
     def take_screenshot(self):
@@ -49,8 +74,37 @@ class ScreenShotController(QObject):
         if not screenshot_folder.is_dir():
             screenshot_folder.mkdir(parents=True, exist_ok=True)
 
+        if not MOCK_SIMULATOR and not self._sim_service.is_connected:
+            self.error.emit("Could not connect to Simulator, or received invalid data")
+            return
+
+        if MOCK_SIMULATOR:
+            from ..debug import get_mock_window_rectangle
+
+            window_rectangle = get_mock_window_rectangle()
+        else:
+            # imported here to keep the controller usable without win32
+            from ..windows import raise_window_to_foreground
+
+            try:
+                window_id = self._sim_service.get_simulator_main_window_id()
+            except SimServiceError as e:
+                print(e)
+                self.error.emit("Could not find simulator window")
+                return
+            raise_window_to_foreground(window_id)
+            window_rectangle = self._sim_service.get_simulator_window_rectangle(
+                window_id
+            )
+
+        self.sim_window_found.emit()
+
+        screenshot = self._screenshot_service.grab(window_rectangle=window_rectangle)
+
         try:
-            metadata = self._sim_service.get_flight_data()
+            # position at the time the image was grabbed rather than before
+            # the window was raised
+            metadata = self._sim_service.get_flight_data(timestamp=screenshot.timestamp)
         except SimServiceError as e:
             if MOCK_SIMULATOR:
                 from ..debug import get_mock_metadata
@@ -63,48 +117,166 @@ class ScreenShotController(QObject):
                 )
                 return
 
-        if MOCK_SIMULATOR:
-            from ..debug import get_mock_window_rectangle
-
-            window_rectangle = get_mock_window_rectangle()
-        else:
-            window_id = self._sim_service.get_simulator_main_window_id()
-            raise_window_to_foreground(window_id)
-            window_rectangle = get_window_rectangle(window_id)
-
-        self.sim_window_found.emit()
+        if DEBUG and metadata:
+            print(f"Telemetry sample age: {metadata.sample_age} s")
 
         temporary_name = f"{round(time.time())}-{uuid.uuid4()}"
+        image_format = self._settings.image_format
 
-        screenshot_path = self._screenshot_service.take_screenshot(
-            window_rectangle=window_rectangle,
+        # embedding the metadata while saving avoids rewriting the whole image
+        # with exiftool afterwards, a sidecar avoids touching it at all
+        write_sidecar = self._settings.write_sidecar
+        embed_metadata = (
+            not write_sidecar
+            and self._screenshot_service.can_embed_metadata(image_format)
+        )
+
+        screenshot_path = self._screenshot_service.save(
+            screenshot=screenshot,
             target_folder=self._settings.screenshot_folder,
             name=temporary_name,
-            image_format=self._settings.image_format,
+            image_format=image_format,
+            metadata=metadata if embed_metadata else None,
         )
 
-        error = None
+        self._store_metadata(
+            screenshot_path=screenshot_path,
+            metadata=metadata,
+            write_sidecar=write_sidecar,
+            is_embedded=embed_metadata,
+        )
+
+    @pyqtSlot(Path)
+    def tag_screenshot_file(self, image_path: Path):
+        """Geotag and rename an image saved by another program
+
+        The position is the one at the time the file was created. Images
+        saved while not flying, e.g. of other games, are left alone.
+        """
+        try:
+            capture_time = get_creation_time(image_path)
+        except OSError as e:
+            print(e)
+            return
 
-        if metadata and not self._metadata_service.write_data(
-            image_path=screenshot_path, metadata=metadata
-        ):
-            error = "Could not write metadata to screenshot"
+        try:
+            metadata = self._sim_service.get_flight_data(timestamp=capture_time)
+        except SimServiceError as e:
+            if not MOCK_SIMULATOR:
+                if DEBUG:
+                    print(f"Not geotagging {image_path.name}: {e}")
+                return
+            from ..debug import get_mock_metadata
+
+            metadata = get_mock_metadata()
+
+        if not metadata:
+            return  # not in flight, e.g. a screenshot of the menus
 
-        screenshot_name = self._file_name_composer.compose_name(
-            name_format=self._settings.file_name_format,
-            date_format=self._settings.date_format,
+        self._store_metadata(
+            screenshot_path=image_path,
             metadata=metadata,
+            write_sidecar=self._settings.write_sidecar,
+            is_embedded=False,
         )
+
+    def _store_metadata(
+        self,
+        screenshot_path: Path,
+        metadata: Optional[Metadata],
+        write_sidecar: bool,
+        is_embedded: bool,
+    ):
+        """Rename a saved image and write what is not embedded yet of metadata"""
+        error = None
+        sidecar_path: Optional[Path] = None
+
+        if metadata and write_sidecar:
+            sidecar_path = self._metadata_service.write_sidecar(
+                image_path=screenshot_path, metadata=metadata
+            )
+            if not sidecar_path:
+                error = "Could not write metadata to sidecar file"
+
+        pending_name: Optional[PendingName] = None
+        if self._renamer:
+            # the location is filled in later if it has to be looked up online
+            composer = self._file_name_composer
+            screenshot_name, pending_name = composer.compose_provisional_name(
+                template=self._file_name_template, metadata=metadata
+            )
+        else:
+            screenshot_name = self._file_name_composer.compose_name(
+                template=self._file_name_template, metadata=metadata
+            )
         # avoid hitting Windows file name length limit
         truncated_name = screenshot_name[:250]
 
-        screenshot_path = screenshot_path.rename(
-            screenshot_path.with_stem(truncated_name)
-        )
+        target_path = screenshot_path.with_stem(truncated_name)
+        if target_path != screenshot_path:
+            target_path = get_free_path(target_path)
+        try:
+            screenshot_path = screenshot_path.rename(target_path)
+        except OSError as e:
+            print(e)
+            self.error.emit(f"Could not rename {screenshot_path.name}")
+            return
+        if sidecar_path:
+            sidecar_path.rename(get_sidecar_path(screenshot_path))
+        if self._renamer and pending_name:
+            self._renamer.add(screenshot_path, pending_name)
+        self.file_saved.emit(screenshot_path)
+
+        if metadata and not is_embedded and not write_sidecar:
+            # exiftool rewrites the file in the background, batched with any
+            # other screenshots taken in the meantime
+            self._metadata_service.write_data_async(
+                image_path=screenshot_path,
+                metadata=metadata,
+                on_done=lambda path, is_successful: self._on_metadata_written(
+                    path, metadata, is_successful
+                ),
+            )
+            return
+
+        if self._renamer and pending_name:
+            self._renamer.release(screenshot_path)
 
         if error:
-            self.error.emit("Could not write metadata to screenshot")
+            self.error.emit(error)
         else:
             self.screenshot_taken.emit(
                 ScreenShotResult(path=screenshot_path, metadata=metadata)
             )
+
+    def _compile_file_name_template(self) -> FileNameTemplate:
+        try:
+            return self._file_name_composer.compile(
+                self._settings.file_name_format, self._settings.date_format
+            )
+        except ValueError as e:
+            # e.g. settings edited by hand
+            print(f"{e}, using the default formats")
+            return self._file_name_composer.compile(
+                self._settings.defaults.file_name_format,
+                self._settings.defaults.date_format,
+            )
+
+    def _on_metadata_written(
+        self, screenshot_path: Path, metadata: Metadata, is_successful: bool
+    ):
+        # called from the metadata writer thread, signals are queued to receivers
+        if is_successful:
+            self.screenshot_taken.emit(
+                ScreenShotResult(path=screenshot_path, metadata=metadata)
+            )
+        else:
+            self.error.emit("Could not write metadata to screenshot")
+        if self._renamer:
+            # exiftool is done with the file, so it can be renamed
+            self._renamer.release(screenshot_path)
+
+    @pyqtSlot(Path, Path)
+    def _on_renamed(self, old_path: Path, new_path: Path):
+        self.file_saved.emit(new_path)
+        self.screenshot_renamed.emit(old_path, new_path)
@@ -1,3 +1,4 @@
+import html
 import winsound
 from pathlib import Path
 from typing import Optional
@@ -33,10 +34,14 @@ class MainWindow(QMainWindow):
     screenshot_requested = pyqtSignal()
     credits_requested = pyqtSignal()
     hotkey_changed = pyqtSignal(HotkeyID, str)
+    watch_folder_changed = pyqtSignal(object)  # Optional[Path], None if disabled
+    file_name_template_changed = pyqtSignal(object)  # FileNameTemplate
+    location_timezone_changed = pyqtSignal(bool)
     closed = pyqtSignal()
 
     _maps_url = "https://www.google.com/maps/search/?api=1&query={latitude},{longitude}"
     _shutter_sound_path = str(RESOURCES_PATH / "shutter.wav")
+    _preview_delay = 300  # ms after the last keystroke
 
     def __init__(
         self,
@@ -75,6 +80,7 @@ class MainWindow(QMainWindow):
 
         self._setup_input_widget_connections()
         self._setup_button_connections()
+        self._setup_file_name_preview()
 
         self._form.title.setText(
             f"<b>{__app_name__}</b> v{__version__} by {__author__}"
@@ -98,6 +104,11 @@ class MainWindow(QMainWindow):
             )
         self._set_last_opened_screenshot(path=result.path, metadata=result.metadata)
 
+    @pyqtSlot(Path, Path)
+    def on_screenshot_renamed(self, old_path: Path, new_path: Path):
+        if self._last_screenshot == old_path:
+            self._last_screenshot = new_path
+
     @pyqtSlot(str)
     def on_screenshot_error(self, message: str):
         self._notification_handler.notify(
@@ -105,6 +116,14 @@ class MainWindow(QMainWindow):
             color=NotificationColor.error,
         )
 
+    @pyqtSlot()
+    def on_sim_connected(self):
+        self.setWindowTitle(f"{__app_name__} (connected to simulator)")
+
+    @pyqtSlot()
+    def on_sim_disconnected(self):
+        self.setWindowTitle(__app_name__)
+
     @pyqtSlot()
     def on_sim_window_found(self):
         if self._settings.play_sound:
@@ -151,6 +170,7 @@ class MainWindow(QMainWindow):
             self.quit, Qt.ConnectionType.QueuedConnection
         )  # queued connection recommended on slots that close QApplication
         self._form.select_folder.clicked.connect(self._on_select_folder)
+        self._form.select_watch_folder.clicked.connect(self._on_select_watch_folder)
         self._form.restore_defaults.clicked.connect(self._on_restore_defaults)
         self._form.restore_defaults_advanced.clicked.connect(
             self._on_restore_defaults_advanced
@@ -163,6 +183,15 @@ class MainWindow(QMainWindow):
         self._form.credits.clicked.connect(self.credits_requested)
         self._form.updates.clicked.connect(self._on_open_store)
 
+    def _setup_file_name_preview(self):
+        self._preview_timer = QTimer(self)
+        self._preview_timer.setSingleShot(True)
+        self._preview_timer.setInterval(self._preview_delay)
+        self._preview_timer.timeout.connect(self._update_file_name_preview)
+        self._form.file_name_format.textChanged.connect(self._preview_timer.start)
+        self._form.date_format.textChanged.connect(self._preview_timer.start)
+        self._update_file_name_preview()
+
     def _setup_button_labels(self):
         self._form.take_screenshot.setText(
             f"📷 Screenshot ({self._settings.screenshot_hotkey})"
@@ -180,6 +209,13 @@ class MainWindow(QMainWindow):
             self._on_start_to_tray_changed
         )
         self._form.play_sound.stateChanged.connect(self._on_play_sound_changed)
+        self._form.write_sidecar.stateChanged.connect(self._on_write_sidecar_changed)
+        self._form.watch_folder_enabled.stateChanged.connect(
+            self._on_watch_folder_enabled_changed
+        )
+        self._form.location_timezone.stateChanged.connect(
+            self._on_location_timezone_changed
+        )
         self._form.show_notification.stateChanged.connect(
             self._on_show_Notification_changed
         )
@@ -196,20 +232,33 @@ class MainWindow(QMainWindow):
             self._on_start_to_tray_changed
         )
         self._form.play_sound.stateChanged.disconnect(self._on_play_sound_changed)
+        self._form.write_sidecar.stateChanged.disconnect(
+            self._on_write_sidecar_changed
+        )
+        self._form.watch_folder_enabled.stateChanged.disconnect(
+            self._on_watch_folder_enabled_changed
+        )
+        self._form.location_timezone.stateChanged.disconnect(
+            self._on_location_timezone_changed
+        )
         self._form.show_notification.stateChanged.disconnect(
             self._on_show_Notification_changed
         )
 
     def _load_ui_state_from_settings(self):
         self._form.current_folder.setText(str(self._settings.screenshot_folder))
+        self._form.current_watch_folder.setText(str(self._settings.watch_folder))
+        self._form.watch_folder_enabled.setChecked(self._settings.watch_folder_enabled)
         self._select_hotkey.setKeySequence(
             QKeySequence(self._settings.screenshot_hotkey)
         )
         self._form.select_format.clear()
         self._form.select_format.addItems(format.name for format in ImageFormat)
         self._form.select_format.setCurrentText(self._settings.image_format.name)
+        self._form.write_sidecar.setChecked(self._settings.write_sidecar)
         self._form.file_name_format.setText(self._settings.file_name_format)
         self._form.date_format.setText(self._settings.date_format)
+        self._form.location_timezone.setChecked(self._settings.location_timezone)
         self._form.minimize_to_tray.setChecked(self._settings.minimize_to_tray)
         self._form.start_to_tray.setChecked(self._settings.start_to_tray)
         self._form.play_sound.setChecked(self._settings.play_sound)
@@ -222,6 +271,7 @@ class MainWindow(QMainWindow):
         self._settings.file_name_format = self._form.file_name_format.text()
         self._form.file_name_format.setPalette(QLineEdit().palette())
         self._form.file_name_format_save.setDisabled(True)
+        self._emit_file_name_template_changed()
 
     @pyqtSlot()
     def _on_date_format_save(self):
@@ -230,6 +280,29 @@ class MainWindow(QMainWindow):
         self._settings.date_format = self._form.date_format.text()
         self._form.date_format.setPalette(QLineEdit().palette())
         self._form.date_format_save.setDisabled(True)
+        self._emit_file_name_template_changed()
+
+    def _emit_file_name_template_changed(self):
+        # saved formats have passed the validators
+        template = self._file_name_composer.compile(
+            self._settings.file_name_format, self._settings.date_format
+        )
+        self.file_name_template_changed.emit(template)
+
+    @pyqtSlot()
+    def _update_file_name_preview(self):
+        try:
+            template = self._file_name_composer.compile(
+                self._form.file_name_format.text(), self._form.date_format.text()
+            )
+        except ValueError:
+            self._form.file_name_preview.clear()
+            return
+        name = self._file_name_composer.preview(template)
+        extension = self._settings.image_format.value
+        self._form.file_name_preview.setText(
+            f"Example: <i>{html.escape(name)}.{extension}</i>"
+        )
 
     @pyqtSlot()
     def _on_restore_defaults(self):
@@ -243,11 +316,17 @@ class MainWindow(QMainWindow):
         self.hotkey_changed.emit(
             HotkeyID.take_screenshot, self._settings.defaults.screenshot_hotkey
         )
+        self._emit_watch_folder_changed()
+        self.location_timezone_changed.emit(self._settings.location_timezone)
+        self._emit_file_name_template_changed()
 
     @pyqtSlot()
     def _on_restore_defaults_advanced(self):
         self._form.file_name_format.setText(self._settings.defaults.file_name_format)
         self._form.date_format.setText(self._settings.defaults.date_format)
+        self._form.location_timezone.setChecked(
+            self._settings.defaults.location_timezone
+        )
         self._form.file_name_format_save.click()
         self._form.date_format_save.click()
 
@@ -264,6 +343,30 @@ class MainWindow(QMainWindow):
         self._form.current_folder.setText(screenshot_folder)
         self._settings.screenshot_folder = Path(screenshot_folder)
 
+    @pyqtSlot()
+    def _on_select_watch_folder(self):
+        watch_folder = QFileDialog.getExistingDirectory(
+            self,
+            "Choose a folder other programs save MSFS screenshots to",
+            str(self._settings.watch_folder),
+        )
+        if not watch_folder:
+            return
+
+        self._form.current_watch_folder.setText(watch_folder)
+        self._settings.watch_folder = Path(watch_folder)
+        self._emit_watch_folder_changed()
+
+    @pyqtSlot(int)
+    def _on_watch_folder_enabled_changed(self, state: int):
+        self._settings.watch_folder_enabled = state == Qt.CheckState.Checked
+        self._emit_watch_folder_changed()
+
+    def _emit_watch_folder_changed(self):
+        self.watch_folder_changed.emit(
+            self._settings.watch_folder if self._settings.watch_folder_enabled else None
+        )
+
     @pyqtSlot(str)
     def _on_format_selection_changed(self, new_name: str):
         format = ImageFormat[new_name]
@@ -291,6 +394,15 @@ class MainWindow(QMainWindow):
     def _on_play_sound_changed(self, state: int):
         self._settings.play_sound = state == Qt.CheckState.Checked
 
+    @pyqtSlot(int)
+    def _on_write_sidecar_changed(self, state: int):
+        self._settings.write_sidecar = state == Qt.CheckState.Checked
+
+    @pyqtSlot(int)
+    def _on_location_timezone_changed(self, state: int):
+        self._settings.location_timezone = state == Qt.CheckState.Checked
+        self.location_timezone_changed.emit(self._settings.location_timezone)
+
     @pyqtSlot(int)
     def _on_show_Notification_changed(self, state: int):
         self._settings.show_notification = state == Qt.CheckState.Checked
@@ -0,0 +1,279 @@
+import heapq
+import itertools
+import json
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import IO, Dict, List, Optional, Set, Tuple
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from .. import DEBUG
+from ..geocoding import GeocoderError
+from ..metadata import get_sidecar_path
+from ..names import FileNameComposer, PendingName
+
+RENAME_JOURNAL_FILE_NAME = "pending-renames.journal"
+
+# of the add lines, which start with it
+_JOURNAL_VERSION = 2
+
+
+def get_free_path(path: Path) -> Path:
+    # names only differ by the second images were taken in
+    candidate = path
+    counter = 1
+    while candidate.exists():
+        counter += 1
+        candidate = path.with_stem(f"{path.stem}_{counter}")
+    return candidate
+
+
+class RenameJournal:
+    """Record of the images waiting for their final name
+
+    Lines are appended and flushed as images are added and renamed, a line
+    cut short by a crash is ignored. The file is emptied whenever no image
+    is pending anymore. Lines of unknown versions are skipped.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._pending: Dict[str, PendingName] = {}
+        self._file: Optional[IO[str]] = None
+        self._lock = threading.Lock()
+
+    def open(self) -> Dict[str, PendingName]:
+        """Start recording, returns the images left pending by earlier runs"""
+        with self._lock:
+            self._pending = {}
+            try:
+                data = self.path.read_text(encoding="utf-8")
+            except FileNotFoundError:
+                data = ""
+            for line in data.splitlines(keepends=True):
+                if not line.endswith("\n"):
+                    break
+                key, _, value = line.rstrip("\n").partition("\t")
+                try:
+                    if key == "add":
+                        path, name = _parse_add(value)
+                        self._pending[path] = name
+                    elif key == "done":
+                        self._pending.pop(value, None)
+                except (ValueError, TypeError) as e:
+                    print(f"Skipping rename journal line: {e}")
+                    continue
+            # only what is still pending is carried over
+            self._file = self.path.open("w", encoding="utf-8")
+            for path, name in self._pending.items():
+                self._write_add(path, name)
+            self._file.flush()
+            return dict(self._pending)
+
+    def add(self, path: str, name: PendingName):
+        with self._lock:
+            self._pending[path] = name
+            if self._file:
+                self._write_add(path, name)
+                self._file.flush()
+
+    def done(self, path: str):
+        with self._lock:
+            self._pending.pop(path, None)
+            if not self._file:
+                return
+            if self._pending:
+                self._file.write(f"done\t{path}\n")
+            else:
+                self._file.seek(0)
+                self._file.truncate()
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def _write_add(self, path: str, name: PendingName):
+        assert self._file is not None
+        self._file.write(f"add\t{json.dumps([_JOURNAL_VERSION, path, *name])}\n")
+
+
+def _parse_add(value: str) -> Tuple[str, PendingName]:
+    entry = json.loads(value)
+    if entry and isinstance(entry[0], str):
+        # written before lines were versioned, when the date and time was the
+        # only field besides the location
+        path, name_format, datetime_string, latitude, longitude = entry
+        return path, PendingName(
+            name_format, {"datetime": datetime_string}, latitude, longitude
+        )
+    if entry and entry[0] == _JOURNAL_VERSION:
+        _, path, name_format, fields, latitude, longitude = entry
+        if not isinstance(fields, dict):
+            raise TypeError(f"Invalid fields of {path}")
+        return path, PendingName(name_format, fields, latitude, longitude)
+    raise ValueError(f"Unknown version {entry[0] if entry else None}")
+
+
+class DeferredRenamer(QObject):
+    """Renames images once the location for their file name is looked up
+
+    Images are saved under a provisional name right away, so capturing never
+    waits on the network. Lookups run one at a time in a background thread,
+    each bounded by the timeout of the geocoder. Failed lookups and renames
+    are retried with growing delays, after the last attempt the image is
+    named without a location. Pending images are kept in a journal, those
+    of a session that ended or crashed are renamed in the next one.
+    """
+
+    renamed = pyqtSignal(Path, Path)  # old and new path
+
+    # not sooner than failed lookups are cached for
+    _retry_delays = (300.0, 900.0, 1800.0, 3600.0)  # s
+
+    def __init__(
+        self,
+        file_name_composer: FileNameComposer,
+        journal_path: Path,
+        parent: Optional[QObject] = None,
+    ):
+        super().__init__(parent)
+        self._file_name_composer = file_name_composer
+        self._journal = RenameJournal(journal_path)
+        # due time.monotonic(), insertion order, path, name, attempts so far
+        self._queue: List[Tuple[float, int, str, PendingName, int]] = []
+        self._held: Dict[str, PendingName] = {}
+        self._in_progress: Set[str] = set()
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._is_stopped = False
+        self._thread = threading.Thread(
+            target=self._run, name="DeferredRenamer", daemon=True
+        )
+
+    @property
+    def pending_count(self) -> int:
+        with self._condition:
+            return len(self._queue) + len(self._held) + len(self._in_progress)
+
+    def start(self):
+        """Start renaming, first the images left pending by earlier sessions"""
+        pending = self._journal.open()
+        with self._condition:
+            for path, name in pending.items():
+                self._push(path, name, attempts=0, delay=0.0)
+        self._thread.start()
+
+    def stop(self):
+        """Stop renaming, images still pending are renamed in the next session"""
+        with self._condition:
+            self._is_stopped = True
+            self._condition.notify_all()
+        # a lookup in flight is not waited for, its image stays in the journal
+        self._thread.join(timeout=0.5)
+        self._journal.close()
+
+    def add(self, path: Path, name: PendingName):
+        """Record an image saved under a provisional name
+
+        It is renamed once released, e.g. when its metadata is written.
+        """
+        self._journal.add(str(path), name)
+        with self._condition:
+            self._held[str(path)] = name
+
+    def release(self, path: Path):
+        with self._condition:
+            name = self._held.pop(str(path), None)
+            if name is not None:
+                self._push(str(path), name, attempts=0, delay=0.0)
+
+    def _push(self, path: str, name: PendingName, attempts: int, delay: float):
+        heapq.heappush(
+            self._queue,
+            (time.monotonic() + delay, next(self._order), path, name, attempts),
+        )
+        self._condition.notify()
+
+    def _retry(self, path: str, name: PendingName, attempts: int) -> bool:
+        if attempts >= len(self._retry_delays):
+            return False
+        with self._condition:
+            self._in_progress.discard(path)
+            self._push(path, name, attempts + 1, self._retry_delays[attempts])
+        return True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._is_stopped:
+                    timeout = (
+                        self._queue[0][0] - time.monotonic() if self._queue else None
+                    )
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._condition.wait(timeout)
+                if self._is_stopped:
+                    return
+                _, _, path, name, attempts = heapq.heappop(self._queue)
+                self._in_progress.add(path)
+
+            try:
+                self._process(path, name, attempts)
+            except Exception:
+                # e.g. a name format not matching its fields, which would
+                # fail again in the next session
+                print(f"Could not rename {path}, leaving it as it is")
+                traceback.print_exc()
+                self._journal.done(path)
+                with self._condition:
+                    self._in_progress.discard(path)
+
+    def _process(self, path: str, name: PendingName, attempts: int):
+        try:
+            location = self._file_name_composer.get_location(
+                name.latitude, name.longitude
+            )
+        except GeocoderError as e:
+            if DEBUG:
+                print(f"Could not look up location of {path}: {e}")
+            if self._retry(path, name, attempts):
+                return
+            print(e)
+            location = None
+
+        self._rename(path, name, location, attempts)
+
+    def _rename(
+        self, path: str, name: PendingName, location: Optional[str], attempts: int
+    ):
+        source = Path(path)
+        # avoid hitting Windows file name length limit
+        target = source.with_stem(name.compose(location)[:250])
+        if target != source:
+            target = get_free_path(target)
+        try:
+            source.rename(target)
+        except FileNotFoundError:
+            print(f"Not renaming {source.name}, it was moved or deleted")
+        except OSError as e:
+            # e.g. opened by a viewer that locks it
+            print(e)
+            if self._retry(path, name, attempts):
+                return
+        else:
+            sidecar_path = get_sidecar_path(source)
+            if sidecar_path.exists():
+                try:
+                    sidecar_path.rename(get_sidecar_path(target))
+                except OSError as e:
+                    print(e)
+            self.renamed.emit(source, target)
+
+        self._journal.done(path)
+        with self._condition:
+            self._in_progress.discard(path)
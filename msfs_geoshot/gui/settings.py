@@ -15,9 +15,17 @@ class _SettingsData:
         Path(QStandardPaths.writableLocation(QStandardPaths.PicturesLocation)) / "MSFS"
     )
     image_format: ImageFormat = ImageFormat.JPEG
+    write_sidecar: bool = False
+    # where the Xbox Game Bar saves captures
+    watch_folder: Path = (
+        Path(QStandardPaths.writableLocation(QStandardPaths.MoviesLocation))
+        / "Captures"
+    )
+    watch_folder_enabled: bool = False
     screenshot_hotkey: str = "Ctrl+Shift+S"
     file_name_format: str = "MSFS_{datetime}_{geocode}"
     date_format: str = "%Y-%m-%d-%H%M%S"
+    location_timezone: bool = False
     minimize_to_tray: bool = False
     start_to_tray: bool = False
     play_sound: bool = True
@@ -72,6 +80,39 @@ class AppSettings(QObject):
     def image_format(self, value: ImageFormat):
         self._settings.setValue("image_format", value.name)
 
+    @property
+    def write_sidecar(self) -> bool:
+        key = "write_sidecar"
+        if not self._settings.contains(key):
+            return self._defaults.write_sidecar
+        return self._settings.value(key, type=bool)
+
+    @write_sidecar.setter
+    def write_sidecar(self, value: bool):
+        self._settings.setValue("write_sidecar", value)
+
+    @property
+    def watch_folder(self) -> Path:
+        key = "watch_folder"
+        if not self._settings.contains(key):
+            return self._defaults.watch_folder
+        return Path(self._settings.value(key, type=str))
+
+    @watch_folder.setter
+    def watch_folder(self, value: Path):
+        self._settings.setValue("watch_folder", str(value))
+
+    @property
+    def watch_folder_enabled(self) -> bool:
+        key = "watch_folder_enabled"
+        if not self._settings.contains(key):
+            return self._defaults.watch_folder_enabled
+        return self._settings.value(key, type=bool)
+
+    @watch_folder_enabled.setter
+    def watch_folder_enabled(self, value: bool):
+        self._settings.setValue("watch_folder_enabled", value)
+
     @property
     def screenshot_hotkey(self) -> str:
         key = "screenshot_hotkey"
@@ -105,6 +146,17 @@ class AppSettings(QObject):
     def date_format(self, value: str):
         self._settings.setValue("date_format", value)
 
+    @property
+    def location_timezone(self) -> bool:
+        key = "location_timezone"
+        if not self._settings.contains(key):
+            return self._defaults.location_timezone
+        return self._settings.value(key, type=bool)
+
+    @location_timezone.setter
+    def location_timezone(self, value: bool):
+        self._settings.setValue("location_timezone", value)
+
     @property
     def minimize_to_tray(self) -> bool:
         key = "minimize_to_tray"
@@ -1,6 +1,6 @@
 from PyQt5.QtCore import pyqtSignal
 from PyQt5.QtGui import QIcon
-from PyQt5.QtWidgets import QMenu, QSystemTrayIcon
+from PyQt5.QtWidgets import QAction, QMenu, QSystemTrayIcon
 
 from .. import __app_name__
 from .main_window import MainWindow
@@ -8,6 +8,7 @@ from .main_window import MainWindow
 
 class AppTrayIcon(QSystemTrayIcon):
     quit_requested = pyqtSignal()
+    track_recording_toggled = pyqtSignal(bool)
 
     def __init__(self, icon: QIcon, main_window: MainWindow):
         super().__init__(icon, main_window)
@@ -19,6 +20,11 @@ class AppTrayIcon(QSystemTrayIcon):
         action = menu.addAction(f"Show {__app_name__}")
         action.triggered.connect(self._show_main_window)  # type: ignore
 
+        self._record_action = QAction("Record flight track", menu)
+        self._record_action.setCheckable(True)
+        self._record_action.toggled.connect(self.track_recording_toggled.emit)  # type: ignore
+        menu.addAction(self._record_action)
+
         menu.addSeparator()
 
         action = menu.addAction("Quit")
@@ -26,6 +32,12 @@ class AppTrayIcon(QSystemTrayIcon):
 
         self.setContextMenu(menu)
 
+    def set_track_recording(self, enabled: bool):
+        """Check or uncheck the recording action without emitting a toggle"""
+        self._record_action.blockSignals(True)
+        self._record_action.setChecked(enabled)
+        self._record_action.blockSignals(False)
+
     def _on_activated(self, activation_reason: QSystemTrayIcon.ActivationReason):
         if activation_reason == QSystemTrayIcon.ActivationReason.Context:
             return
@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QTimer, pyqtSignal, pyqtSlot
+
+from ..catalog import IMAGE_SUFFIXES, FileSignature
+
+
+def get_creation_time(path: Path) -> float:
+    """Time a file was created, or else last modified, in s since epoch"""
+    stat = path.stat()
+    if sys.platform == "win32":
+        return stat.st_ctime
+    return getattr(stat, "st_birthtime", stat.st_mtime)
+
+
+class FolderWatcher(QObject):
+    """Reports images added to a folder by other programs once they are written
+
+    Relies on change notifications of the OS, so nothing runs while the
+    folder is quiet. Bursts of notifications are coalesced into a single
+    scan of the folder. New files are polled until their size and
+    modification time have settled and the writer has closed them, and only
+    while there are such files.
+    """
+
+    file_ready = pyqtSignal(Path)
+
+    _scan_delay = 250  # ms
+    _poll_interval = 250  # ms
+    _settle_time = 1.0  # s
+    _max_ready_per_poll = 32  # keeps the event loop responsive during bursts
+
+    def __init__(self, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._folder: Optional[Path] = None
+        self._known: Set[str] = set()
+        # name -> last signature seen and monotonic time it last changed
+        self._pending: Dict[str, Tuple[FileSignature, float]] = {}
+
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)  # type: ignore
+
+        self._scan_timer = QTimer(self)
+        self._scan_timer.setSingleShot(True)
+        self._scan_timer.setInterval(self._scan_delay)
+        self._scan_timer.timeout.connect(self._scan)  # type: ignore
+
+        self._poll_timer = QTimer(self)
+        self._poll_timer.setInterval(self._poll_interval)
+        self._poll_timer.timeout.connect(self._poll_pending)  # type: ignore
+
+    @property
+    def folder(self) -> Optional[Path]:
+        return self._folder
+
+    @pyqtSlot(object)
+    def watch(self, folder: Optional[Path]):
+        """Start watching folder, or stop watching if None
+
+        Images already in the folder are not reported.
+        """
+        directories = self._watcher.directories()
+        if directories:
+            self._watcher.removePaths(directories)
+        self._scan_timer.stop()
+        self._poll_timer.stop()
+        self._pending.clear()
+        self._known = set()
+        self._folder = None
+
+        if folder is None:
+            return
+        if not folder.is_dir():
+            print(f"Cannot watch {folder}, not a folder")
+            return
+        if not self._watcher.addPath(str(folder)):
+            print(f"Cannot watch {folder}")
+            return
+        self._folder = folder.resolve()
+        self._known = self._list_images()
+
+    def mark_known(self, path: Path):
+        """Do not report path, e.g. because it was written by this app"""
+        if self._folder is not None and path.parent.resolve() == self._folder:
+            self._known.add(path.name)
+            self._pending.pop(path.name, None)
+
+    @pyqtSlot(str)
+    def _on_directory_changed(self, _: str):
+        if not self._scan_timer.isActive():
+            self._scan_timer.start()
+
+    @pyqtSlot()
+    def _scan(self):
+        if self._folder is None:
+            return
+        names = self._list_images()
+        # names removed may be reused by a new file later
+        self._known &= names
+        now = time.monotonic()
+        for name in names - self._known:
+            self._known.add(name)
+            self._pending[name] = (FileSignature(-1, -1), now)
+        if self._pending and not self._poll_timer.isActive():
+            self._poll_timer.start()
+
+    @pyqtSlot()
+    def _poll_pending(self):
+        folder = self._folder
+        if folder is None:
+            return
+        now = time.monotonic()
+        ready = []
+        for name, (signature, changed) in list(self._pending.items()):
+            path = folder / name
+            try:
+                stat = path.stat()
+            except OSError:
+                del self._pending[name]  # moved away or deleted
+                continue
+            current = FileSignature(stat.st_mtime_ns, stat.st_size)
+            if current != signature:
+                self._pending[name] = (current, now)
+            elif (
+                current.size > 0
+                and now - changed >= self._settle_time
+                and len(ready) < self._max_ready_per_poll
+                and _is_closed(path)
+            ):
+                del self._pending[name]
+                ready.append(path)
+
+        if not self._pending:
+            self._poll_timer.stop()
+
+        for path in sorted(ready):
+            self.file_ready.emit(path)
+
+    def _list_images(self) -> Set[str]:
+        assert self._folder is not None
+        try:
+            with os.scandir(self._folder) as entries:
+                return {
+                    entry.name
+                    for entry in entries
+                    if os.path.splitext(entry.name)[1].lower() in IMAGE_SUFFIXES
+                    and entry.is_file()
+                }
+        except OSError as e:
+            print(f"Could not list {self._folder}: {e}")
+            return set()
+
+
+def _is_closed(path: Path) -> bool:
+    # on Windows, writers usually deny others write access until they are done
+    try:
+        with path.open("r+b"):
+            return True
+    except OSError:
+        return False
@@ -6,12 +6,34 @@ Copyright (C) 2020 Luuk3333 <https://github.com/Luuk3333/msfs-screenshot-gps-dat
 Used under the GNU Affero General Public License v3.0
 """
 
-import subprocess
-from dataclasses import asdict, dataclass, field
+import math
+import operator
+import os
+import tempfile
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field, fields
+from datetime import tzinfo
 from pathlib import Path
-from typing import Literal, Optional
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
 
 from . import DEBUG, BINARY_PATH, __app_name__, __version__
+from .exiftool import ExifTool, ExifToolError
+from .telemetry import TelemetrySample
+from .time import get_datetime_string, get_local_offset_delta, string_format_time_delta
 
 _LongitudeRefType = Literal["E", "W"]
 _LatitudeRefType = Literal["N", "S"]
@@ -20,6 +42,11 @@ _LatitudeRefType = Literal["N", "S"]
 EXIF_DATE_FORMAT = "%Y:%m:%d %H:%M:%S"
 EXIF_OFFSET_FORMAT = "%s%H:%M"  # custom format, %s stands for sign here
 
+_internal_fields = {"capture_time", "sample_age"}
+
+# returned by SimConnect for variables that are not available
+_INVALID_VALUE = -999999
+
 
 @dataclass
 class Metadata:
@@ -66,6 +93,11 @@ class Metadata:
     Creator: str = field(init=False, default=__app_name__)
     Source: str = field(init=False, default="MSFS")
 
+    # ---- INTERNAL (cont.) ----
+    # seconds between capture_time and the telemetry sample the position was
+    # estimated from
+    sample_age: Optional[float] = None
+
     def __post_init__(self):
         """Calculate derivative fields dynamically"""
         self.OffsetTimeOriginal = self.OffsetTime
@@ -80,54 +112,356 @@ class Metadata:
             self.GPSDestLongitudeRef = "E" if self.GPSDestLongitude >= 0 else "W"
 
 
+class MetadataRecord:
+    """Compact snapshot of the tags of a Metadata instance
+
+    Holds the values in schema order, None for tags that are not set. Values
+    are also accessible as attributes, like on Metadata itself.
+    """
+
+    __slots__ = ("schema", "values")
+
+    def __init__(self, schema: "MetadataSchema", values: Tuple[Any, ...]):
+        self.schema = schema
+        self.values = values
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self.values[self.schema.indices[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """Tags that are set, in schema order"""
+        for name, value in zip(self.schema.fields, self.values):
+            if value is not None:
+                yield name, value
+
+
+class MetadataSchema:
+    """Tags of Metadata, compiled once for fast per-shot serialization
+
+    Reads all tag values in a single attrgetter call instead of deep-copying
+    the dataclass with asdict(), skipping internal fields altogether.
+    """
+
+    def __init__(self, metadata_class: Type[Metadata] = Metadata):
+        self.fields: Tuple[str, ...] = tuple(
+            metadata_field.name
+            for metadata_field in fields(metadata_class)
+            if metadata_field.name not in _internal_fields
+        )
+        self.indices: Dict[str, int] = {
+            name: index for index, name in enumerate(self.fields)
+        }
+        self._get_values = operator.attrgetter(*self.fields)
+        self._exiftool_prefixes = tuple(f"-{name}=" for name in self.fields)
+
+    def record(self, metadata: Metadata) -> MetadataRecord:
+        values = self._get_values(metadata)
+        if _INVALID_VALUE in values:
+            values = tuple(
+                self._check_value(name, value)
+                for name, value in zip(self.fields, values)
+            )
+        return MetadataRecord(self, values)
+
+    def exiftool_arguments(self, record: MetadataRecord) -> List[str]:
+        return [
+            # exiftool reads arguments line by line
+            f"{prefix}{value}".replace("\r", " ").replace("\n", " ")
+            for prefix, value in zip(self._exiftool_prefixes, record.values)
+            if value is not None
+        ]
+
+    def _check_value(self, name: str, value: Any) -> Any:
+        if value == _INVALID_VALUE:
+            print(f"Invalid value {value} for attribute {name}. Skipping.")
+            return None
+        return value
+
+
+METADATA_SCHEMA = MetadataSchema()
+
+
+class MetadataJob(NamedTuple):
+    image_path: Path
+    metadata: Metadata
+    on_done: Optional[Callable[[Path, bool], None]]  # called with success
+
+
+class BatchMetadataWriter:
+    """Queues metadata writes and hands them to exiftool in batches
+
+    A batch is sent once max_batch_size jobs are pending or the oldest one has
+    waited for max_delay seconds. Each job's on_done callback is invoked from
+    the writer thread.
+    """
+
+    def __init__(
+        self,
+        exiftool: ExifTool,
+        max_batch_size: int = 32,
+        max_delay: float = 0.2,  # s
+    ):
+        self._exiftool = exiftool
+        self._max_batch_size = max_batch_size
+        self._max_delay = max_delay
+        self._pending: List[MetadataJob] = []
+        self._oldest_pending_time = 0.0
+        self._in_progress = 0
+        self._condition = threading.Condition()
+        self._is_closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(
+        self,
+        image_path: Path,
+        metadata: Metadata,
+        on_done: Optional[Callable[[Path, bool], None]] = None,
+    ):
+        with self._condition:
+            if self._is_closed:
+                raise RuntimeError("Writer has been closed")
+            if not self._thread:
+                self._thread = threading.Thread(
+                    target=self._run, name="BatchMetadataWriter", daemon=True
+                )
+                self._thread.start()
+            if not self._pending:
+                self._oldest_pending_time = time.monotonic()
+            self._pending.append(MetadataJob(image_path, metadata, on_done))
+            self._condition.notify_all()
+
+    def flush(self):
+        """Send pending jobs right away and wait until they are done"""
+        with self._condition:
+            self._oldest_pending_time = 0.0
+            self._condition.notify_all()
+            self._condition.wait_for(
+                lambda: not self._pending and not self._in_progress
+            )
+
+    def close(self):
+        self.flush()
+        with self._condition:
+            self._is_closed = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._is_batch_due():
+                    if self._pending:
+                        self._condition.wait(
+                            self._oldest_pending_time
+                            + self._max_delay
+                            - time.monotonic()
+                        )
+                    else:
+                        self._condition.wait()
+                if not self._pending:
+                    return  # closed
+                batch = self._pending[: self._max_batch_size]
+                del self._pending[: self._max_batch_size]
+                self._oldest_pending_time = time.monotonic()
+                self._in_progress = len(batch)
+
+            try:
+                self._write_batch(batch)
+            finally:
+                with self._condition:
+                    self._in_progress = 0
+                    self._condition.notify_all()
+
+    def _is_batch_due(self) -> bool:
+        return self._is_closed or (
+            bool(self._pending)
+            and (
+                len(self._pending) >= self._max_batch_size
+                or time.monotonic() - self._oldest_pending_time >= self._max_delay
+            )
+        )
+
+    def _write_batch(self, batch: List[MetadataJob]):
+        try:
+            results = self._exiftool.write_many(
+                [self._to_arguments(job) for job in batch]
+            )
+        except ExifToolError as e:
+            print(e)
+            # one file might be taking exiftool down, don't fail the others
+            results = [self._write_single(job) for job in batch]
+        except Exception:
+            # e.g. a path exiftool cannot be given, same as above
+            traceback.print_exc()
+            results = [self._write_single(job) for job in batch]
+
+        for job, is_successful in zip(batch, results):
+            if job.on_done:
+                try:
+                    job.on_done(job.image_path, is_successful)
+                except Exception:
+                    traceback.print_exc()
+
+    def _write_single(self, job: MetadataJob) -> bool:
+        try:
+            return self._exiftool.write(self._to_arguments(job))
+        except ExifToolError as e:
+            print(e)
+            return False
+        except Exception:
+            traceback.print_exc()
+            return False
+
+    @staticmethod
+    def _to_arguments(job: MetadataJob) -> List[str]:
+        return metadata_to_exiftool_arguments(job.metadata) + [str(job.image_path)]
+
+
 class MetadataService:
 
-    _exiftool = BINARY_PATH / "exiftool.exe"
+    _exiftool_path = BINARY_PATH / "exiftool.exe"
+
+    def __init__(self, exiftool_command: Optional[Sequence[str]] = None):
+        """
+        Args:
+            exiftool_command: Command to run exiftool with, e.g. a stand-in
+                such as tools/fake_exiftool.py. Defaults to the bundled binary
+        """
+        common_arguments = [
+            "-n",
+            "-overwrite_original",
+            "-charset",
+            "filename=utf8",
+        ]
+        if DEBUG:
+            common_arguments.append("-verbose")
+        self._exiftool = ExifTool(
+            command=exiftool_command or [str(self._exiftool_path)],
+            common_arguments=common_arguments,
+        )
+        self._batch_writer = BatchMetadataWriter(self._exiftool)
 
     def write_data(
         self,
         image_path: Path,
         metadata: Metadata,
     ) -> bool:
-        arguments = ["-n", "-overwrite_original"]
+        arguments = metadata_to_exiftool_arguments(metadata) + [str(image_path)]
 
         if DEBUG:
-            arguments.append("-verbose")
-
-        for attribute, value in asdict(metadata).items():
-            if value == "capture_time":
-                # internal value
-                continue
-            elif value == -999999:
-                # TODO: Is this necessary?
-                print(f"Invalid value {value} for attribute {attribute}. Skipping.")
-                continue
-            elif value is None:
-                continue
-            arguments.append(f"-{attribute}={value}")
-
-        command_line = [str(self._exiftool)] + arguments + [str(image_path)]
+            print(arguments)
 
+        try:
+            return self._exiftool.write(arguments)
+        except ExifToolError as e:
+            print(e)
+            return False
+
+    def write_data_async(
+        self,
+        image_path: Path,
+        metadata: Metadata,
+        on_done: Callable[[Path, bool], None],
+    ):
+        """Queue metadata to be written together with other pending files
+
+        Args:
+            on_done: Called with the image path and whether writing succeeded,
+                from a background thread
+        """
         if DEBUG:
-            print(command_line)
+            print(f"Queueing metadata for {image_path}")
+        self._batch_writer.submit(image_path, metadata, on_done)
+
+    def write_sidecar(self, image_path: Path, metadata: Metadata) -> Optional[Path]:
+        """Write metadata to an XMP sidecar next to the image, leaving it untouched
+
+        Returns:
+            Path of the sidecar, None if it could not be written
+        """
+        from .exif import encode_xmp  # exif depends on this module
 
+        sidecar_path = get_sidecar_path(image_path)
+        xmp = encode_xmp(metadata, include_exif=True)
+
+        # write to a temporary file first, so that photo managers watching the
+        # folder never pick up a partially written sidecar
         try:
-            output = subprocess.check_output(
-                command_line,
-                text=True,
-                creationflags=subprocess.CREATE_NO_WINDOW,
-                stdin=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+            file_descriptor, temporary_path = tempfile.mkstemp(
+                prefix=f".{sidecar_path.stem}-", suffix=".tmp", dir=sidecar_path.parent
             )
-            if DEBUG:
-                print(output)
-        except subprocess.CalledProcessError as e:
-            print(e.output)
-            return False
-        except subprocess.SubprocessError as e:
+            try:
+                with os.fdopen(file_descriptor, "wb") as sidecar_file:
+                    sidecar_file.write(xmp)
+                    sidecar_file.flush()
+                    os.fsync(sidecar_file.fileno())
+                os.replace(temporary_path, sidecar_path)
+            except BaseException:
+                os.unlink(temporary_path)
+                raise
+        except OSError as e:
             print(e)
-            return False
-        except Exception as e:
-            raise e
+            return None
+
+        return sidecar_path
+
+    def close(self):
+        """Finish queued writes and shut down the exiftool process"""
+        self._batch_writer.close()
+        self._exiftool.close()
+
+
+def sample_to_metadata(
+    sample: TelemetrySample,
+    sample_age: float = 0.0,
+    timezone: Optional[tzinfo] = None,
+) -> Metadata:
+    """Tags for a screenshot taken at the time and position of sample
+
+    Dates are local to timezone, by default the one of this PC.
+    """
+    description = sample.aircraft_type
+    capture_time = sample.timestamp
+
+    datetime_string = get_datetime_string(
+        capture_time, date_format=EXIF_DATE_FORMAT, timezone=timezone
+    )
+    offset_timedelta = get_local_offset_delta(capture_time, timezone=timezone)
+    offset_time = string_format_time_delta(offset_timedelta, EXIF_OFFSET_FORMAT)
+
+    return Metadata(
+        # Internal
+        capture_time=capture_time,
+        sample_age=round(sample_age, 3),
+        # Date
+        AllDates=datetime_string,
+        OffsetTime=offset_time,
+        # GPS
+        GPSLatitude=round(sample.latitude, 5),
+        GPSLongitude=round(sample.longitude, 5),
+        GPSAltitude=round(sample.altitude, 2),
+        GPSSpeed=round(sample.speed * 3.6, 2),  # m/s to km/h
+        GPSImgDirection=round(math.degrees(sample.heading), 5),
+        GPSDestLongitude=round(sample.dest_longitude, 5)
+        if sample.dest_longitude
+        else None,
+        GPSDestLatitude=round(sample.dest_latitude, 5)
+        if sample.dest_latitude
+        else None,
+        # MISC
+        Description=description,
+        ImageDescription=description,
+    )
+
+
+def get_sidecar_path(image_path: Path) -> Path:
+    # "name.xmp" rather than "name.jpg.xmp", as read by Lightroom, digiKam etc.
+    return image_path.with_suffix(".xmp")
+
 
-        return True
+def metadata_to_exiftool_arguments(metadata: Metadata) -> List[str]:
+    return METADATA_SCHEMA.exiftool_arguments(METADATA_SCHEMA.record(metadata))
@@ -1,23 +1,38 @@
 from os import name
+import functools
 import string
 import time
 from datetime import date, datetime
-from typing import Dict, List, NamedTuple, Optional, Tuple, cast
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
 
-from pathvalidate import ValidationError, validate_filename  # type: ignore
+from pathvalidate import (  # type: ignore
+    ValidationError,
+    sanitize_filename,
+    validate_filename,
+)
 import tzlocal
-from geopy.geocoders import Nominatim
-from geopy.location import Location
 
-from . import __app_name__
+from .airports import AirportIndex, get_default_airport_index
+from .geocoding import (
+    Geocoder,
+    GeocoderError,
+    NetworkRequiredError,
+    get_default_geocoder,
+)
 from .metadata import Metadata
-from .time import get_datetime_string
+from .time import get_datetime_string, get_offset_timezone
+
+NO_GEOCODE = "no-geocode-found"
+NO_AIRPORT = "no-airport-found"
+# stands in for the location in provisional names
+PENDING_GEOCODE = "geocode-pending"
 
 
 class FileNameField(NamedTuple):
     name: str
     required: bool
     description: str  # html
+    example: str = ""  # value in previews, if it depends on the position
 
 
 _file_name_fields: List[FileNameField] = [
@@ -30,121 +45,273 @@ _file_name_fields: List[FileNameField] = [
         name="geocode",
         required=False,
         description="""A human-readable description of the location the screenshot
-was taken at (e.g. <i>USA-Texas-Austin</i>), as returned by <a href='https://wiki.openstreetmap.org/wiki/Nominatim'>
-OSM Nominatim</a>.""",
+was taken at (e.g. <i>United_States-Texas-Austin</i>), looked up offline in
+<a href='https://www.geonames.org/'>GeoNames</a> places or, where those are not
+installed, with <a href='https://wiki.openstreetmap.org/wiki/Nominatim'>OSM Nominatim</a>.""",
+        example="United_States-Texas-Austin",
+    ),
+    FileNameField(
+        name="airport",
+        required=False,
+        description="""ICAO code and name of the nearest airport within 50 km
+(e.g. <i>KAUS-Austin_Bergstrom_International_Airport</i>), from
+<a href='https://ourairports.com/'>OurAirports</a>.""",
+        example="KAUS-Austin_Bergstrom_International_Airport",
     ),
 ]
 
+# farther than this, the nearest airport does not describe the position
+_max_airport_distance = 50000.0  # m
 
-class FileNameComposer:
 
-    _user_agent = __app_name__.replace(" ", "_")
+class FileNameTemplate(NamedTuple):
+    """Name and date format checked once, to render names without checks
 
-    def compose_name(
-        self, name_format: str, date_format: str, metadata: Optional[Metadata] = None
+    Built by FileNameComposer.compile() whenever the formats change.
+    """
+
+    name_format: str
+    date_format: str
+    field_names: FrozenSet[str]
+
+    def uses_field(self, field_name: str) -> bool:
+        return field_name in self.field_names
+
+    def render(self, fields: Dict[str, str]) -> str:
+        return self.name_format.format_map(fields)
+
+
+class PendingName(NamedTuple):
+    """A file name still waiting for the location to be looked up"""
+
+    name_format: str
+    fields: Dict[str, str]  # all but the location
+    latitude: float
+    longitude: float
+
+    def compose(self, location: Optional[str]) -> str:
+        return self.name_format.format(**self.fields, geocode=location or NO_GEOCODE)
+
+
+class FileNameComposer:
+    def __init__(
+        self,
+        geocoder: Optional[Geocoder] = None,
+        airports: Optional[AirportIndex] = None,
     ):
-        is_valid_name_format, error = self.is_name_format_valid(name_format)
-        if not is_valid_name_format:
-            raise ValueError(f"Invalid format string provided: {error}")
+        """
+        Args:
+            airports: Defaults to the bundled index, loaded once needed
+        """
+        self._geocoder = geocoder or get_default_geocoder()
+        self._airports = airports
+        self._are_airports_loaded = airports is not None
+
+    def compile(self, name_format: str, date_format: str) -> FileNameTemplate:
+        """Check the formats and prepare them for composing names
+
+        Raises:
+            ValueError: if either format is invalid
+        """
+        self._check_formats(name_format, date_format)
+        field_names = frozenset(
+            parsed_name
+            for _, parsed_name, _, _ in string.Formatter().parse(name_format)
+            if parsed_name is not None
+        )
+        return FileNameTemplate(name_format, date_format, field_names)
 
-        is_valid_date_format, error = self.is_date_format_valid(date_format)
-        if not is_valid_date_format:
-            raise ValueError(f"Invalid format string provided: {error}")
+    def compose_name(
+        self, template: FileNameTemplate, metadata: Optional[Metadata] = None
+    ) -> str:
+        format_data = self._get_local_fields(template, metadata)
+        geocode = None
+        if metadata and template.uses_field("geocode"):
+            geocode = self._maybe_get_geocode_string(metadata)
+        format_data["geocode"] = geocode or NO_GEOCODE
+
+        return template.render(format_data)
+
+    def compose_provisional_name(
+        self, template: FileNameTemplate, metadata: Optional[Metadata] = None
+    ) -> Tuple[str, Optional[PendingName]]:
+        """Like compose_name, without waiting on the network
+
+        If the location can only be looked up online, the name has a
+        placeholder for it, and the final name is to be composed from the
+        returned PendingName once the location is known.
+        """
+        unlocated = PendingName(
+            template.name_format,
+            self._get_local_fields(template, metadata),
+            0.0,
+            0.0,
+        )
+
+        if (
+            not metadata
+            or metadata.GPSLatitude is None
+            or metadata.GPSLongitude is None
+            or not template.uses_field("geocode")
+        ):
+            return unlocated.compose(None), None
 
-        capture_time = metadata.capture_time if metadata else time.time()
+        try:
+            location = self.get_location(
+                metadata.GPSLatitude, metadata.GPSLongitude, offline_only=True
+            )
+        except NetworkRequiredError:
+            pending = unlocated._replace(
+                latitude=metadata.GPSLatitude, longitude=metadata.GPSLongitude
+            )
+            return pending.compose(PENDING_GEOCODE), pending
+        except GeocoderError as e:
+            print(e)
+            location = None
+        return unlocated.compose(location), None
+
+    def get_location(
+        self, latitude: float, longitude: float, offline_only: bool = False
+    ) -> Optional[str]:
+        """Location string for file names, see Geocoder.reverse()"""
+        location = self._geocoder.reverse(latitude, longitude, offline_only)
+        # place names may contain e.g. slashes ("Biel/Bienne")
+        return _sanitize_filename(location) if location else None
+
+    def get_airport(self, latitude: float, longitude: float) -> Optional[str]:
+        """Code and name of the nearest airport for file names, if any"""
+        if not self._are_airports_loaded:
+            self._airports = get_default_airport_index()
+            self._are_airports_loaded = True
+        if not self._airports:
+            return None
+        airport = self._airports.nearest(
+            latitude, longitude, max_distance=_max_airport_distance
+        )
+        if not airport:
+            return None
+        return _sanitize_filename(f"{airport.ident}-{airport.name}".replace(" ", "_"))
+
+    def preview(self, template: FileNameTemplate) -> str:
+        """Name of a screenshot taken now, with example values for the fields
+        that depend on the position"""
+        fields = {field.name: field.example for field in _file_name_fields}
+        fields["datetime"] = get_datetime_string(time.time(), template.date_format)
+        return template.render(fields)
+
+    def is_name_format_valid(self, name_format: str) -> Tuple[bool, str]:
+        return _check_name_format(name_format)
 
-        format_data: Dict[str, Optional[str]] = {
+    def is_date_format_valid(self, date_format: str) -> Tuple[bool, str]:
+        return _check_date_format(date_format)
+
+    def get_supported_fields(self) -> List[FileNameField]:
+        return _file_name_fields
+
+    def _get_local_fields(
+        self, template: FileNameTemplate, metadata: Optional[Metadata]
+    ) -> Dict[str, str]:
+        """Values of the fields known without a network request"""
+        capture_time = metadata.capture_time if metadata else time.time()
+        # the date in the name is the one in the image, which may be local to
+        # the aircraft's position rather than this PC
+        timezone = (
+            get_offset_timezone(metadata.OffsetTime)
+            if metadata and metadata.OffsetTime
+            else None
+        )
+        airport = None
+        if (
+            metadata
+            and metadata.GPSLatitude is not None
+            and metadata.GPSLongitude is not None
+            and template.uses_field("airport")
+        ):
+            airport = self.get_airport(metadata.GPSLatitude, metadata.GPSLongitude)
+        return {
             "datetime": get_datetime_string(
-                timestamp_utc=capture_time, date_format=date_format
+                timestamp_utc=capture_time,
+                date_format=template.date_format,
+                timezone=timezone,
             ),
-            "geocode": (self._maybe_get_geocode_string(metadata) if metadata else None)
-            or "no-geocode-found",
+            "airport": airport or NO_AIRPORT,
         }
 
-        return name_format.format(**format_data)
+    def _check_formats(self, name_format: str, date_format: str):
+        is_valid_name_format, error = self.is_name_format_valid(name_format)
+        if not is_valid_name_format:
+            raise ValueError(f"Invalid format string provided: {error}")
 
-    def is_name_format_valid(self, name_format: str) -> Tuple[bool, str]:
-        if not name_format:
-            return False, "Name format must not be empty."
+        is_valid_date_format, error = self.is_date_format_valid(date_format)
+        if not is_valid_date_format:
+            raise ValueError(f"Invalid format string provided: {error}")
 
+    def _maybe_get_geocode_string(self, metadata: Metadata) -> Optional[str]:
         try:
-            mock_file_name = f"{name_format}.extension"
-            validate_filename(mock_file_name)
-        except ValidationError as e:
-            return False, str(e)
+            return self.get_location(metadata.GPSLatitude, metadata.GPSLongitude)
+        except GeocoderError as e:
+            print(e)
+            return None
 
-        formatter = string.Formatter().parse(name_format)
-        try:
-            items = list(formatter)
-        except ValueError:
-            return False, "Format string is invalid."
 
-        field_names = [name for text, name, spec, conv in items if name is not None]
+# shots in an area share their location, which only needs sanitizing once
+_sanitize_filename = functools.lru_cache(maxsize=256)(sanitize_filename)
 
-        known_names = []
-        for file_name_field in _file_name_fields:
-            known_names.append(file_name_field.name)
-            if file_name_field.required and file_name_field.name not in field_names:
-                return False, f"Missing required field: {{{file_name_field.name}}}."
 
-        for field_name in field_names:
-            if field_name not in known_names:
-                return False, f"Unrecognized field name: '{{{field_name}}}'"
+@functools.lru_cache(maxsize=64)
+def _check_name_format(name_format: str) -> Tuple[bool, str]:
+    # cached, as the settings validate the same input on every keystroke
+    if not name_format:
+        return False, "Name format must not be empty."
 
-        return True, ""
+    try:
+        mock_file_name = f"{name_format}.extension"
+        validate_filename(mock_file_name)
+    except ValidationError as e:
+        return False, str(e)
 
-    def is_date_format_valid(self, date_format: str) -> Tuple[bool, str]:
-        if not date_format:
-            return False, "Date format must not be empty."
+    formatter = string.Formatter().parse(name_format)
+    try:
+        items = list(formatter)
+    except ValueError:
+        return False, "Format string is invalid."
 
-        try:
-            mock_file_name = f"{date_format}.extension"
-            validate_filename(mock_file_name)
-        except ValidationError as e:
-            return False, str(e)
+    field_names = [name for text, name, spec, conv in items if name is not None]
 
-        test_time = datetime.fromtimestamp(1631728655)
-        try:
-            formatted = test_time.strftime(date_format)
-        except Exception:
-            return False, "Date format could not be parsed."
+    known_names = []
+    for file_name_field in _file_name_fields:
+        known_names.append(file_name_field.name)
+        if file_name_field.required and file_name_field.name not in field_names:
+            return False, f"Missing required field: {{{file_name_field.name}}}."
 
-        if formatted == "":
-            return False, "Date format would result in empty string."
+    for field_name in field_names:
+        if field_name not in known_names:
+            return False, f"Unrecognized field name: '{{{field_name}}}'"
 
-        if formatted == date_format:
-            return False, "Date format does not contain any placeholders."
+    return True, ""
 
-        return True, ""
 
-    def get_supported_fields(self) -> List[FileNameField]:
-        return _file_name_fields
+@functools.lru_cache(maxsize=64)
+def _check_date_format(date_format: str) -> Tuple[bool, str]:
+    if not date_format:
+        return False, "Date format must not be empty."
 
-    def _maybe_get_geocode_string(self, metadata: Metadata) -> Optional[str]:
-        try:
-            geolocator = Nominatim(user_agent=self._user_agent)
-            location: Location = cast(
-                Location,
-                geolocator.reverse(
-                    (metadata.GPSLatitude, metadata.GPSLongitude),
-                    language="en-US,en",
-                    exactly_one=True,
-                    zoom=10,  # limit to city region
-                ),
-            )
-        except Exception as e:
-            print(e)
-            return None
+    try:
+        mock_file_name = f"{date_format}.extension"
+        validate_filename(mock_file_name)
+    except ValidationError as e:
+        return False, str(e)
 
-        if not location or not getattr(location, "address", None):
-            return None
+    test_time = datetime.fromtimestamp(1631728655)
+    try:
+        formatted = test_time.strftime(date_format)
+    except Exception:
+        return False, "Date format could not be parsed."
 
-        try:
-            location_str = "-".join(reversed(location.address.split(", "))).replace(
-                " ", "_"
-            )
-        except Exception as e:
-            print(e)
-            return None
+    if formatted == "":
+        return False, "Date format would result in empty string."
+
+    if formatted == date_format:
+        return False, "Date format does not contain any placeholders."
 
-        return location_str
+    return True, ""
@@ -0,0 +1,229 @@
+"""
+Client for OSM Nominatim, shared by everything looking up locations online
+
+The usage policy of the public instance allows one request per second from
+an application, so requests are paced by a token bucket and, once the server
+answers that the limit was exceeded, fail right away until it may be tried
+again rather than keep the server busy. The HTTP connection is kept open
+between requests, saving a TLS handshake per lookup.
+"""
+
+import http.client
+import json
+import socket
+import threading
+import time
+import urllib.parse
+from typing import Dict, Optional, Tuple, cast
+
+from geopy.adapters import AdapterHTTPError, BaseSyncAdapter
+from geopy.exc import (
+    GeocoderInsufficientPrivileges,
+    GeocoderParseError,
+    GeocoderRateLimited,
+    GeocoderServiceError,
+    GeocoderTimedOut,
+    GeocoderUnavailable,
+)
+from geopy.geocoders import Nominatim
+from geopy.location import Location
+
+from . import __app_name__
+from .geocoding import Geocoder, GeocoderError, NetworkRequiredError, TokenBucket
+
+NOMINATIM_DOMAIN = "nominatim.openstreetmap.org"
+
+_user_agent = __app_name__.replace(" ", "_")
+_default_retry_after = 60.0  # s, if the server does not say
+
+
+class KeepAliveAdapter(BaseSyncAdapter):
+    """geopy adapter keeping the connection to each host open between requests
+
+    urllib, which geopy falls back to, opens a new connection for every
+    request. Requests are made one at a time, proxies are not supported.
+    """
+
+    def __init__(self, *, proxies=None, ssl_context=None):
+        super().__init__(proxies=proxies, ssl_context=ssl_context)
+        self._ssl_context = ssl_context
+        self._connections: Dict[Tuple[str, str], http.client.HTTPConnection] = {}
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+
+    def get_json(self, url, *, timeout, headers):
+        text = self.get_text(url, timeout=timeout, headers=headers)
+        try:
+            return json.loads(text)
+        except ValueError:
+            raise GeocoderParseError(f"Could not parse response:\n{text}")
+
+    def get_text(self, url, *, timeout, headers):
+        parts = urllib.parse.urlsplit(url)
+        target = urllib.parse.urlunsplit(("", "", parts.path, parts.query, ""))
+        with self._lock:
+            response, body = self._request(
+                parts.scheme, parts.netloc, target, timeout, headers
+            )
+
+        text = body.decode(response.headers.get_content_charset() or "utf-8")
+        if response.status >= 400:
+            raise AdapterHTTPError(
+                f"Non-successful status code {response.status}",
+                status_code=response.status,
+                headers={name.lower(): value for name, value in response.getheaders()},
+                text=text,
+            )
+        return text
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections.values():
+                connection.close()
+            self._connections.clear()
+
+    def _request(
+        self, scheme: str, host: str, target: str, timeout: float, headers: dict
+    ) -> Tuple[http.client.HTTPResponse, bytes]:
+        key = (scheme, host)
+        # a kept connection may have been closed by the server meanwhile
+        is_reused = key in self._connections
+        while True:
+            connection = self._connections.get(key)
+            if connection is None:
+                connection = self._open(scheme, host, timeout)
+                self._connections[key] = connection
+            elif connection.sock:
+                connection.sock.settimeout(timeout)
+            try:
+                connection.request("GET", target, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except socket.timeout:
+                self._discard(key)
+                raise GeocoderTimedOut("Service timed out")
+            except (http.client.HTTPException, OSError) as e:
+                self._discard(key)
+                if is_reused:
+                    is_reused = False
+                    continue
+                if isinstance(e, OSError):
+                    raise GeocoderUnavailable(f"Service not available: {e}")
+                raise GeocoderServiceError(str(e))
+            if response.will_close:
+                self._discard(key)
+            return response, body
+
+    def _open(
+        self, scheme: str, host: str, timeout: float
+    ) -> http.client.HTTPConnection:
+        self.connections_opened += 1
+        if scheme == "https":
+            return http.client.HTTPSConnection(
+                host, timeout=timeout, context=self._ssl_context
+            )
+        return http.client.HTTPConnection(host, timeout=timeout)
+
+    def _discard(self, key: Tuple[str, str]):
+        connection = self._connections.pop(key, None)
+        if connection:
+            connection.close()
+
+
+class NominatimClient:
+    """Reverse geocodes with Nominatim, within its usage policy
+
+    Methods may be called from any thread, requests are made one at a time.
+    """
+
+    def __init__(
+        self,
+        domain: str = NOMINATIM_DOMAIN,
+        scheme: str = "https",
+        rate: float = 1.0,  # requests per s
+        timeout: float = 10.0,  # s
+    ):
+        self._bucket = TokenBucket(rate)
+        self._adapter = KeepAliveAdapter()
+        self._geolocator = Nominatim(
+            domain=domain,
+            scheme=scheme,
+            user_agent=_user_agent,
+            timeout=timeout,
+            adapter_factory=lambda proxies, ssl_context: self._adapter,
+        )
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0  # time.monotonic()
+
+    @property
+    def connections_opened(self) -> int:
+        return self._adapter.connections_opened
+
+    def reverse(self, latitude: float, longitude: float) -> Optional[str]:
+        """Location string like "Country-State-City", see Geocoder.reverse()"""
+        with self._lock:
+            self._check_blocked()
+            self._bucket.acquire()
+            try:
+                location = cast(
+                    Optional[Location],
+                    self._geolocator.reverse(
+                        (latitude, longitude),
+                        language="en-US,en",
+                        exactly_one=True,
+                        zoom=10,  # limit to city region
+                    ),
+                )
+            except GeocoderRateLimited as e:
+                self._blocked_until = time.monotonic() + (
+                    e.retry_after or _default_retry_after
+                )
+                raise GeocoderError(f"Nominatim rate limit exceeded: {e}")
+            except GeocoderInsufficientPrivileges as e:
+                # what Nominatim answers clients it blocked
+                self._blocked_until = time.monotonic() + _default_retry_after
+                raise GeocoderError(f"Nominatim denied access: {e}")
+            except Exception as e:
+                raise GeocoderError(str(e))
+
+        if not location or not getattr(location, "address", None):
+            return None
+
+        return "-".join(reversed(location.address.split(", "))).replace(" ", "_")
+
+    def close(self):
+        self._adapter.close()
+
+    def _check_blocked(self):
+        remaining = self._blocked_until - time.monotonic()
+        if remaining > 0:
+            raise GeocoderError(
+                f"Nominatim rate limit exceeded, retrying in {remaining:.0f} s"
+            )
+
+
+_shared_client: Optional[NominatimClient] = None
+_shared_client_lock = threading.Lock()
+
+
+def get_nominatim_client() -> NominatimClient:
+    """The client shared by the app, so that the rate limit holds app-wide"""
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            _shared_client = NominatimClient()
+        return _shared_client
+
+
+class NominatimGeocoder(Geocoder):
+    """Queries OSM Nominatim, one blocking request per lookup"""
+
+    def __init__(self, client: Optional[NominatimClient] = None):
+        self._client = client or get_nominatim_client()
+
+    def reverse(
+        self, latitude: float, longitude: float, offline_only: bool = False
+    ) -> Optional[str]:
+        if offline_only:
+            raise NetworkRequiredError("Nominatim is an online service")
+        return self._client.reverse(latitude, longitude)
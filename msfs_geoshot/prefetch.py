@@ -0,0 +1,151 @@
+"""
+Prefetching of the locations ahead of the aircraft into the geocode cache
+
+The leg from the aircraft to the next waypoint of the flight plan is sampled
+at points closer together than the cells of the cache, nearest first, and the
+cells not cached yet are looked up in the background. Screenshots taken
+further along the leg then find their location in the cache instead of
+waiting for the network.
+"""
+
+import math
+import threading
+from typing import Callable, List, Optional, Tuple
+
+from . import DEBUG
+from .geo import EARTH_RADIUS, destination_point, haversine_distance, initial_bearing
+from .geocoding import CachedGeocoder, GeocoderError, TokenBucket
+from .telemetry import TelemetrySample
+
+
+def sample_leg(
+    latitude: float,
+    longitude: float,
+    dest_latitude: float,
+    dest_longitude: float,
+    step: float,
+    max_distance: float,
+) -> List[Tuple[float, float]]:
+    """Points every step m along the great circle to the destination, up to
+    max_distance m away, starting at and ending at the destination if within"""
+    distance = haversine_distance(latitude, longitude, dest_latitude, dest_longitude)
+    bearing = initial_bearing(latitude, longitude, dest_latitude, dest_longitude)
+    points = [(latitude, longitude)]
+    count = int(min(distance, max_distance) // step)
+    points.extend(
+        destination_point(latitude, longitude, bearing, index * step)
+        for index in range(1, count + 1)
+    )
+    if distance <= max_distance:
+        points.append((dest_latitude, dest_longitude))
+    return points
+
+
+class GeocodePrefetcher:
+    """Looks up the locations along the current leg in the background
+
+    Lookups go through the cache, and with it the rate limit of the geocoder
+    it wraps, and are limited to budget per hour on top, so that a long leg
+    does not keep the geocoder busy. Nothing is looked up while disabled,
+    e.g. when file names do not contain the location, or while the aircraft
+    is not moving.
+    """
+
+    _interval = 10.0  # s between looking ahead
+    _backoff = 120.0  # s, after a failed lookup
+    _min_speed = 10.0  # m/s
+
+    def __init__(
+        self,
+        geocoder: CachedGeocoder,
+        get_sample: Callable[[], Optional[TelemetrySample]],
+        lookahead: float = 600.0,  # s
+        max_distance: float = 100000.0,  # m
+        budget: float = 120.0,  # lookups per hour
+        burst: float = 20.0,  # lookups
+    ):
+        self._geocoder = geocoder
+        self._get_sample = get_sample
+        self._lookahead = lookahead
+        self._max_distance = max_distance
+        self._budget = TokenBucket(budget / 3600.0, burst)
+        self.is_enabled = True
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.lookups = 0  # made so far
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="GeocodePrefetcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        # a lookup in flight is not waited for
+        self._stop_event.set()
+        self._thread = None
+
+    def prefetch(self, sample: TelemetrySample) -> int:
+        """Look up the cells ahead of sample not cached yet, within budget
+
+        Returns:
+            Number of lookups made
+
+        Raises:
+            GeocoderError: if a lookup failed
+        """
+        if (
+            sample.dest_latitude is None
+            or sample.dest_longitude is None
+            or sample.speed < self._min_speed
+        ):
+            return 0
+
+        # half a cell apart, also where longitudes are closest together
+        cell_length = math.radians(self._geocoder.cell_size) * EARTH_RADIUS
+        step = cell_length * max(0.1, math.cos(math.radians(sample.latitude))) / 2
+        points = sample_leg(
+            sample.latitude,
+            sample.longitude,
+            sample.dest_latitude,
+            sample.dest_longitude,
+            step=step,
+            max_distance=min(self._max_distance, sample.speed * self._lookahead),
+        )
+
+        lookups = 0
+        visited = set()
+        for latitude, longitude in points:
+            cell = self._geocoder.cell(latitude, longitude)
+            if cell in visited:
+                continue
+            visited.add(cell)
+            if self._stop_event.is_set():
+                break
+            # failures are cached too, and retried once they expire
+            if self._geocoder.is_cached(latitude, longitude):
+                continue
+            if not self._budget.acquire(timeout=0):
+                break
+            self._geocoder.reverse(latitude, longitude)
+            lookups += 1
+            self.lookups += 1
+        return lookups
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval):
+            sample = self._get_sample()
+            if not self.is_enabled or sample is None:
+                continue
+            try:
+                lookups = self.prefetch(sample)
+            except GeocoderError as e:
+                if DEBUG:
+                    print(f"Prefetching locations paused: {e}")
+                self._stop_event.wait(self._backoff)
+                continue
+            if DEBUG and lookups:
+                print(f"Prefetched {lookups} locations ahead")
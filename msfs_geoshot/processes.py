@@ -0,0 +1,59 @@
+import time
+from typing import Optional
+
+import psutil
+
+
+class ProcessWatcher:
+    """Keeps track of a process by name without enumerating all processes on
+    every query
+
+    The PID is cached once found and only verified via pid_exists. While the
+    process is not running, scans are spaced out with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        process_name: str,
+        min_scan_interval: float = 2.0,  # s
+        max_scan_interval: float = 30.0,  # s
+    ):
+        self._process_name = process_name
+        self._min_scan_interval = min_scan_interval
+        self._max_scan_interval = max_scan_interval
+        self._scan_interval = min_scan_interval
+        self._next_scan = 0.0
+        self._pid: Optional[int] = None
+
+    @property
+    def pid(self) -> Optional[int]:
+        """Cached PID if the process is still alive. Never scans processes."""
+        pid = self._pid
+        if pid is not None and not psutil.pid_exists(pid):
+            self._pid = pid = None
+        return pid
+
+    def poll(self) -> Optional[int]:
+        """Like pid, but looks for the process if it is due for a scan"""
+        pid = self.pid
+        if pid is not None:
+            return pid
+
+        now = time.monotonic()
+        if now < self._next_scan:
+            return None
+
+        self._pid = pid = self._scan()
+        if pid is None:
+            self._next_scan = now + self._scan_interval
+            self._scan_interval = min(self._scan_interval * 2, self._max_scan_interval)
+        else:
+            self._scan_interval = self._min_scan_interval
+        return pid
+
+    def _scan(self) -> Optional[int]:
+        for process in psutil.process_iter(["name"]):
+            if process.info["name"] == self._process_name:
+                # assumes there is only one process to look at
+                return process.pid
+        return None
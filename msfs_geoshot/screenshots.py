@@ -1,13 +1,18 @@
+import time
 from dataclasses import asdict, dataclass
 from enum import Enum
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Any, Dict, NamedTuple, Optional, Set
 
-from PIL import ImageGrab
+from PIL import Image, ImageGrab
+from PIL.PngImagePlugin import PngInfo
 
 from . import __app_name__
+from .codec import MetadataCodec
+from .exif import jpeg_xmp_segment
+from .metadata import Metadata
 from .names import FileNameComposer
-from .windows import WindowRectangle
+from .window_cache import WindowRectangle
 
 
 class ImageFormat(Enum):
@@ -16,6 +21,11 @@ class ImageFormat(Enum):
     PNG = "png"
 
 
+class Screenshot(NamedTuple):
+    image: Image.Image
+    timestamp: float  # time grabbing the image completed
+
+
 @dataclass
 class _ImageFormatSettings:
     quality: Optional[int] = None
@@ -42,47 +52,75 @@ class ScreenshotService:
         ),
     }
 
+    # Formats Metadata can be embedded into while saving. Pillow 8 flattens
+    # EXIF sub-IFDs when writing TIFF, so TIFF is left to exiftool.
+    _embedded_metadata_formats: Set[ImageFormat] = {ImageFormat.JPEG, ImageFormat.PNG}
+
     def __init__(self, file_name_composer: FileNameComposer):
         self._file_name_composer = file_name_composer
+        self._metadata_codec = MetadataCodec()
+
+    def grab(self, window_rectangle: Optional[WindowRectangle] = None) -> Screenshot:
+        if window_rectangle:
+            image = ImageGrab.grab(bbox=window_rectangle, all_screens=True)
+        else:
+            image = ImageGrab.grab()  # full screen
+        return Screenshot(image=image, timestamp=time.time())
 
-    def take_screenshot(
+    def save(
         self,
+        screenshot: Screenshot,
         target_folder: Path,
         name: str,
-        window_rectangle: Optional[WindowRectangle] = None,
         image_format: ImageFormat = ImageFormat.JPEG,
+        metadata: Optional[Metadata] = None,
     ) -> Path:
+        """
+        Args:
+            metadata: Metadata to embed, for formats that can_embed_metadata()
+        """
         if not target_folder.is_dir():
             target_folder.mkdir(parents=True, exist_ok=True)
 
         extension = image_format.value
         out_path = target_folder / f"{name}.{extension}"
 
-        self._grab_screenshot(
-            window_rectangle=window_rectangle,
-            out_path=out_path,
-            image_format=image_format,
-        )
-
-        return out_path
-
-    def _grab_screenshot(
-        self,
-        window_rectangle: Optional[WindowRectangle],
-        out_path: Path,
-        image_format: ImageFormat,
-    ):
-        if window_rectangle:
-            image = ImageGrab.grab(bbox=window_rectangle, all_screens=True)
-        else:
-            image = ImageGrab.grab()  # full screen
-
         image_format_settings = self._settings_by_image_format[image_format]
         image_format_settings_dict = asdict(image_format_settings)
-        keyword_arguments = {
+        keyword_arguments: Dict[str, Any] = {
             key: value
             for key, value in image_format_settings_dict.items()
             if value is not None
         }
+        if metadata:
+            keyword_arguments.update(
+                self._get_metadata_arguments(metadata, image_format)
+            )
+
+        screenshot.image.save(
+            str(out_path), format=image_format.name, **keyword_arguments
+        )
+
+        return out_path
+
+    def can_embed_metadata(self, image_format: ImageFormat) -> bool:
+        return image_format in self._embedded_metadata_formats
+
+    def _get_metadata_arguments(
+        self, metadata: Metadata, image_format: ImageFormat
+    ) -> Dict[str, Any]:
+        if not self.can_embed_metadata(image_format):
+            raise ValueError(f"Cannot embed metadata into {image_format.name}")
+
+        encoded = self._metadata_codec.encode(
+            metadata, with_exiftool_arguments=False, with_json=False
+        )
+        assert encoded.exif and encoded.xmp
+        exif, xmp = encoded.exif, encoded.xmp
+
+        if image_format == ImageFormat.PNG:
+            png_info = PngInfo()
+            png_info.add_itxt("XML:com.adobe.xmp", xmp.decode("utf-8"))
+            return {"exif": exif, "pnginfo": png_info}
 
-        image.save(str(out_path), format=image_format.name, **keyword_arguments)
+        return {"exif": exif, "extra": jpeg_xmp_segment(xmp)}
@@ -6,23 +6,44 @@ Copyright (C) 2020 Luuk3333 <https://github.com/Luuk3333/msfs-screenshot-gps-dat
 Used under the GNU Affero General Public License v3.0
 """
 
+import ctypes
+import threading
 import time
 import traceback
 import warnings
 from dataclasses import asdict, dataclass
-from typing import Any, Dict, List, Optional, Set
-import math
-
-import psutil
-from SimConnect import AircraftRequests, SimConnect
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Set
+
+from PyQt5.QtCore import QObject, pyqtSignal
+from SimConnect import SimConnect
+from SimConnect.Constants import SIMCONNECT_OBJECT_ID_USER, SIMCONNECT_UNUSED
+from SimConnect.Enum import (
+    SIMCONNECT_DATA_REQUEST_FLAG,
+    SIMCONNECT_RECV_ID,
+    SIMCONNECT_RECV_SIMOBJECT_DATA,
+    SIMCONNECT_SIMOBJECT_TYPE,
+)
 
-from .metadata import EXIF_DATE_FORMAT, EXIF_OFFSET_FORMAT, Metadata
-from .time import (
-    get_datetime_string,
-    get_local_offset_delta,
-    string_format_time_delta,
+from .metadata import Metadata, sample_to_metadata
+from .processes import ProcessWatcher
+from .simvars import CAPTURE_SIM_VARS, SimVarDefinition, SimVarPeriod
+from .telemetry import (
+    RateController,
+    TelemetryError,
+    TelemetrySample,
+    TelemetrySampler,
+    TelemetrySource,
+    estimate_sample,
+)
+from .timezones import TimezoneIndex
+from .tracks import TrackRecorder
+from .window_cache import (
+    WindowBackend,
+    WindowCache,
+    WindowCacheError,
+    WindowRectangle,
 )
-from .windows import get_window_ids_by_process_name, get_window_title_by_window_id
 
 
 class SimServiceError(Exception):
@@ -31,6 +52,7 @@ class SimServiceError(Exception):
 
 @dataclass
 class _RawSimData:
+    # fields correspond to CAPTURE_SIM_VARS
     # GPS
     latitude: Optional[float]  # degrees
     longitude: Optional[float]  # degrees
@@ -43,32 +65,275 @@ class _RawSimData:
     aircraft_type: Optional[bytes]
 
 
-@dataclass
-class _SimData:
-    # GPS
-    latitude: float  # degrees
-    longitude: float  # degrees
-    altitude: float  # m
-    speed: float  # m/s
-    heading: float
-    dest_latitude: Optional[float]  # radians
-    dest_longitude: Optional[float]  # radians
-    # Misc
-    aircraft_type: Optional[str]
+_nullable_sim_data: Set[str] = set(("dest_latitude", "dest_longitude", "aircraft_type"))
 
+_sim_var_definition = SimVarDefinition(CAPTURE_SIM_VARS)
 
-_nullable_sim_data: Set[str] = set(("dest_latitude", "dest_longitude", "aircraft_type"))
 
+class _BatchedSimConnect(SimConnect):
+    """SimConnect session which fetches a whole SimVarDefinition per request
 
-class SimService:
+    AircraftRequests registers one data definition per variable and thus
+    needs one request/response round trip for each of them.
+    """
 
-    _sim_executable = "FlightSimulator.exe"
-    _sim_window_title = "Microsoft Flight Simulator"
+    def __init__(self, definition: SimVarDefinition):
+        self._definition = definition
+        self._definition_id: Optional[int] = None
+        self._request_id: Optional[int] = None
+        self._data: Optional[bytes] = None
+        self._data_received = threading.Event()
+        self.round_trips = 0
+
+        super().__init__()  # connects
+
+        self._definition_id = self.new_def_id().value
+        self._request_id = self.new_request_id().value
+
+        for sim_var in definition.sim_vars:
+            error = self.dll.AddToDataDefinition(
+                self.hSimConnect,
+                self._definition_id,
+                sim_var.name.encode(),
+                sim_var.unit.encode() if sim_var.unit else None,
+                sim_var.data_type.value,
+                0,
+                SIMCONNECT_UNUSED,
+            )
+            if not self.IsHR(error, 0):
+                self.exit()
+                raise ConnectionError(
+                    f"Could not define simulation variable: {sim_var}"
+                )
+
+    def request(self, timeout: float = 1.0) -> Dict[str, Any]:
+        self._data_received.clear()
+        self.dll.RequestDataOnSimObjectType(
+            self.hSimConnect,
+            self._request_id,
+            self._definition_id,
+            0,
+            SIMCONNECT_SIMOBJECT_TYPE.SIMCONNECT_SIMOBJECT_TYPE_USER,
+        )
+        self.round_trips += 1
+        return self.receive(timeout)
+
+    def subscribe(self, period: SimVarPeriod):
+        self.dll.RequestDataOnSimObject(
+            self.hSimConnect,
+            self._request_id,
+            self._definition_id,
+            SIMCONNECT_OBJECT_ID_USER,
+            period.value,
+            SIMCONNECT_DATA_REQUEST_FLAG.SIMCONNECT_DATA_REQUEST_FLAG_DEFAULT.value,
+            0,
+            0,
+            0,
+        )
+
+    def receive(self, timeout: float = 1.0) -> Dict[str, Any]:
+        """Wait for the next data block, be it requested or subscribed to"""
+        if not self._data_received.wait(timeout) or self._data is None:
+            raise TelemetryError("Timed out waiting for data from SimConnect")
+        self._data_received.clear()
+        return self._definition.decode(self._data)
+
+    def my_dispatch_proc(self, pData, cbData, pContext):
+        dwID = pData.contents.dwID
+        if self._request_id is not None and dwID in (
+            SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_SIMOBJECT_DATA,
+            SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_SIMOBJECT_DATA_BYTYPE,
+        ):
+            object_data = ctypes.cast(
+                pData, ctypes.POINTER(SIMCONNECT_RECV_SIMOBJECT_DATA)
+            ).contents
+            if object_data.dwRequestID == self._request_id:
+                self._data = ctypes.string_at(
+                    ctypes.addressof(object_data)
+                    + SIMCONNECT_RECV_SIMOBJECT_DATA.dwData.offset,
+                    self._definition.size,
+                )
+                self._data_received.set()
+                return
+        return super().my_dispatch_proc(pData, cbData, pContext)
+
+
+class SimConnectSource(TelemetrySource):
+    def __init__(
+        self,
+        process_watcher: Optional[ProcessWatcher],
+        subscription_period: Optional[SimVarPeriod] = None,
+        session_factory: Callable[[SimVarDefinition], Any] = _BatchedSimConnect,
+    ):
+        """
+        Args:
+            process_watcher: Watcher of the simulator process, checked before
+                connecting and on every read. None to skip the check
+            subscription_period: Have SimConnect push data periodically instead
+                of requesting it for every read
+            session_factory: Opens a session, either _BatchedSimConnect or a
+                stand-in such as debug.MockSimConnect
+        """
+        self._process_watcher = process_watcher
+        self._subscription_period = subscription_period
+        self._session_factory = session_factory
+        self._session: Optional[Any] = None
+
+    def connect(self):
+        if self._process_watcher and self._process_watcher.poll() is None:
+            raise TelemetryError("Simulator is not running")
 
-    def _is_sim_running(self) -> bool:
-        return self._sim_executable in (p.name() for p in psutil.process_iter())
+        try:
+            self._session = self._session_factory(_sim_var_definition)
+        except ConnectionError as e:
+            traceback.print_exc()
+            raise TelemetryError("Could not connect to SimConnect")
+
+        if self._subscription_period:
+            self._session.subscribe(self._subscription_period)
+
+    def disconnect(self):
+        session = self._session
+        self._session = None
+        if session:
+            session.exit()
+
+    def read(self) -> TelemetrySample:
+        session = self._session
+        if not session:
+            raise ConnectionError("Not connected to SimConnect")
+        if self._process_watcher and self._process_watcher.pid is None:
+            raise ConnectionError("Simulator is no longer running")
+
+        try:
+            if self._subscription_period:
+                values = session.receive()
+            else:
+                values = session.request()
+        except TelemetryError:
+            if session.quit:
+                raise ConnectionError("Simulator closed the SimConnect session")
+            raise
+
+        return _raw_sim_data_to_sample(_RawSimData(**values), time.time())
+
+
+def _raw_sim_data_to_sample(
+    raw_sim_location_data: _RawSimData, timestamp: float
+) -> TelemetrySample:
+    null_values = {
+        key: value
+        for key, value in asdict(raw_sim_location_data).items()
+        if key not in _nullable_sim_data and value is None
+    }
+
+    if null_values:
+        raise TelemetryError(
+            f"Got invalid location data from SimConnect for the following values: {null_values}"
+        )
 
-    def _is_user_in_flight(self, sim_location_data: _SimData) -> bool:
+    sim_location_data_dict: Dict[str, Any] = {}
+
+    for key, value in asdict(raw_sim_location_data).items():
+        if isinstance(value, bytes):
+            try:
+                value = value.decode("utf-8")
+            except Exception:
+                value = value.decode("ascii")
+        sim_location_data_dict[key] = value
+
+    return TelemetrySample(timestamp=timestamp, **sim_location_data_dict)
+
+
+class SimService(QObject):
+
+    connected = pyqtSignal()
+    disconnected = pyqtSignal()
+
+    _sim_executable = "FlightSimulator.exe"
+    _sim_window_title = "Microsoft Flight Simulator"
+    _max_sample_age = 2.0  # s
+    # covers the settle time of watched folders plus a backlog of files to tag
+    _history_duration = 15.0  # s
+
+    def __init__(
+        self,
+        source: Optional[TelemetrySource] = None,
+        window_backend: Optional[WindowBackend] = None,
+        rate_controller: Optional[RateController] = None,
+        parent: Optional[QObject] = None,
+    ):
+        super().__init__(parent)
+        if not window_backend:
+            # imported here to keep replays and benchmarks usable without win32
+            from .windows import Win32WindowBackend
+
+            window_backend = Win32WindowBackend()
+        self._window_cache = WindowCache(
+            backend=window_backend,
+            window_title=self._sim_window_title,
+        )
+        self._process_watcher = ProcessWatcher(self._sim_executable)
+        self._sampler = TelemetrySampler(
+            source=source or SimConnectSource(self._process_watcher),
+            on_connection_changed=self._on_connection_changed,
+            rate_controller=rate_controller
+            or RateController(is_in_flight=self._is_user_in_flight),
+            history_duration=self._history_duration,
+        )
+        self._track_recorder: Optional[TrackRecorder] = None
+        # dates are local to the aircraft's position if set, else to this PC
+        self.timezones: Optional[TimezoneIndex] = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self._sampler.is_connected
+
+    @property
+    def is_recording(self) -> bool:
+        return self._track_recorder is not None
+
+    def start(self):
+        self._sampler.start()
+
+    def stop(self):
+        self._sampler.stop()
+        self.stop_recording()
+
+    def start_recording(self, path: Path):
+        """Record every telemetry sample taken while in flight to a track file"""
+        if self._track_recorder:
+            raise SimServiceError("Already recording a flight track")
+        self._track_recorder = TrackRecorder(path)
+        self._sampler.add_listener(self._on_sample)
+
+    def stop_recording(self) -> Optional[Path]:
+        """
+        Returns:
+            Path of the track file written, if recording
+        """
+        track_recorder = self._track_recorder
+        if not track_recorder:
+            return None
+        self._sampler.remove_listener(self._on_sample)
+        self._track_recorder = None
+        track_recorder.close()
+        return track_recorder.path
+
+    def _on_sample(self, sample: TelemetrySample):
+        # called from the sampler thread
+        track_recorder = self._track_recorder
+        if track_recorder and self._is_user_in_flight(sample):
+            track_recorder.add(sample)
+
+    def _on_connection_changed(self, is_connected: bool):
+        # called from the sampler thread, signals are queued to receivers
+        if is_connected:
+            self.connected.emit()
+        else:
+            self.disconnected.emit()
+
+    def _is_user_in_flight(self, sim_location_data: TelemetrySample) -> bool:
         return not (
             abs(sim_location_data.latitude) < 0.1
             and abs(sim_location_data.longitude) < 0.1
@@ -76,101 +341,66 @@ class SimService:
         )
 
     def get_simulator_main_window_id(self) -> int:
-        window_ids = get_window_ids_by_process_name(self._sim_executable)
-        results: List[int] = []
-        for window_id in window_ids:
-            if self._sim_window_title in get_window_title_by_window_id(window_id):
-                results.append(window_id)
-        if len(results) > 1:
-            raise SimServiceError("Could not uniquely identify main simulator window.")
-        elif not results:
-            raise SimServiceError("Could not find simulator window.")
-        return results[0]
-
-    def get_flight_data(self) -> Optional[Metadata]:
-        if not self._is_sim_running():
+        process_id = self._process_watcher.pid
+        if process_id is None:
             raise SimServiceError("Simulator is not running")
-
         try:
-            sim_connect = SimConnect()
-        except ConnectionError as e:
-            traceback.print_exc()
-            raise SimServiceError("Could not connect to SimConnect")
-
-        aircraft_requests = AircraftRequests(sim_connect)
-
-        raw_sim_location_data = _RawSimData(
-            latitude=aircraft_requests.get("GPS_POSITION_LAT"),
-            longitude=aircraft_requests.get("GPS_POSITION_LON"),
-            altitude=aircraft_requests.get("GPS_POSITION_ALT"),
-            speed=aircraft_requests.get("GPS_GROUND_SPEED"),
-            heading=aircraft_requests.get("GPS_GROUND_TRUE_HEADING"),
-            dest_latitude=aircraft_requests.get("GPS_WP_NEXT_LAT"),
-            dest_longitude=aircraft_requests.get("GPS_WP_NEXT_LON"),
-            aircraft_type=aircraft_requests.get("TITLE"),
-        )
-        # TITLE
-
-        sim_connect.exit()
+            return self._window_cache.get_window_id(process_id)
+        except WindowCacheError as e:
+            raise SimServiceError(str(e))
 
-        null_values = {
-            key: value
-            for key, value in asdict(raw_sim_location_data).items()
-            if key not in _nullable_sim_data and value is None
-        }
+    def get_simulator_window_rectangle(self, window_id: int) -> WindowRectangle:
+        return self._window_cache.get_rectangle(window_id)
 
-        if null_values:
+    def get_latest_sample(self) -> Optional[TelemetrySample]:
+        """Most recent telemetry sample, if connected"""
+        if not self._sampler.is_connected:
+            return None
+        return self._sampler.latest()
+
+    def get_flight_data(self, timestamp: Optional[float] = None) -> Optional[Metadata]:
+        """
+        Args:
+            timestamp: Time the returned position should correspond to, e.g.
+                the moment a screenshot was grabbed. Defaults to now.
+        """
+        if not self._sampler.is_connected:
+            raise SimServiceError("Not connected to simulator")
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        samples = self._sampler.history()
+
+        if not samples:
+            raise SimServiceError("No valid data received from SimConnect yet")
+        elif (
+            timestamp - samples[-1].timestamp
+            > self._max_sample_age + self._sampler.interval
+        ):
+            raise SimServiceError("Data received from SimConnect is out of date")
+        elif timestamp < samples[0].timestamp - self._max_sample_age:
+            # e.g. an image created in a watched folder long before it settled
             raise SimServiceError(
-                f"Got invalid location data from SimConnect for the following values: {null_values}"
+                "Data received from SimConnect does not reach back that far"
             )
 
-        sim_location_data_dict: Dict[str, Any] = {}
-
-        for key, value in asdict(raw_sim_location_data).items():
-            if isinstance(value, bytes):
-                try:
-                    value = value.decode("utf-8")
-                except Exception:
-                    value = value.decode("ascii")
-            sim_location_data_dict[key] = value
-
-        sim_location_data = _SimData(**sim_location_data_dict)
+        try:
+            sim_location_data, sample_age = estimate_sample(
+                samples, timestamp, max_extrapolation=self._max_sample_age
+            )
+        except TelemetryError as e:
+            raise SimServiceError(str(e))
 
         if not self._is_user_in_flight(sim_location_data):
             warnings.warn("User is not currently in flight.")
             return None
 
-        return self._sim_location_to_metadata(sim_location_data)
-
-    def _sim_location_to_metadata(self, sim_location_data: _SimData) -> Metadata:
-        description = sim_location_data.aircraft_type
-        capture_time = time.time()
-
-        datetime_string = get_datetime_string(
-           capture_time, date_format=EXIF_DATE_FORMAT
-        )
-        offset_timedelta = get_local_offset_delta()
-        offset_time = string_format_time_delta(offset_timedelta, EXIF_OFFSET_FORMAT)
-
-        return Metadata(
-            # Internal
-            capture_time = capture_time,
-            # Date
-            AllDates=datetime_string,
-            OffsetTime=offset_time,
-            # GPS
-            GPSLatitude=round(sim_location_data.latitude, 5),
-            GPSLongitude=round(sim_location_data.longitude, 5),
-            GPSAltitude=round(sim_location_data.altitude, 2),
-            GPSSpeed=round(sim_location_data.speed * 3.6, 2),  # m/s to km/h
-            GPSImgDirection=round(math.degrees(sim_location_data.heading), 5),
-            GPSDestLongitude=round(sim_location_data.dest_longitude, 5)
-            if sim_location_data.dest_longitude
-            else None,
-            GPSDestLatitude=round(sim_location_data.dest_latitude, 5)
-            if sim_location_data.dest_latitude
-            else None,
-            # MISC
-            Description=description,
-            ImageDescription=description,
+        timezone = (
+            self.timezones.get_timezone(
+                sim_location_data.latitude, sim_location_data.longitude
+            )
+            if self.timezones
+            else None
         )
+        return sample_to_metadata(sim_location_data, sample_age, timezone=timezone)
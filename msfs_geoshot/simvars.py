@@ -0,0 +1,83 @@
+import ctypes
+from enum import Enum
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Type
+
+
+class SimVarType(Enum):
+    # values correspond to SIMCONNECT_DATATYPE
+    float64 = 4
+    string256 = 9
+
+
+class SimVarPeriod(Enum):
+    # values correspond to SIMCONNECT_PERIOD
+    visual_frame = 2
+    sim_frame = 3
+    second = 4
+
+
+_ctypes_by_sim_var_type: Dict[SimVarType, Any] = {
+    SimVarType.float64: ctypes.c_double,
+    SimVarType.string256: ctypes.c_char * 256,
+}
+
+
+class SimVar(NamedTuple):
+    field: str  # name of the field the value is stored under
+    name: str  # SimConnect simulation variable, e.g. "GPS POSITION LAT"
+    unit: Optional[str]  # None for strings
+    data_type: SimVarType = SimVarType.float64
+
+
+class SimVarDefinition:
+    """Packed record layout of a list of simulation variables
+
+    SimConnect returns all variables of a data definition as a single
+    contiguous block without padding, in order of definition. Mapping that
+    block onto a ctypes structure lets us decode any number of variables
+    from a single response.
+    """
+
+    def __init__(self, sim_vars: Iterable[SimVar]):
+        self.sim_vars = tuple(sim_vars)
+        self._structure: Type[ctypes.Structure] = type(
+            "_SimVarRecord",
+            (ctypes.Structure,),
+            {
+                "_pack_": 1,
+                "_fields_": [
+                    (sim_var.field, _ctypes_by_sim_var_type[sim_var.data_type])
+                    for sim_var in self.sim_vars
+                ],
+            },
+        )
+
+    @property
+    def size(self) -> int:
+        return ctypes.sizeof(self._structure)
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        record = self._structure.from_buffer_copy(data[: self.size])
+        return {
+            sim_var.field: getattr(record, sim_var.field) for sim_var in self.sim_vars
+        }
+
+    def encode(self, values: Dict[str, Any]) -> bytes:
+        record = self._structure(
+            **{sim_var.field: values[sim_var.field] for sim_var in self.sim_vars}
+        )
+        return ctypes.string_at(ctypes.addressof(record), self.size)
+
+
+# Fetched as a single data definition, so adding variables here does not add
+# any further round trips
+CAPTURE_SIM_VARS: List[SimVar] = [
+    SimVar("latitude", "GPS POSITION LAT", "degrees"),
+    SimVar("longitude", "GPS POSITION LON", "degrees"),
+    SimVar("altitude", "GPS POSITION ALT", "meters"),
+    SimVar("speed", "GPS GROUND SPEED", "meters per second"),
+    SimVar("heading", "GPS GROUND TRUE HEADING", "radians"),
+    SimVar("dest_latitude", "GPS WP NEXT LAT", "degrees"),
+    SimVar("dest_longitude", "GPS WP NEXT LON", "degrees"),
+    SimVar("aircraft_type", "TITLE", None, SimVarType.string256),
+]
@@ -0,0 +1,353 @@
+import bisect
+import threading
+import traceback
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass, replace
+from typing import Callable, Deque, List, Optional, Sequence, Tuple
+
+from . import DEBUG
+from .geo import destination_point, interpolate_angle, interpolate_longitude
+
+
+class TelemetryError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class TelemetrySample:
+    timestamp: float  # seconds since epoch, time the sample was read
+    # GPS
+    latitude: float  # degrees
+    longitude: float  # degrees
+    altitude: float  # m
+    speed: float  # m/s
+    heading: float  # aircraft (not camera!) heading, radians
+    dest_latitude: Optional[float]  # degrees
+    dest_longitude: Optional[float]  # degrees
+    # Misc
+    aircraft_type: Optional[str]
+
+
+class TelemetrySource(ABC):
+    """Provider of telemetry samples, e.g. a SimConnect session
+
+    connect() and read() raise TelemetryError on recoverable issues (simulator
+    not running, invalid data) and ConnectionError once an established
+    connection has been lost.
+    """
+
+    @abstractmethod
+    def connect(self):
+        pass
+
+    @abstractmethod
+    def read(self) -> TelemetrySample:
+        pass
+
+    @abstractmethod
+    def disconnect(self):
+        pass
+
+
+class RateController:
+    """Adapts the sampling interval to the flight phase
+
+    While the aircraft moves, the interval is chosen so that the distance
+    flown between two samples stays around target_error, allowing for larger
+    errors the higher the aircraft flies. Fast, low flight is thus sampled at
+    up to 1 / min_interval Hz, while a parked or paused aircraft, or a user
+    in the menus, is only sampled every max_interval seconds.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 0.1,  # s
+        max_interval: float = 2.0,  # s
+        target_error: float = 10.0,  # m
+        altitude_scale: float = 1000.0,  # m, altitude doubling target_error
+        is_in_flight: Optional[Callable[[TelemetrySample], bool]] = None,
+    ):
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("Intervals must satisfy 0 < min_interval <= max_interval")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_error = target_error
+        self.altitude_scale = altitude_scale
+        self._is_in_flight = is_in_flight
+        self._previous: Optional[TelemetrySample] = None
+        self._interval = min_interval
+
+    @property
+    def interval(self) -> float:
+        return self._interval
+
+    def update(self, sample: Optional[TelemetrySample]) -> float:
+        """
+        Args:
+            sample: Latest sample, None if reading it failed
+
+        Returns:
+            Interval until the next sample should be taken, in s
+        """
+        if sample is None:
+            return self._interval
+
+        previous = self._previous
+        self._previous = sample
+
+        if (
+            (self._is_in_flight and not self._is_in_flight(sample))
+            or is_stationary(previous, sample)
+            or sample.speed <= 0
+        ):
+            self._interval = self.max_interval
+            return self._interval
+
+        allowed_error = self.target_error * (
+            1 + max(sample.altitude, 0) / self.altitude_scale
+        )
+        self._interval = max(
+            self.min_interval, min(self.max_interval, allowed_error / sample.speed)
+        )
+        return self._interval
+
+    def reset(self):
+        self._previous = None
+        self._interval = self.min_interval
+
+
+def is_stationary(
+    previous: Optional[TelemetrySample], sample: Optional[TelemetrySample]
+) -> bool:
+    """Whether the aircraft has not moved at all between two samples
+
+    Happens when parked, but also while the simulation is paused, in which
+    case SimConnect keeps reporting the last ground speed.
+    """
+    return (
+        previous is not None
+        and sample is not None
+        and previous.timestamp != sample.timestamp
+        and previous.latitude == sample.latitude
+        and previous.longitude == sample.longitude
+        and previous.altitude == sample.altitude
+    )
+
+
+class TelemetrySampler:
+    """Keeps a telemetry source connected and samples it on a background thread"""
+
+    def __init__(
+        self,
+        source: TelemetrySource,
+        interval: float = 0.25,  # s
+        reconnect_interval: float = 5.0,  # s
+        buffer_size: int = 32,
+        on_connection_changed: Optional[Callable[[bool], None]] = None,
+        rate_controller: Optional[RateController] = None,
+        history_duration: Optional[float] = None,  # s
+    ):
+        """
+        Args:
+            interval: Fixed sampling interval, unless rate_controller is given
+            history_duration: Keep the samples of this period rather than the
+                last buffer_size samples
+        """
+        self._history_duration = history_duration
+        self._source = source
+        self._interval = interval
+        self._rate_controller = rate_controller
+        self._reconnect_interval = reconnect_interval
+        self._on_connection_changed = on_connection_changed
+
+        self._samples: Deque[TelemetrySample] = deque(
+            maxlen=None if history_duration else buffer_size
+        )
+        self._samples_lock = threading.Lock()
+        self._listeners: List[Callable[[TelemetrySample], None]] = []
+        self._is_connected = False
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self._is_connected
+
+    @property
+    def interval(self) -> float:
+        """Current sampling interval, in s"""
+        if self._rate_controller:
+            return self._rate_controller.interval
+        return self._interval
+
+    def latest(self) -> Optional[TelemetrySample]:
+        try:
+            return self._samples[-1]
+        except IndexError:
+            return None
+
+    def history(self) -> List[TelemetrySample]:
+        """Buffered samples, oldest first"""
+        with self._samples_lock:
+            return list(self._samples)
+
+    def add_listener(self, listener: Callable[[TelemetrySample], None]):
+        """Have listener called with every new sample, on the sampler thread"""
+        self._listeners = self._listeners + [listener]
+
+    def remove_listener(self, listener: Callable[[TelemetrySample], None]):
+        self._listeners = [other for other in self._listeners if other != listener]
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="TelemetrySampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            if not self._is_connected and not self._connect():
+                self._stop_event.wait(self._reconnect_interval)
+                continue
+
+            sample: Optional[TelemetrySample] = None
+            try:
+                sample = self._source.read()
+            except ConnectionError as e:
+                print(e)
+                self._disconnect()
+                continue
+            except TelemetryError as e:
+                if DEBUG:
+                    print(e)
+            except Exception:
+                # e.g. a failing DLL call, start over rather than let the
+                # thread die with the source looking connected
+                traceback.print_exc()
+                self._disconnect()
+                self._stop_event.wait(self._reconnect_interval)
+                continue
+            else:
+                with self._samples_lock:
+                    self._samples.append(sample)
+                    if self._history_duration:
+                        oldest = sample.timestamp - self._history_duration
+                        while self._samples[0].timestamp < oldest:
+                            self._samples.popleft()
+                self._notify_listeners(sample)
+
+            if self._rate_controller:
+                self._stop_event.wait(self._rate_controller.update(sample))
+            else:
+                self._stop_event.wait(self._interval)
+
+        self._disconnect()
+
+    def _notify_listeners(self, sample: TelemetrySample):
+        for listener in self._listeners:
+            try:
+                listener(sample)
+            except Exception:
+                traceback.print_exc()
+
+    def _connect(self) -> bool:
+        try:
+            self._source.connect()
+        except TelemetryError as e:
+            if DEBUG:
+                print(e)
+            return False
+        except Exception:
+            traceback.print_exc()
+            return False
+        self._set_connected(True)
+        return True
+
+    def _disconnect(self):
+        if not self._is_connected:
+            return
+        try:
+            self._source.disconnect()
+        except Exception:
+            traceback.print_exc()
+        with self._samples_lock:
+            self._samples.clear()
+        if self._rate_controller:
+            self._rate_controller.reset()
+        self._set_connected(False)
+
+    def _set_connected(self, is_connected: bool):
+        self._is_connected = is_connected
+        if self._on_connection_changed:
+            self._on_connection_changed(is_connected)
+
+
+def estimate_sample(
+    samples: Sequence[TelemetrySample],
+    timestamp: float,
+    max_extrapolation: float = 2.0,  # s
+) -> Tuple[TelemetrySample, float]:
+    """Estimate where the aircraft was at timestamp
+
+    Interpolates between the two samples around timestamp, or dead-reckons
+    from the closest sample using its ground speed and track if timestamp
+    lies outside of the sampled period.
+
+    Args:
+        samples: Samples ordered by time, oldest first
+
+    Returns:
+        Estimated sample and its age, i.e. the time between the closest real
+        sample used and timestamp
+
+    Raises:
+        TelemetryError: If there are no samples or timestamp lies more than
+            max_extrapolation before them
+    """
+    if not samples:
+        raise TelemetryError("No samples to estimate position from")
+    if timestamp < samples[0].timestamp - max_extrapolation:
+        raise TelemetryError("Timestamp lies before the sampled period")
+
+    index = bisect.bisect_right([sample.timestamp for sample in samples], timestamp)
+
+    if 0 < index < len(samples):
+        before = samples[index - 1]
+        after = samples[index]
+        t = (timestamp - before.timestamp) / (after.timestamp - before.timestamp)
+        estimate = replace(
+            before,
+            timestamp=timestamp,
+            latitude=before.latitude + (after.latitude - before.latitude) * t,
+            longitude=interpolate_longitude(before.longitude, after.longitude, t),
+            altitude=before.altitude + (after.altitude - before.altitude) * t,
+            speed=before.speed + (after.speed - before.speed) * t,
+            heading=interpolate_angle(before.heading, after.heading, t),
+        )
+        return estimate, timestamp - before.timestamp
+
+    closest = samples[-1] if index else samples[0]
+    delta = timestamp - closest.timestamp
+    if index and len(samples) > 1 and is_stationary(samples[-2], samples[-1]):
+        return replace(closest, timestamp=timestamp), delta
+    clamped_delta = max(-max_extrapolation, min(max_extrapolation, delta))
+    latitude, longitude = destination_point(
+        closest.latitude,
+        closest.longitude,
+        closest.heading,
+        closest.speed * clamped_delta,
+    )
+    estimate = replace(
+        closest, timestamp=timestamp, latitude=latitude, longitude=longitude
+    )
+    return estimate, abs(delta)
@@ -1,25 +1,114 @@
 import datetime
-from datetime import timedelta
+import functools
+import re
+from datetime import timedelta, tzinfo
 from string import Template
+from typing import Callable, List, Optional, Tuple
 
 import tzlocal
 
 
-def get_datetime_string(timestamp_utc: float, date_format: str) -> str:
-    local_timezone = tzlocal.get_localzone()
+def get_datetime_string(
+    timestamp_utc: float, date_format: str, timezone: Optional[tzinfo] = None
+) -> str:
+    """Local time in timezone, by default the one of this PC"""
+    local_timezone = timezone or tzlocal.get_localzone()
     date_datetime = datetime.datetime.fromtimestamp(timestamp_utc, tz=local_timezone)
     return date_datetime.strftime(date_format)
 
 
-def get_local_offset_delta() -> timedelta:
-    local_timezone = tzlocal.get_localzone()
-    now = datetime.datetime.now(tz=local_timezone)
-    utc_offset = now.utcoffset()
+def get_local_offset_delta(
+    timestamp_utc: Optional[float] = None, timezone: Optional[tzinfo] = None
+) -> timedelta:
+    """UTC offset of timezone, by default the one of this PC, now or at the
+    given time"""
+    local_timezone = timezone or tzlocal.get_localzone()
+    if timestamp_utc is None:
+        date_datetime = datetime.datetime.now(tz=local_timezone)
+    else:
+        date_datetime = datetime.datetime.fromtimestamp(
+            timestamp_utc, tz=local_timezone
+        )
+    utc_offset = date_datetime.utcoffset()
     if utc_offset is None:
         raise Exception("Could not determine local UTC offset")
     return utc_offset
 
 
+@functools.lru_cache(maxsize=64)
+def get_offset_timezone(offset_time: str) -> Optional[tzinfo]:
+    """Fixed timezone of an offset like "+09:00", None if it is invalid"""
+    try:
+        return datetime.datetime.strptime(offset_time, "%z").tzinfo
+    except ValueError:
+        return None
+
+
+def _twelve_hour(hour: str, meridiem: str) -> int:
+    return int(hour) % 12 + (12 if meridiem.upper() == "PM" else 0)
+
+
+# year, month, day, hour, minute, second
+_DateTimeFields = Tuple[int, int, int, int, int, int]
+
+
+def _int_fields(match: "re.Match[str]") -> _DateTimeFields:
+    year, month, day, hour, minute, second = (int(group) for group in match.groups())
+    return year, month, day, hour, minute, second
+
+
+# file name patterns of common screenshot tools, with a function returning
+# the date and time fields from the match
+_file_name_time_patterns: List[
+    Tuple["re.Pattern[str]", Callable[["re.Match[str]"], _DateTimeFields]]
+] = [
+    # Xbox Game Bar: "Microsoft Flight Simulator 10_3_2021 2_22_05 PM.png"
+    (
+        re.compile(r"(\d{1,2})_(\d{1,2})_(\d{4}) (\d{1,2})_(\d{2})_(\d{2}) ([AP]M)"),
+        lambda m: (
+            int(m[3]),
+            int(m[1]),
+            int(m[2]),
+            _twelve_hour(m[4], m[7]),
+            int(m[5]),
+            int(m[6]),
+        ),
+    ),
+    # NVIDIA: "Microsoft Flight Simulator Screenshot 2021.10.03 - 14.22.05.43.png"
+    (
+        re.compile(r"(\d{4})\.(\d{2})\.(\d{2}) - (\d{2})\.(\d{2})\.(\d{2})"),
+        _int_fields,
+    ),
+    # OBS: "Screenshot 2021-10-03 14-22-05.png", GeoShot: "MSFS_2021-10-03-142205"
+    (
+        re.compile(r"(\d{4})-(\d{2})-(\d{2})[ _-](\d{2})-?(\d{2})-?(\d{2})"),
+        _int_fields,
+    ),
+    # Steam: "20211003142205_1.jpg"
+    (
+        re.compile(r"(?<!\d)(\d{4})(\d{2})(\d{2})(\d{2})(\d{2})(\d{2})(?!\d)"),
+        _int_fields,
+    ),
+]
+
+
+def parse_file_name_time(file_name: str) -> Optional[float]:
+    """Local time embedded in the file name of a screenshot, as UTC timestamp
+
+    Knows the names given by GeoShot, the Xbox Game Bar, NVIDIA, OBS and
+    Steam.
+    """
+    for pattern, get_fields in _file_name_time_patterns:
+        match = pattern.search(file_name)
+        if not match:
+            continue
+        try:
+            return datetime.datetime(*get_fields(match)).timestamp()
+        except ValueError:
+            continue
+    return None
+
+
 class _DeltaTemplate(Template):
     delimiter = "%"
 
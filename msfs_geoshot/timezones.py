@@ -0,0 +1,311 @@
+"""
+Timezone at a position, from a bundled set of timezone boundaries
+
+The boundaries (built from timezone-boundary-builder with
+tools/build_timezone_index.py) are simplified polygons indexed by a grid of
+cells. Most cells are touched by no boundary and are answered without any
+geometry. For the others, the polygons of the timezones touching the cell
+are tested, using only their edges within the cell's row of the grid.
+"""
+
+import datetime
+import math
+from collections import OrderedDict
+from datetime import timedelta, tzinfo
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+
+from . import RESOURCES_PATH
+
+TIMEZONE_INDEX_PATH = RESOURCES_PATH / "timezones.npz"
+
+_version = 1
+
+
+class TimezoneIndexError(Exception):
+    pass
+
+
+class TimezoneIndex:
+    """Answers timezone queries from an index file
+
+    Results are cached per cell of cache_cell_size degrees, looked up at its
+    center, so that repeated screenshots in an area cost a dictionary lookup.
+    """
+
+    def __init__(
+        self,
+        path: Path = TIMEZONE_INDEX_PATH,
+        cache_cell_size: float = 0.01,  # degrees
+        max_cached: int = 1024,
+    ):
+        try:
+            with np.load(path) as data:
+                if int(data["version"]) != _version:
+                    raise TimezoneIndexError(f"{path} is of another version")
+                self._cell_size = float(data["cell_size"])
+                self._cell_offsets = data["cell_offsets"]
+                self._cell_zones = data["cell_zones"]
+                cell_touched = data["cell_touched"]
+                self._band_keys = data["band_keys"]
+                self._band_offsets = data["band_offsets"]
+                self._edges = data["edges"]
+                name_offsets = data["name_offsets"].tolist()
+                names = data["names"].tobytes().decode("utf-8")
+        except (OSError, ValueError, KeyError) as e:
+            raise TimezoneIndexError(f"Could not open timezone index {path}: {e}")
+        self._names: List[str] = [
+            names[start:end] for start, end in zip(name_offsets, name_offsets[1:])
+        ]
+        self._rows, self._columns = _grid_shape(self._cell_size)
+        self._cell_touched = np.unpackbits(
+            cell_touched, count=self._rows * self._columns
+        ).astype(bool)
+        self._cache_cell_size = cache_cell_size
+        self._max_cached = max_cached
+        self._cache: "OrderedDict[Tuple[int, int], tzinfo]" = OrderedDict()
+        self._timezones: Dict[str, Optional[tzinfo]] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def zone_name(self, latitude: float, longitude: float) -> Optional[str]:
+        """IANA name of the timezone at a position, None if not covered"""
+        row, column = _cell(latitude, longitude, self._cell_size)
+        cell = row * self._columns + column
+        start, end = self._cell_offsets[cell : cell + 2].tolist()
+        zones = self._cell_zones[start:end].tolist()
+        if not self._cell_touched[cell]:
+            # within a single timezone or none at all
+            return self._names[zones[0]] if zones else None
+        for zone in zones:
+            if self._contains(zone, row, latitude, longitude):
+                return self._names[zone]
+        return None
+
+    def get_timezone(self, latitude: float, longitude: float) -> tzinfo:
+        """Timezone at a position, cached
+
+        Positions not covered by the index, or in timezones unknown to the
+        timezone database, get the nautical timezone of their longitude.
+        """
+        key = (
+            math.floor(latitude / self._cache_cell_size),
+            math.floor(longitude / self._cache_cell_size),
+        )
+        timezone = self._cache.get(key)
+        if timezone is not None:
+            self._cache.move_to_end(key)
+            return timezone
+
+        center_latitude = (key[0] + 0.5) * self._cache_cell_size
+        center_longitude = (key[1] + 0.5) * self._cache_cell_size
+        name = self.zone_name(center_latitude, center_longitude)
+        timezone = (self._get_named_timezone(name) if name else None) or (
+            get_nautical_timezone(center_longitude)
+        )
+        self._cache[key] = timezone
+        if len(self._cache) > self._max_cached:
+            self._cache.popitem(last=False)
+        return timezone
+
+    def _contains(self, zone: int, row: int, latitude: float, longitude: float) -> bool:
+        # even-odd rule along a ray to the east, holes are just more rings
+        key = row * len(self._names) + zone
+        index = int(np.searchsorted(self._band_keys, key))
+        if index == len(self._band_keys) or self._band_keys[index] != key:
+            return False
+        start, end = self._band_offsets[index : index + 2].tolist()
+        edges = self._edges[start:end]
+        latitudes_0, longitudes_0 = edges[:, 0], edges[:, 1]
+        latitudes_1, longitudes_1 = edges[:, 2], edges[:, 3]
+        crossing = (latitudes_0 > latitude) != (latitudes_1 > latitude)
+        if not crossing.any():
+            return False
+        latitudes_0, longitudes_0 = latitudes_0[crossing], longitudes_0[crossing]
+        latitudes_1, longitudes_1 = latitudes_1[crossing], longitudes_1[crossing]
+        crossing_longitudes = longitudes_0 + (latitude - latitudes_0) * (
+            longitudes_1 - longitudes_0
+        ) / (latitudes_1 - latitudes_0)
+        return bool(np.count_nonzero(crossing_longitudes > longitude) % 2)
+
+    def _get_named_timezone(self, name: str) -> Optional[tzinfo]:
+        if name not in self._timezones:
+            try:
+                self._timezones[name] = ZoneInfo(name)
+            except (ZoneInfoNotFoundError, ValueError):
+                print(f"Timezone {name} is unknown, using nautical time")
+                self._timezones[name] = None
+        return self._timezones[name]
+
+
+def get_nautical_timezone(longitude: float) -> tzinfo:
+    """Timezone of whole hours by longitude, as used at sea"""
+    hours = max(-12, min(12, round(longitude / 15)))
+    return datetime.timezone(timedelta(hours=hours))
+
+
+def _grid_shape(cell_size: float) -> Tuple[int, int]:
+    return math.ceil(180 / cell_size), math.ceil(360 / cell_size)
+
+
+def _cell(latitude: float, longitude: float, cell_size: float) -> Tuple[int, int]:
+    rows, columns = _grid_shape(cell_size)
+    row = min(rows - 1, max(0, math.floor((latitude + 90) / cell_size)))
+    column = min(columns - 1, max(0, math.floor((longitude + 180) / cell_size)))
+    return row, column
+
+
+def write_timezone_index(
+    path: Path,
+    zones: Iterable[Tuple[str, Sequence[np.ndarray]]],
+    cell_size: float = 1.0,  # degrees
+):
+    """Index timezone polygons in a grid and write them to an index file
+
+    Args:
+        zones: IANA name of each timezone and the rings of its polygons, as
+            arrays of longitude, latitude rows. Holes are rings like others.
+    """
+    rows, columns = _grid_shape(cell_size)
+    names: List[str] = []
+    edge_arrays: List[np.ndarray] = []
+    edge_zones: List[np.ndarray] = []
+    for name, rings in zones:
+        zone = len(names)
+        names.append(name)
+        for ring in rings:
+            ring = np.asarray(ring, dtype=np.float64)
+            if len(ring) < 3:
+                continue
+            points = ring[:, ::-1]  # latitude, longitude
+            edges = np.hstack((points, np.roll(points, -1, axis=0)))
+            # a closed ring repeats its first point, which makes an empty edge
+            edges = edges[(edges[:, 0] != edges[:, 2]) | (edges[:, 1] != edges[:, 3])]
+            edge_arrays.append(edges)
+            edge_zones.append(np.full(len(edges), zone, dtype=np.int64))
+    if not names:
+        raise TimezoneIndexError("No timezones to index")
+    zone_count = len(names)
+    edges = np.concatenate(edge_arrays) if edge_arrays else np.empty((0, 4))
+    zones_of_edges = (
+        np.concatenate(edge_zones) if edge_zones else np.empty(0, dtype=np.int64)
+    )
+
+    def to_rows(latitudes: np.ndarray) -> np.ndarray:
+        return np.clip(np.floor((latitudes + 90) / cell_size), 0, rows - 1).astype(
+            np.int64
+        )
+
+    def to_columns(longitudes: np.ndarray) -> np.ndarray:
+        return np.clip(np.floor((longitudes + 180) / cell_size), 0, columns - 1).astype(
+            np.int64
+        )
+
+    first_rows = to_rows(np.minimum(edges[:, 0], edges[:, 2]))
+    last_rows = to_rows(np.maximum(edges[:, 0], edges[:, 2]))
+    first_columns = to_columns(np.minimum(edges[:, 1], edges[:, 3]))
+    last_columns = to_columns(np.maximum(edges[:, 1], edges[:, 3]))
+
+    # every edge goes to each row of the grid its latitudes span
+    row_counts = last_rows - first_rows + 1
+    edge_indices = np.repeat(np.arange(len(edges)), row_counts)
+    edge_rows = first_rows[edge_indices] + _ranks(row_counts)
+    band_of_edges = edge_rows * zone_count + zones_of_edges[edge_indices]
+    order = np.argsort(band_of_edges, kind="stable")
+    band_keys, band_starts = np.unique(band_of_edges[order], return_index=True)
+    band_offsets = np.append(band_starts, len(order))
+    band_edges = edges[edge_indices[order]]
+
+    # timezones whose edges touch a cell, from the bounding box of each edge
+    column_counts = last_columns - first_columns + 1
+    cell_counts = row_counts * column_counts
+    cell_edges = np.repeat(np.arange(len(edges)), cell_counts)
+    ranks = _ranks(cell_counts)
+    cell_rows = first_rows[cell_edges] + ranks // column_counts[cell_edges]
+    cell_columns = first_columns[cell_edges] + ranks % column_counts[cell_edges]
+    touching = np.unique(
+        (cell_rows * columns + cell_columns) * zone_count + zones_of_edges[cell_edges]
+    )
+    touching_cells, touching_zones = np.divmod(touching, zone_count)
+
+    # the timezone at the center of each cell, which also covers cells no
+    # edge touches
+    center_zones = np.full(rows * columns, -1, dtype=np.int64)
+    center_longitudes = (np.arange(columns) + 0.5) * cell_size - 180
+    for band, band_key in enumerate(band_keys.tolist()):
+        row, zone = divmod(band_key, zone_count)
+        latitude = (row + 0.5) * cell_size - 90
+        row_zones = center_zones[row * columns : (row + 1) * columns]
+        inside = _inside_even_odd(
+            band_edges[band_offsets[band] : band_offsets[band + 1]],
+            latitude,
+            center_longitudes,
+        )
+        row_zones[inside & (row_zones < 0)] = zone
+
+    # the center's timezone first, as it covers most of the cell
+    cell_zones: List[List[int]] = [
+        [zone] if zone >= 0 else [] for zone in center_zones.tolist()
+    ]
+    for cell, zone in zip(touching_cells.tolist(), touching_zones.tolist()):
+        if zone not in cell_zones[cell]:
+            cell_zones[cell].append(zone)
+    cell_touched = np.zeros(rows * columns, dtype=bool)
+    cell_touched[touching_cells] = True
+    cell_offsets = np.zeros(rows * columns + 1, dtype=np.uint32)
+    cell_offsets[1:] = np.cumsum([len(zones) for zones in cell_zones])
+
+    encoded_names = [name.encode("utf-8") for name in names]
+    name_offsets = np.zeros(len(names) + 1, dtype=np.uint32)
+    name_offsets[1:] = np.cumsum([len(name) for name in encoded_names])
+    with path.open("wb") as index_file:
+        np.savez(
+            index_file,
+            version=np.array(_version),
+            cell_size=np.array(cell_size),
+            cell_offsets=cell_offsets,
+            cell_touched=np.packbits(cell_touched),
+            cell_zones=np.array(
+                [zone for zones in cell_zones for zone in zones], dtype=np.uint16
+            ),
+            band_keys=band_keys.astype(np.int64),
+            band_offsets=band_offsets.astype(np.uint32),
+            edges=band_edges.astype(np.float32),
+            name_offsets=name_offsets,
+            names=np.frombuffer(b"".join(encoded_names), dtype=np.uint8),
+        )
+
+
+def _ranks(counts: np.ndarray) -> np.ndarray:
+    """0 to count - 1 for each count, concatenated"""
+    starts = np.cumsum(counts) - counts
+    return np.arange(int(counts.sum())) - np.repeat(starts, counts)
+
+
+def _inside_even_odd(
+    edges: np.ndarray, latitude: float, longitudes: np.ndarray
+) -> np.ndarray:
+    crossing = (edges[:, 0] > latitude) != (edges[:, 2] > latitude)
+    edges = edges[crossing]
+    crossing_longitudes = edges[:, 1] + (latitude - edges[:, 0]) * (
+        edges[:, 3] - edges[:, 1]
+    ) / (edges[:, 2] - edges[:, 0])
+    counts = (crossing_longitudes[np.newaxis, :] > longitudes[:, np.newaxis]).sum(
+        axis=1
+    )
+    return counts % 2 == 1
+
+
+def get_default_timezone_index() -> Optional[TimezoneIndex]:
+    """The bundled timezone index, None if it is not installed"""
+    if not TIMEZONE_INDEX_PATH.is_file():
+        return None
+    try:
+        return TimezoneIndex()
+    except TimezoneIndexError as e:
+        print(e)
+        return None
@@ -0,0 +1,432 @@
+"""
+Flight tracks recorded from the telemetry stream
+
+Tracks are stored in an append-only columnar file. After a fixed header,
+the file consists of chunks, each made up of the chunk's row count followed by
+one contiguous array per column:
+
+    header: magic | version (u2) | column count (u2) | column descriptors
+    chunk:  row count (u4) | time[n] | latitude[n] | longitude[n] | ...
+
+Rows are buffered in arrays and written one chunk at a time, so recording
+costs neither per-sample Python objects nor per-sample writes. A partially
+written chunk at the end of the file (e.g. after a crash) is ignored when
+reading, and cut off before recording resumes in that file.
+"""
+
+import datetime
+import struct
+import sys
+import threading
+import time
+from array import array
+from dataclasses import replace
+from pathlib import Path
+from typing import (
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from . import __app_name__
+from .geo import interpolate_angle, interpolate_longitude
+from .telemetry import TelemetryError, TelemetrySample, TelemetrySource
+
+TRACK_FILE_EXTENSION = "gstrack"
+
+_MAGIC = b"GSTRACK\x00"
+_VERSION = 1
+
+
+class _Column(NamedTuple):
+    name: str
+    type_code: str  # array/struct type code
+    dtype: str  # little-endian numpy dtype
+
+
+# position needs double precision, the rest does fine with single precision
+_columns: List[_Column] = [
+    _Column("time", "d", "<f8"),  # s since epoch
+    _Column("latitude", "d", "<f8"),  # degrees
+    _Column("longitude", "d", "<f8"),  # degrees
+    _Column("altitude", "f", "<f4"),  # m
+    _Column("speed", "f", "<f4"),  # m/s
+    _Column("heading", "f", "<f4"),  # radians
+]
+
+_column_descriptor = struct.Struct("<16s4s")
+_header = struct.Struct(f"<{len(_MAGIC)}sHH")
+_chunk_header = struct.Struct("<I")
+
+
+class TrackFileError(Exception):
+    pass
+
+
+Track = Dict[str, np.ndarray]  # column name to values
+
+
+class TrackRecorder:
+    """Appends telemetry samples to a track file
+
+    add() may be called from any thread.
+    """
+
+    def __init__(self, path: Path, chunk_size: int = 600):
+        self.path = path
+        self._chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._buffers: Dict[str, array] = {
+            column.name: array(column.type_code) for column in _columns
+        }
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        is_new_file = not path.exists() or path.stat().st_size == 0
+        if not is_new_file:
+            # refuses to append to foreign files
+            _truncate_partial_chunk(path)
+        self._file: Optional[BinaryIO] = path.open("ab")
+        if is_new_file:
+            self._write_header()
+
+    def add(self, sample: TelemetrySample):
+        with self._lock:
+            if not self._file:
+                return
+            buffers = self._buffers
+            buffers["time"].append(sample.timestamp)
+            buffers["latitude"].append(sample.latitude)
+            buffers["longitude"].append(sample.longitude)
+            buffers["altitude"].append(sample.altitude)
+            buffers["speed"].append(sample.speed)
+            buffers["heading"].append(sample.heading)
+            if len(buffers["time"]) >= self._chunk_size:
+                self._write_chunk()
+
+    def flush(self):
+        with self._lock:
+            self._write_chunk()
+
+    def close(self):
+        with self._lock:
+            self._write_chunk()
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def _write_header(self):
+        assert self._file
+        self._file.write(_header.pack(_MAGIC, _VERSION, len(_columns)))
+        for column in _columns:
+            self._file.write(
+                _column_descriptor.pack(column.name.encode(), column.dtype.encode())
+            )
+        self._file.flush()
+
+    def _write_chunk(self):
+        row_count = len(self._buffers["time"])
+        if not row_count or not self._file:
+            return
+        self._file.write(_chunk_header.pack(row_count))
+        for column in _columns:
+            buffer = self._buffers[column.name]
+            if sys.byteorder == "big":
+                buffer.byteswap()  # stored little-endian
+            buffer.tofile(self._file)
+            del buffer[:]
+        self._file.flush()
+
+
+def _read_header(path: Path) -> Tuple[List[Tuple[str, np.dtype]], int]:
+    with path.open("rb") as track_file:
+        return _parse_header(track_file.read(_header.size), track_file)
+
+
+def _parse_header(
+    header_data: bytes, track_file: BinaryIO
+) -> Tuple[List[Tuple[str, np.dtype]], int]:
+    try:
+        magic, version, column_count = _header.unpack(header_data)
+    except struct.error:
+        raise TrackFileError("Not a track file")
+    if magic != _MAGIC:
+        raise TrackFileError("Not a track file")
+    if version != _VERSION:
+        raise TrackFileError(f"Unsupported track file version: {version}")
+
+    columns: List[Tuple[str, np.dtype]] = []
+    for _ in range(column_count):
+        name, dtype = _column_descriptor.unpack(
+            track_file.read(_column_descriptor.size)
+        )
+        columns.append(
+            (name.rstrip(b"\x00").decode(), np.dtype(dtype.rstrip(b"\x00").decode()))
+        )
+
+    header_size = _header.size + column_count * _column_descriptor.size
+    return columns, header_size
+
+
+def _truncate_partial_chunk(path: Path):
+    """Cut a track file off after its last complete chunk
+
+    Appending after a partially written chunk would make its row count
+    swallow the chunks that follow.
+    """
+    columns, offset = _read_header(path)
+    row_size = sum(dtype.itemsize for _, dtype in columns)
+    with path.open("r+b") as track_file:
+        size = track_file.seek(0, 2)
+        track_file.seek(offset)
+        while True:
+            chunk_header = track_file.read(_chunk_header.size)
+            if len(chunk_header) < _chunk_header.size:
+                break
+            (row_count,) = _chunk_header.unpack(chunk_header)
+            end = offset + _chunk_header.size + row_count * row_size
+            if end > size:
+                break
+            offset = track_file.seek(end)
+        if offset < size:
+            track_file.truncate(offset)
+
+
+def iter_track_chunks(path: Path) -> Iterator[Track]:
+    """Read a track file chunk by chunk, keeping memory use bounded"""
+    with path.open("rb") as track_file:
+        columns, _ = _parse_header(track_file.read(_header.size), track_file)
+        row_size = sum(dtype.itemsize for _, dtype in columns)
+        while True:
+            chunk_header = track_file.read(_chunk_header.size)
+            if len(chunk_header) < _chunk_header.size:
+                return
+            (row_count,) = _chunk_header.unpack(chunk_header)
+            data = track_file.read(row_count * row_size)
+            if len(data) < row_count * row_size:
+                return  # truncated chunk
+            yield _parse_chunk(data, columns, row_count)
+
+
+def load_track(path: Path) -> Track:
+    """Load a whole track file into memory with a single read"""
+    data = path.read_bytes()
+    with path.open("rb") as track_file:
+        columns, offset = _parse_header(track_file.read(_header.size), track_file)
+    row_size = sum(dtype.itemsize for _, dtype in columns)
+
+    chunks: List[Track] = []
+    view = memoryview(data)
+    while offset + _chunk_header.size <= len(data):
+        (row_count,) = _chunk_header.unpack_from(data, offset)
+        offset += _chunk_header.size
+        end = offset + row_count * row_size
+        if end > len(data):
+            break  # truncated chunk
+        chunks.append(_parse_chunk(view[offset:end], columns, row_count))
+        offset = end
+
+    return {
+        name: (
+            np.concatenate([chunk[name] for chunk in chunks])
+            if chunks
+            else np.empty(0, dtype=dtype)
+        )
+        for name, dtype in columns
+    }
+
+
+def _parse_chunk(data, columns: List[Tuple[str, np.dtype]], row_count: int) -> Track:
+    chunk: Track = {}
+    offset = 0
+    for name, dtype in columns:
+        chunk[name] = np.frombuffer(data, dtype=dtype, count=row_count, offset=offset)
+        offset += dtype.itemsize * row_count
+    return chunk
+
+
+class ReplaySource(TelemetrySource):
+    """Replays a recorded track as if it was flown right now
+
+    Samples are timestamped with the current time and interpolated from the
+    track, so the rest of the capture pipeline cannot tell a replay from a
+    live simulator.
+    """
+
+    def __init__(
+        self,
+        track: Track,
+        speed: float = 1.0,
+        loop: bool = True,
+        aircraft_type: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            track: Track as returned by load_track()
+            speed: Replay speed, e.g. 10 to fly the track ten times as fast
+            loop: Start over at the end of the track rather than disconnect
+            clock: Source of the current time, e.g. a simulated clock for
+                deterministic runs
+        """
+        if len(track["time"]) < 2:
+            raise TrackFileError("Track is too short to be replayed")
+        if track["time"][-1] <= track["time"][0]:
+            raise TrackFileError("Track does not span any time to be replayed")
+        self._times = track["time"]
+        self._track = track
+        self._speed = speed
+        self._loop = loop
+        self._aircraft_type = aircraft_type
+        self._clock = clock
+        self._start_time: Optional[float] = None
+
+    def connect(self):
+        self._start_time = self._clock()
+
+    def disconnect(self):
+        self._start_time = None
+
+    def read(self) -> TelemetrySample:
+        if self._start_time is None:
+            raise ConnectionError("Replay has not been started")
+
+        now = self._clock()
+        first_time = float(self._times[0])
+        duration = float(self._times[-1]) - first_time
+        elapsed = (now - self._start_time) * self._speed
+        if elapsed > duration:
+            if not self._loop:
+                raise ConnectionError("Replay finished")
+            elapsed %= duration
+        track_time = first_time + elapsed
+
+        index = int(np.searchsorted(self._times, track_time, side="right"))
+        index = min(max(index, 1), len(self._times) - 1)
+        sample = _interpolate(self._track, index, track_time, self._aircraft_type)
+        return replace(
+            sample,
+            timestamp=now,
+            # scaled so dead reckoning between samples matches the replay
+            speed=sample.speed * self._speed,
+        )
+
+
+def sample_track(
+    track: Track,
+    track_time: float,
+    max_gap: Optional[float] = None,
+    aircraft_type: Optional[str] = None,
+) -> Optional[TelemetrySample]:
+    """Position on a track at a time, interpolated from the samples around it
+
+    Args:
+        track_time: s since epoch
+        max_gap: Longest interval in s between the samples around track_time
+            to interpolate across, e.g. to leave out times recording was paused
+
+    Returns:
+        Sample timestamped track_time, None if the track does not cover it
+    """
+    times = track["time"]
+    if not len(times) or not times[0] <= track_time <= times[-1]:
+        return None
+    index = int(np.searchsorted(times, track_time, side="right"))
+    index = min(max(index, 1), len(times) - 1)
+    if max_gap is not None and times[index] - times[index - 1] > max_gap:
+        return None
+    return _interpolate(track, index, track_time, aircraft_type)
+
+
+def _interpolate(
+    track: Track, index: int, track_time: float, aircraft_type: Optional[str]
+) -> TelemetrySample:
+    """Interpolate between the samples at index - 1 and index"""
+    before = _row(track, index - 1)
+    after = _row(track, index)
+    interval = after["time"] - before["time"]
+    if interval <= 0:
+        raise TelemetryError("Track timestamps are not increasing")
+    t = (track_time - before["time"]) / interval
+
+    return TelemetrySample(
+        timestamp=track_time,
+        latitude=before["latitude"] + (after["latitude"] - before["latitude"]) * t,
+        longitude=interpolate_longitude(before["longitude"], after["longitude"], t),
+        altitude=before["altitude"] + (after["altitude"] - before["altitude"]) * t,
+        speed=before["speed"] + (after["speed"] - before["speed"]) * t,
+        heading=interpolate_angle(before["heading"], after["heading"], t),
+        dest_latitude=None,
+        dest_longitude=None,
+        aircraft_type=aircraft_type,
+    )
+
+
+def _row(track: Track, index: int) -> Dict[str, float]:
+    return {name: float(values[index]) for name, values in track.items()}
+
+
+def _format_iso_time(timestamp: float) -> str:
+    return (
+        datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+        .isoformat(timespec="milliseconds")
+        .replace("+00:00", "Z")
+    )
+
+
+def export_gpx(track_path: Path, out_path: Path):
+    with out_path.open("w", encoding="utf-8") as out_file:
+        out_file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<gpx version="1.1" creator="{escape(__app_name__)}" '
+            'xmlns="http://www.topografix.com/GPX/1/1">\n'
+            f"<trk><name>{escape(track_path.stem)}</name><trkseg>\n"
+        )
+        for chunk in iter_track_chunks(track_path):
+            out_file.writelines(
+                f'<trkpt lat="{latitude:.6f}" lon="{longitude:.6f}">'
+                f"<ele>{altitude:.1f}</ele><time>{_format_iso_time(timestamp)}</time>"
+                "</trkpt>\n"
+                for timestamp, latitude, longitude, altitude in zip(
+                    chunk["time"].tolist(),
+                    chunk["latitude"].tolist(),
+                    chunk["longitude"].tolist(),
+                    chunk["altitude"].tolist(),
+                )
+            )
+        out_file.write("</trkseg></trk>\n</gpx>\n")
+
+
+def export_kml(track_path: Path, out_path: Path):
+    with out_path.open("w", encoding="utf-8") as out_file:
+        out_file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<kml xmlns="http://www.opengis.net/kml/2.2" '
+            'xmlns:gx="http://www.google.com/kml/ext/2.2">\n'
+            f"<Document><name>{escape(track_path.stem)}</name>\n"
+            "<Placemark><gx:Track><altitudeMode>absolute</altitudeMode>\n"
+        )
+        # gx:Track lists all timestamps before all coordinates, so the file
+        # is streamed twice rather than held in memory
+        for chunk in iter_track_chunks(track_path):
+            out_file.writelines(
+                f"<when>{_format_iso_time(timestamp)}</when>\n"
+                for timestamp in chunk["time"].tolist()
+            )
+        for chunk in iter_track_chunks(track_path):
+            out_file.writelines(
+                f"<gx:coord>{longitude:.6f} {latitude:.6f} {altitude:.1f}</gx:coord>\n"
+                for latitude, longitude, altitude in zip(
+                    chunk["latitude"].tolist(),
+                    chunk["longitude"].tolist(),
+                    chunk["altitude"].tolist(),
+                )
+            )
+        out_file.write("</gx:Track></Placemark>\n</Document>\n</kml>\n")
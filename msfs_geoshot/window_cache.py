@@ -0,0 +1,111 @@
+from abc import ABC, abstractmethod
+from typing import List, NamedTuple, Optional, Tuple
+
+
+class WindowRectangle(NamedTuple):
+    left: int
+    top: int
+    right: int
+    bottom: int
+
+    def area(self):
+        return (self.left - self.right) * (self.top - self.bottom)
+
+
+class WindowCacheError(Exception):
+    pass
+
+
+class WindowBackend(ABC):
+    """Platform window operations needed to locate the simulator window"""
+
+    @abstractmethod
+    def get_window_ids(self, process_id: int) -> List[int]:
+        """Visible windows of a process. Expensive, enumerates all windows."""
+
+    @abstractmethod
+    def get_window_title(self, window_id: int) -> str:
+        pass
+
+    @abstractmethod
+    def get_window_process_id(self, window_id: int) -> Optional[int]:
+        """Owning process, or None if the window handle is no longer valid"""
+
+    @abstractmethod
+    def get_outer_rectangle(self, window_id: int) -> WindowRectangle:
+        """Window bounds including decorations. Cheap."""
+
+    @abstractmethod
+    def get_client_rectangle(self, window_id: int) -> WindowRectangle:
+        """Screen coordinates of the area to capture"""
+
+
+class WindowCache:
+    """Caches the simulator window handle and its capture rectangle
+
+    The handle is only looked up again once it stops belonging to the
+    simulator process. The capture rectangle is only recomputed when the
+    outer window bounds change, i.e. the window was moved, resized,
+    minimized or restored.
+    """
+
+    def __init__(self, backend: WindowBackend, window_title: str):
+        self._backend = backend
+        self._window_title = window_title
+
+        self._window_id: Optional[int] = None
+        self._process_id: Optional[int] = None
+        self._outer_rectangle: Optional[Tuple[int, WindowRectangle]] = None
+        self._client_rectangle: Optional[WindowRectangle] = None
+
+        self.window_id_hits = 0
+        self.window_id_misses = 0
+        self.rectangle_hits = 0
+        self.rectangle_misses = 0
+
+    def get_window_id(self, process_id: int) -> int:
+        window_id = self._window_id
+        if (
+            window_id is not None
+            and process_id == self._process_id
+            and self._backend.get_window_process_id(window_id) == process_id
+        ):
+            self.window_id_hits += 1
+            return window_id
+
+        self.window_id_misses += 1
+        self.invalidate()
+
+        results = [
+            window_id
+            for window_id in self._backend.get_window_ids(process_id)
+            if self._window_title in self._backend.get_window_title(window_id)
+        ]
+        if len(results) > 1:
+            raise WindowCacheError("Could not uniquely identify main simulator window.")
+        elif not results:
+            raise WindowCacheError("Could not find simulator window.")
+
+        self._window_id = results[0]
+        self._process_id = process_id
+        return results[0]
+
+    def get_rectangle(self, window_id: int) -> WindowRectangle:
+        outer_rectangle = (window_id, self._backend.get_outer_rectangle(window_id))
+        if (
+            self._client_rectangle is not None
+            and outer_rectangle == self._outer_rectangle
+        ):
+            self.rectangle_hits += 1
+            return self._client_rectangle
+
+        self.rectangle_misses += 1
+        self._client_rectangle = self._backend.get_client_rectangle(window_id)
+        self._outer_rectangle = outer_rectangle
+        return self._client_rectangle
+
+    def invalidate(self):
+        self._window_id = None
+        self._process_id = None
+        self._outer_rectangle = None
+        self._client_rectangle = None
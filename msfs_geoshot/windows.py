@@ -1,41 +1,20 @@
 import time
-from typing import List, NamedTuple, Optional
+from typing import List, Optional
 
-import psutil
 import win32con
 import win32gui
 import win32process
 
+from .window_cache import WindowBackend, WindowRectangle
 
-class WindowRectangle(NamedTuple):
-    left: int
-    top: int
-    right: int
-    bottom: int
-
-    def area(self):
-        return (self.left - self.right) * (self.top - self.bottom)
-
-
-def get_window_ids_by_process_name(process_name: str) -> List[int]:
-
-    target_pid: Optional[int] = None
-
-    for process in psutil.process_iter():
-        if process.name() == process_name:
-            target_pid = process.pid
-            # assumes there is only one process to look at
-            break
-    else:
-        raise OSError(f"Could not find process ID for '{process_name}'")
 
+def get_window_ids_by_process_id(target_pid: int) -> List[int]:
     matching_window_ids: List[int] = []
 
     def enum_cb(window_id: int, window_list: List[int]):
         if not win32gui.IsWindowVisible(window_id):  # type: ignore[arg]
             return
         _, process_id = win32process.GetWindowThreadProcessId(window_id)  # type: ignore[arg]
-        process = psutil.Process(process_id)
         if process_id == target_pid:
             window_list.append(window_id)
 
@@ -71,3 +50,23 @@ def get_window_rectangle(window_id: int) -> WindowRectangle:
         return outer_window_rect
 
     return inner_window_rect
+
+
+class Win32WindowBackend(WindowBackend):
+    def get_window_ids(self, process_id: int) -> List[int]:
+        return get_window_ids_by_process_id(process_id)
+
+    def get_window_title(self, window_id: int) -> str:
+        return get_window_title_by_window_id(window_id)
+
+    def get_window_process_id(self, window_id: int) -> Optional[int]:
+        if not win32gui.IsWindow(window_id):  # type: ignore
+            return None
+        _, process_id = win32process.GetWindowThreadProcessId(window_id)  # type: ignore
+        return process_id
+
+    def get_outer_rectangle(self, window_id: int) -> WindowRectangle:
+        return WindowRectangle(*win32gui.GetWindowRect(window_id))  # type: ignore
+
+    def get_client_rectangle(self, window_id: int) -> WindowRectangle:
+        return get_window_rectangle(window_id)
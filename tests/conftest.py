@@ -0,0 +1,42 @@
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import pytest
+from PyQt5.QtCore import QCoreApplication, QEventLoop
+
+FAKE_EXIFTOOL_PATH = Path(__file__).parent.parent / "tools" / "fake_exiftool.py"
+
+
+@pytest.fixture
+def fake_exiftool_command() -> List[str]:
+    """Command running the exiftool stand-in, which writes tags to JSON files"""
+    return [sys.executable, str(FAKE_EXIFTOOL_PATH)]
+
+
+@pytest.fixture(scope="session")
+def qapp() -> QCoreApplication:
+    app = QCoreApplication.instance()
+    return app if app is not None else QCoreApplication([])
+
+
+def process_events_until(
+    condition: Callable[[], bool], timeout: float = 5.0  # s
+) -> bool:
+    """Run the Qt event loop until condition holds or timeout passed
+
+    Returns:
+        Whether condition held in time
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        QCoreApplication.processEvents(QEventLoop.ProcessEventsFlag.AllEvents, 50)
+        time.sleep(0.01)
+    return True
+
+
+def process_events_for(duration: float):  # s
+    process_events_until(lambda: False, timeout=duration)
@@ -0,0 +1,153 @@
+import struct
+import zlib
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageFile
+
+from msfs_geoshot.catalog import (
+    BoundingBox,
+    Catalog,
+    CatalogEntry,
+    read_image_tags,
+)
+from msfs_geoshot.debug import get_mock_metadata
+from msfs_geoshot.exif import encode_exif
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = Catalog(tmp_path / "catalog.db")
+    yield catalog
+    catalog.close()
+
+
+def _entry(path, capture_time, latitude, longitude, title="Cessna 172"):
+    return CatalogEntry(
+        str(path), 0, 0, capture_time, latitude, longitude, 1000.0, title
+    )
+
+
+def _with_chunk_before_end(png: bytes, chunk_type: bytes, data: bytes) -> bytes:
+    chunk = (
+        struct.pack(">I", len(data))
+        + chunk_type
+        + data
+        + struct.pack(">I", zlib.crc32(chunk_type + data))
+    )
+    end = png.rindex(b"IEND") - 4
+    return png[:end] + chunk + png[end:]
+
+
+def test_added_screenshot_is_found(catalog, tmp_path):
+    path = tmp_path / "screenshot.png"
+    path.write_bytes(b"")
+    metadata = replace(get_mock_metadata(), ImageDescription="Cessna 172")
+
+    catalog.add(path, metadata)
+
+    (entry,) = catalog.query()
+    assert entry.path == str(path.resolve())
+    assert entry.latitude == metadata.GPSLatitude
+    assert entry.title == "Cessna 172"
+
+
+def test_update_replaces_entries_by_path(catalog, tmp_path):
+    catalog.update([_entry(tmp_path / "a.png", 100.0, 46.5, 8.0)])
+    catalog.update(
+        [
+            _entry(tmp_path / "a.png", 200.0, 47.0, 9.0),
+            _entry(tmp_path / "b.png", 300.0, 48.0, 10.0),
+        ]
+    )
+
+    assert len(catalog) == 2
+    assert [entry.capture_time for entry in catalog.query()] == [200.0, 300.0]
+
+
+def test_query_combines_criteria(catalog, tmp_path):
+    catalog.update(
+        [
+            _entry(tmp_path / "zurich.png", 100.0, 47.45, 8.55),
+            _entry(tmp_path / "geneva.png", 200.0, 46.24, 6.11),
+            _entry(tmp_path / "bern.png", 300.0, 46.91, 7.50, "Airbus A320"),
+            _entry(tmp_path / "fiji.png", 400.0, -17.76, 179.9),
+            _entry(tmp_path / "samoa.png", 500.0, -13.83, -171.99),
+        ]
+    )
+
+    def names(entries):
+        return [Path(entry.path).name for entry in entries]
+
+    switzerland = BoundingBox(south=45.8, west=5.9, north=47.8, east=10.5)
+    assert names(catalog.query(bounding_box=switzerland)) == [
+        "zurich.png",
+        "geneva.png",
+        "bern.png",
+    ]
+    assert names(
+        catalog.query(bounding_box=switzerland, start_time=150.0, end_time=350.0)
+    ) == ["geneva.png", "bern.png"]
+    assert names(catalog.query(bounding_box=switzerland, title="cessna")) == [
+        "zurich.png",
+        "geneva.png",
+    ]
+    assert names(catalog.query(center=(47.0, 7.5), radius=20000.0)) == ["bern.png"]
+    assert names(catalog.query(limit=2)) == ["zurich.png", "geneva.png"]
+
+    pacific = BoundingBox(south=-20.0, west=170.0, north=-10.0, east=-170.0)
+    assert names(catalog.query(bounding_box=pacific)) == ["fiji.png", "samoa.png"]
+
+
+def test_scan_reads_new_and_changed_images(catalog, tmp_path):
+    metadata = get_mock_metadata()
+    Image.new("RGB", (8, 8)).save(
+        tmp_path / "screenshot.jpg", exif=encode_exif(metadata)
+    )
+
+    assert catalog.scan([tmp_path], max_workers=1).added == 1
+    (entry,) = catalog.query()
+    assert entry.latitude == pytest.approx(metadata.GPSLatitude)
+
+    Image.new("RGB", (16, 16)).save(
+        tmp_path / "screenshot.jpg",
+        exif=encode_exif(replace(metadata, GPSLatitude=-33.9)),
+    )
+    result = catalog.scan([tmp_path], max_workers=1)
+
+    assert (result.added, result.updated) == (0, 1)
+    (entry,) = catalog.query()
+    assert entry.latitude == pytest.approx(-33.9)
+
+
+def test_png_exif_behind_the_pixels_is_read(tmp_path):
+    metadata = get_mock_metadata()
+    path = tmp_path / "screenshot.png"
+    Image.new("RGB", (8, 8)).save(path)
+    # where exiftool adds it to an existing image
+    path.write_bytes(
+        _with_chunk_before_end(path.read_bytes(), b"eXIf", encode_exif(metadata)[6:])
+    )
+
+    tags = read_image_tags(str(path))
+
+    assert tags.GPSLatitude == pytest.approx(metadata.GPSLatitude)
+    assert tags.AllDates == metadata.AllDates
+
+
+def test_png_without_exif_is_not_decoded(tmp_path, monkeypatch):
+    path = tmp_path / "screenshot.png"
+    Image.new("RGB", (8, 8)).save(path)
+
+    loaded = []
+    original_load = ImageFile.ImageFile.load
+
+    def load(image):
+        loaded.append(image)
+        return original_load(image)
+
+    monkeypatch.setattr(ImageFile.ImageFile, "load", load)
+
+    assert read_image_tags(str(path)).GPSLatitude is None
+    assert not loaded
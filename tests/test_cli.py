@@ -0,0 +1,151 @@
+import json
+import os
+from dataclasses import replace
+from datetime import timezone
+
+import pytest
+from PIL import Image
+
+from msfs_geoshot.cli import main
+from msfs_geoshot.exif import encode_exif
+from msfs_geoshot.geotag import JOURNAL_FILE_NAME
+from msfs_geoshot.metadata import sample_to_metadata
+from msfs_geoshot.tracks import TrackRecorder
+
+from .test_tracks import make_sample
+
+_start_time = 1632650400.0
+# the camera clock is behind by an hour and a bit
+_clock_offset = 3637.0
+
+
+def _flight_sample(track_time: float):
+    # 0.001 degrees of longitude a second
+    return replace(
+        make_sample(track_time), longitude=8.0 + (track_time - _start_time) / 1000
+    )
+
+
+def _record_flight(path):
+    recorder = TrackRecorder(path)
+    for second in range(601):
+        recorder.add(_flight_sample(_start_time + second))
+    recorder.close()
+    return path
+
+
+def _create_untagged_image(path, track_time: float):
+    path.write_bytes(b"\xff\xd8\xff\xd9")
+    image_time = track_time - _clock_offset
+    os.utime(path, (image_time, image_time))
+    return path
+
+
+def _create_geotagged_image(path, track_time: float):
+    sample = replace(_flight_sample(track_time), timestamp=track_time - _clock_offset)
+    metadata = sample_to_metadata(sample, timezone=timezone.utc)
+    Image.new("RGB", (8, 8)).save(path, exif=encode_exif(metadata))
+    return path
+
+
+def _read_written_longitude(image_path) -> float:
+    tags_path = image_path.with_name(f"{image_path.name}.tags.json")
+    return float(json.loads(tags_path.read_text())["GPSLongitude"])
+
+
+def test_geotag_reports_unreadable_track(tmp_path, capsys):
+    track_path = tmp_path / "flight.gstrack"
+    track_path.write_bytes(b"not a track file at all")
+
+    assert main(["geotag", str(tmp_path), str(track_path)]) == 1
+    assert "Could not read track" in capsys.readouterr().err
+
+
+def test_geotag_reports_unusable_track(tmp_path, capsys):
+    image_folder = tmp_path / "images"
+    image_folder.mkdir()
+    image_path = image_folder / "screenshot.jpg"
+    image_path.write_bytes(b"\xff\xd8\xff\xd9")
+    os.utime(image_path, (1632650400.0, 1632650400.0))
+    # timestamps that do not increase cannot be interpolated between
+    track_path = tmp_path / "flight.gstrack"
+    recorder = TrackRecorder(track_path)
+    recorder.add(make_sample(1632650400.0))
+    recorder.add(make_sample(1632650400.0))
+    recorder.close()
+
+    arguments = ["geotag", str(image_folder), str(track_path), "--offset", "0"]
+    assert main(arguments) == 1
+    assert "Could not read track" in capsys.readouterr().err
+
+
+def test_geotag_estimates_offset_from_geotagged_images(
+    tmp_path, capsys, fake_exiftool_command
+):
+    image_folder = tmp_path / "images"
+    image_folder.mkdir()
+    track_path = _record_flight(tmp_path / "flight.gstrack")
+    for index, track_time in enumerate([_start_time + 100, _start_time + 400]):
+        _create_geotagged_image(image_folder / f"anchor_{index}.jpg", track_time)
+    covered_times = [_start_time + 200, _start_time + 300]
+    image_paths = [
+        _create_untagged_image(image_folder / f"screenshot_{index}.jpg", track_time)
+        for index, track_time in enumerate(covered_times + [_start_time + 5000])
+    ]
+
+    arguments = ["geotag", str(image_folder), str(track_path), "--workers", "2"]
+    assert main(arguments + ["--exiftool", *fake_exiftool_command]) == 0
+
+    output = capsys.readouterr().out
+    assert "Estimated clock offset: +3637 s (from 2 geotagged image(s)" in output
+    assert "Tagged 2 image(s)" in output
+    assert "Skipped 2 already geotagged and 1 not covered by the track" in output
+    for image_path, track_time in zip(image_paths, covered_times):
+        assert _read_written_longitude(image_path) == pytest.approx(
+            _flight_sample(track_time).longitude, abs=1e-5
+        )
+    assert not list(image_folder.glob("anchor_*.tags.json"))
+    assert not (image_folder / JOURNAL_FILE_NAME).exists()
+
+
+def test_geotag_resumes_from_journal(
+    tmp_path, capsys, monkeypatch, fake_exiftool_command
+):
+    image_folder = tmp_path / "images"
+    image_folder.mkdir()
+    track_path = _record_flight(tmp_path / "flight.gstrack")
+    image_paths = [
+        _create_untagged_image(
+            image_folder / f"screenshot_{index}.jpg", _start_time + 100 * index
+        )
+        for index in range(1, 4)
+    ]
+    arguments = [
+        "geotag",
+        str(image_folder),
+        str(track_path),
+        "--offset",
+        str(_clock_offset),
+        "--workers",
+        "1",
+        "--exiftool",
+        *fake_exiftool_command,
+    ]
+
+    monkeypatch.setenv("FAKE_EXIFTOOL_CRASH_ON", image_paths[1].name)
+    assert main(arguments) == 1
+    assert (image_folder / JOURNAL_FILE_NAME).exists()
+    capsys.readouterr()
+    done_paths = {image_paths[0], image_paths[2]}
+    for path in done_paths:
+        path.with_name(f"{path.name}.tags.json").unlink()
+
+    monkeypatch.delenv("FAKE_EXIFTOOL_CRASH_ON")
+    # without --offset, the one of the interrupted run is used
+    assert main(arguments[:3] + arguments[5:]) == 0
+
+    assert "Tagged 1 image(s), 2 in an earlier run" in capsys.readouterr().out
+    assert _read_written_longitude(image_paths[1]) == pytest.approx(8.2, abs=1e-5)
+    for path in done_paths:
+        assert not path.with_name(f"{path.name}.tags.json").exists()
+    assert not (image_folder / JOURNAL_FILE_NAME).exists()
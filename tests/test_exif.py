@@ -0,0 +1,39 @@
+import struct
+from dataclasses import replace
+from fractions import Fraction
+
+import pytest
+from PIL import Image
+
+from msfs_geoshot.catalog import read_image_tags
+from msfs_geoshot.debug import get_mock_metadata
+from msfs_geoshot.exif import _rational, encode_exif
+
+
+def _decode_rationals(data: bytes):
+    values = struct.unpack(f"<{len(data) // 4}I", data)
+    return [Fraction(*values[index : index + 2]) for index in range(0, len(values), 2)]
+
+
+@pytest.mark.parametrize(
+    "value",
+    [0.0, 0.5, 1234.567, 4294.97, 8848.031415926536, 12497.173205080757, 4294967295.0],
+)
+def test_rational_fits_32_bits(value):
+    field_type, count, data = _rational(value)
+
+    assert count == 1
+    (fraction,) = _decode_rationals(data)
+    assert float(fraction) == pytest.approx(value, abs=0.01)
+
+
+def test_high_altitude_round_trip(tmp_path):
+    # cruising altitude, above the 4294 m where 1/1000000 m stopped fitting
+    metadata = replace(get_mock_metadata(), GPSAltitude=12497.173205080757)
+    image_path = tmp_path / "screenshot.jpg"
+    Image.new("RGB", (8, 8)).save(image_path, exif=encode_exif(metadata))
+
+    tags = read_image_tags(str(image_path))
+
+    assert tags.GPSAltitude == pytest.approx(12497.173, abs=0.01)
+    assert tags.GPSLatitude == pytest.approx(metadata.GPSLatitude, abs=1e-6)
@@ -0,0 +1,227 @@
+import json
+import threading
+import time
+from pathlib import Path
+from typing import List, Sequence
+
+import pytest
+
+from msfs_geoshot.debug import get_mock_metadata
+from msfs_geoshot.exiftool import ExifTool, ExifToolError, is_write_successful
+from msfs_geoshot.metadata import BatchMetadataWriter
+
+
+def _create_images(folder: Path, count: int) -> List[Path]:
+    paths = [folder / f"screenshot_{index:03}.jpg" for index in range(count)]
+    for path in paths:
+        path.write_bytes(b"\xff\xd8\xff\xd9")
+    return paths
+
+
+def _read_tags(image_path: Path) -> dict:
+    return json.loads(image_path.with_name(f"{image_path.name}.tags.json").read_text())
+
+
+@pytest.fixture
+def exiftool(fake_exiftool_command):
+    exiftool = ExifTool(fake_exiftool_command, timeout=10.0)
+    yield exiftool
+    exiftool.close()
+
+
+class RecordingExifTool(ExifTool):
+    """Remembers the size of each batch written"""
+
+    def __init__(self, command: Sequence[str]):
+        super().__init__(command, timeout=10.0)
+        self.batch_sizes: List[int] = []
+
+    def write_many(self, blocks):
+        self.batch_sizes.append(len(blocks))
+        return super().write_many(blocks)
+
+
+class Completion:
+    """Collects on_done callbacks until the expected number came in"""
+
+    def __init__(self, expected: int):
+        self.results = {}
+        self._expected = expected
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, image_path: Path, is_successful: bool):
+        with self._lock:
+            self.results[image_path] = is_successful
+            if len(self.results) == self._expected:
+                self._done.set()
+
+    def wait(self, timeout: float = 10.0) -> bool:
+        return self._done.wait(timeout)
+
+
+def test_execute_many_returns_output_per_block(exiftool, tmp_path):
+    image_path, missing_path = _create_images(tmp_path, 1) + [tmp_path / "missing.jpg"]
+
+    outputs = exiftool.execute_many(
+        [["-ver"], ["-Artist=Pilot", str(image_path)], [str(missing_path)]]
+    )
+
+    assert outputs[0] == "12.30\n"
+    assert "1 image files updated" in outputs[1]
+    assert "File not found" in outputs[2]
+    assert exiftool.is_running
+
+
+def test_write_many_round_trip(exiftool, tmp_path):
+    image_paths = _create_images(tmp_path, 3)
+
+    results = exiftool.write_many(
+        [
+            [f"-ImageDescription=Image {index}", str(path)]
+            for index, path in enumerate(image_paths)
+        ]
+        + [[str(tmp_path / "missing.jpg")]]
+    )
+
+    assert results == [True, True, True, False]
+    for index, path in enumerate(image_paths):
+        assert _read_tags(path) == {"ImageDescription": f"Image {index}"}
+
+
+def test_process_is_reused(exiftool, tmp_path):
+    exiftool.execute(["-ver"])
+    process = exiftool._process
+
+    exiftool.write_many(
+        [["-Artist=Pilot", str(path)] for path in _create_images(tmp_path, 2)]
+    )
+
+    assert exiftool._process is process
+
+
+def test_dead_process_is_restarted_once(exiftool, tmp_path):
+    (image_path,) = _create_images(tmp_path, 1)
+    exiftool.execute(["-ver"])
+    process = exiftool._process
+    process.kill()
+    process.wait()
+
+    assert exiftool.write(["-Artist=Pilot", str(image_path)])
+    assert exiftool._process is not process
+    assert _read_tags(image_path) == {"Artist": "Pilot"}
+
+
+def test_crashing_file_raises_after_retry(exiftool, tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_EXIFTOOL_CRASH_ON", "crash.jpg")
+    (crash_path,) = _create_images(tmp_path, 1)
+    crash_path = crash_path.rename(tmp_path / "crash.jpg")
+
+    with pytest.raises(ExifToolError):
+        exiftool.write(["-Artist=Pilot", str(crash_path)])
+    assert not exiftool.is_running
+
+
+@pytest.mark.parametrize(
+    "output, is_successful",
+    [
+        ("    1 image files updated\n", True),
+        ("    1 image file unchanged\n", True),
+        ("    0 image files updated\n", False),
+        ("Error: File not found - a.jpg\n", False),
+        (
+            "    1 image files updated\n    1 files weren't updated due to errors\n",
+            False,
+        ),
+        ("", False),
+    ],
+)
+def test_is_write_successful(output, is_successful):
+    assert is_write_successful(output) is is_successful
+
+
+def test_batch_is_sent_once_full(fake_exiftool_command, tmp_path):
+    exiftool = RecordingExifTool(fake_exiftool_command)
+    writer = BatchMetadataWriter(exiftool, max_batch_size=32, max_delay=60.0)
+    image_paths = _create_images(tmp_path, 40)
+    completion = Completion(32)
+
+    for path in image_paths[:32]:
+        writer.submit(path, get_mock_metadata(), completion)
+
+    # long before max_delay
+    assert completion.wait()
+    assert exiftool.batch_sizes == [32]
+    assert all(completion.results.values())
+
+    for path in image_paths[32:]:
+        writer.submit(path, get_mock_metadata())
+    writer.close()
+    exiftool.close()
+
+    assert exiftool.batch_sizes == [32, 8]
+    assert all(_read_tags(path) for path in image_paths)
+
+
+def test_batch_is_sent_after_delay(fake_exiftool_command, tmp_path):
+    exiftool = RecordingExifTool(fake_exiftool_command)
+    exiftool.execute(["-ver"])  # leave startup out of the timing
+    writer = BatchMetadataWriter(exiftool, max_batch_size=32, max_delay=0.2)
+    image_paths = _create_images(tmp_path, 3)
+    completion = Completion(3)
+
+    start_time = time.monotonic()
+    for path in image_paths:
+        writer.submit(path, get_mock_metadata(), completion)
+    assert completion.wait()
+    elapsed = time.monotonic() - start_time
+    writer.close()
+    exiftool.close()
+
+    assert 0.2 <= elapsed < 5.0
+    assert exiftool.batch_sizes == [3]
+    assert all(completion.results.values())
+
+
+def test_crashing_file_does_not_fail_the_batch(
+    fake_exiftool_command, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("FAKE_EXIFTOOL_CRASH_ON", "screenshot_001.jpg")
+    exiftool = RecordingExifTool(fake_exiftool_command)
+    writer = BatchMetadataWriter(exiftool, max_delay=0.0)
+    image_paths = _create_images(tmp_path, 3)
+    completion = Completion(3)
+
+    for path in image_paths:
+        writer.submit(path, get_mock_metadata(), completion)
+    writer.close()
+    exiftool.close()
+
+    assert completion.results == {
+        image_paths[0]: True,
+        image_paths[1]: False,
+        image_paths[2]: True,
+    }
+
+
+def test_unexpected_error_fails_only_its_job(fake_exiftool_command, tmp_path):
+    exiftool = RecordingExifTool(fake_exiftool_command)
+    writer = BatchMetadataWriter(exiftool, max_delay=0.0)
+    image_paths = _create_images(tmp_path, 3)
+    # exiftool reads its arguments line by line
+    image_paths[1] = image_paths[1].rename(tmp_path / "screenshot\n001.jpg")
+    completion = Completion(3)
+
+    for path in image_paths:
+        writer.submit(path, get_mock_metadata(), completion)
+    closer = threading.Thread(target=writer.close, daemon=True)
+    closer.start()
+    closer.join(timeout=10.0)
+    exiftool.close()
+
+    assert not closer.is_alive()
+    assert completion.results == {
+        image_paths[0]: True,
+        image_paths[1]: False,
+        image_paths[2]: True,
+    }
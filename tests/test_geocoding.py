@@ -0,0 +1,114 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+import pytest
+
+from msfs_geoshot.geocoding import CachedGeocoder, Geocoder, NetworkRequiredError
+
+
+class BlockingGeocoder(Geocoder):
+    """Holds each lookup until released, offline ones fail once released"""
+
+    def __init__(self):
+        self.started: Dict[bool, threading.Event] = {
+            True: threading.Event(),
+            False: threading.Event(),
+        }
+        self.release: Dict[bool, threading.Event] = {
+            True: threading.Event(),
+            False: threading.Event(),
+        }
+        self.lookups: List[bool] = []
+
+    def reverse(
+        self, latitude: float, longitude: float, offline_only: bool = False
+    ) -> Optional[str]:
+        self.lookups.append(offline_only)
+        self.started[offline_only].set()
+        assert self.release[offline_only].wait(5.0)
+        if offline_only:
+            raise NetworkRequiredError("Not in the offline index")
+        return "Switzerland-Valais-Zermatt"
+
+
+def _start(target, results: list) -> threading.Thread:
+    def run():
+        try:
+            results.append(target())
+        except Exception as e:
+            results.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_concurrent_lookups_in_a_cell_are_coalesced():
+    geocoder = BlockingGeocoder()
+    cache = CachedGeocoder(geocoder)
+    results: list = []
+
+    threads = [_start(lambda: cache.reverse(46.02, 7.75), results) for _ in range(8)]
+    assert geocoder.started[False].wait(5.0)
+    _wait_for(lambda: cache.stats.coalesced == 7)
+    geocoder.release[False].set()
+    for thread in threads:
+        thread.join(5.0)
+
+    assert results == ["Switzerland-Valais-Zermatt"] * 8
+    assert geocoder.lookups == [False]
+    assert cache.reverse(46.02, 7.75) == "Switzerland-Valais-Zermatt"
+    assert cache.stats.hits == 1
+
+
+def test_failed_offline_lookup_does_not_land_online_flight():
+    geocoder = BlockingGeocoder()
+    cache = CachedGeocoder(geocoder)
+    offline_results: list = []
+    online_results: list = []
+    coalesced_results: list = []
+
+    # A looks up offline, without registering a flight
+    offline = _start(
+        lambda: cache.reverse(46.02, 7.75, offline_only=True), offline_results
+    )
+    assert geocoder.started[True].wait(5.0)
+    # B looks up online, C waits for B
+    online = _start(lambda: cache.reverse(46.02, 7.75), online_results)
+    assert geocoder.started[False].wait(5.0)
+    coalesced = _start(lambda: cache.reverse(46.02, 7.75), coalesced_results)
+    _wait_for(lambda: cache.stats.coalesced == 1)
+
+    geocoder.release[True].set()
+    offline.join(5.0)
+    assert isinstance(offline_results[0], NetworkRequiredError)
+    assert not coalesced_results
+
+    geocoder.release[False].set()
+    online.join(5.0)
+    coalesced.join(5.0)
+    assert online_results == ["Switzerland-Valais-Zermatt"]
+    assert coalesced_results == ["Switzerland-Valais-Zermatt"]
+
+
+def test_offline_lookup_during_flight_needs_network():
+    geocoder = BlockingGeocoder()
+    cache = CachedGeocoder(geocoder)
+    results: list = []
+
+    online = _start(lambda: cache.reverse(46.02, 7.75), results)
+    assert geocoder.started[False].wait(5.0)
+    with pytest.raises(NetworkRequiredError):
+        cache.reverse(46.02, 7.75, offline_only=True)
+
+    geocoder.release[False].set()
+    online.join(5.0)
+    assert results == ["Switzerland-Valais-Zermatt"]
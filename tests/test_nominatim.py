@@ -0,0 +1,143 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import pytest
+
+from msfs_geoshot.geocoding import CachedGeocoder, GeocoderError
+from msfs_geoshot.nominatim import NominatimClient, NominatimGeocoder
+
+
+class StubNominatimServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubNominatimHandler)
+        self.request_times: List[float] = []
+        self.connections = 0
+        self.retry_after = ""  # answer 429 to every request if set
+
+    @property
+    def domain(self) -> str:
+        return f"127.0.0.1:{self.server_address[1]}"
+
+
+class StubNominatimHandler(BaseHTTPRequestHandler):
+    """Answers reverse lookups like Nominatim, over kept-alive connections"""
+
+    protocol_version = "HTTP/1.1"
+    server: StubNominatimServer
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.request_times.append(time.monotonic())
+        if self.server.retry_after:
+            self._respond(
+                429, b"Too Many Requests", {"Retry-After": self.server.retry_after}
+            )
+            return
+        query = dict(
+            part.split("=", 1) for part in self.path.partition("?")[2].split("&")
+        )
+        latitude, longitude = float(query["lat"]), float(query["lon"])
+        address = f"Place {latitude:.3f} {longitude:.3f}, Region, Country"
+        body = json.dumps(
+            {"display_name": address, "lat": query["lat"], "lon": query["lon"]}
+        )
+        self._respond(200, body.encode(), {"Content-Type": "application/json"})
+
+    def _respond(self, status: int, body: bytes, headers: Dict[str, str]):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = StubNominatimServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server):
+    client = NominatimClient(domain=server.domain, scheme="http")
+    yield client
+    client.close()
+
+
+def test_location_is_formatted(client):
+    assert client.reverse(46.5, 8.0) == "Country-Region-Place_46.500_8.000"
+
+
+def test_requests_are_paced_at_one_per_second(client, server):
+    for index in range(3):
+        client.reverse(46.5 + index, 8.0)
+
+    times = server.request_times
+    assert len(times) == 3
+    assert all(later - earlier >= 0.95 for earlier, later in zip(times, times[1:]))
+
+
+def test_connection_is_kept_open(server):
+    client = NominatimClient(domain=server.domain, scheme="http", rate=100.0)
+    for index in range(5):
+        client.reverse(46.5 + index, 8.0)
+    client.close()
+
+    assert len(server.request_times) == 5
+    assert client.connections_opened == 1
+    assert server.connections == 1
+
+
+def test_lookups_in_one_cell_make_one_request(client, server):
+    geocoder = CachedGeocoder(NominatimGeocoder(client), cell_size=0.02)
+    results: List[str] = []
+
+    def look_up(offset: float):
+        location = geocoder.reverse(46.501 + offset, 8.001 + offset)
+        assert location
+        results.append(location)
+
+    threads = [
+        threading.Thread(target=look_up, args=(index * 0.001,)) for index in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5.0)
+
+    assert len(server.request_times) == 1
+    assert results == ["Country-Region-Place_46.510_8.010"] * 8
+    assert geocoder.stats.misses == 1
+
+
+def test_rate_limited_client_backs_off(client, server):
+    server.retry_after = "1"
+
+    with pytest.raises(GeocoderError, match="rate limit"):
+        client.reverse(46.5, 8.0)
+    # fails without reaching the server until Retry-After passed
+    start = time.monotonic()
+    with pytest.raises(GeocoderError, match="retrying in"):
+        client.reverse(47.5, 8.0)
+    assert time.monotonic() - start < 0.1
+    assert len(server.request_times) == 1
+
+    server.retry_after = ""
+    time.sleep(1.0)
+    assert client.reverse(48.5, 8.0) == "Country-Region-Place_48.500_8.000"
+    assert len(server.request_times) == 2
@@ -0,0 +1,116 @@
+import json
+import time
+from typing import Optional
+
+import pytest
+
+from msfs_geoshot.geocoding import Geocoder
+from msfs_geoshot.gui.renamer import DeferredRenamer, RenameJournal
+from msfs_geoshot.names import FileNameComposer, PendingName
+
+
+class StubGeocoder(Geocoder):
+    def reverse(
+        self, latitude: float, longitude: float, offline_only: bool = False
+    ) -> Optional[str]:
+        return "Switzerland-Valais-Zermatt"
+
+
+def _pending_name(name_format: str = "{datetime}_{geocode}") -> PendingName:
+    return PendingName(name_format, {"datetime": "2021-10-03-142205"}, 46.02, 7.75)
+
+
+def test_journal_keeps_pending_names(tmp_path):
+    journal = RenameJournal(tmp_path / "renames.journal")
+    journal.open()
+    journal.add("a.png", _pending_name())
+    journal.add("b.png", _pending_name("{airport}_{geocode}"))
+    journal.done("a.png")
+    journal.close()
+
+    pending = RenameJournal(tmp_path / "renames.journal").open()
+
+    assert pending == {"b.png": _pending_name("{airport}_{geocode}")}
+
+
+def test_journal_reads_unversioned_lines(tmp_path):
+    path = tmp_path / "renames.journal"
+    entry = ["a.png", "MSFS_{datetime}_{geocode}", "2021-10-03-142205", 46.02, 7.75]
+    path.write_text(f"add\t{json.dumps(entry)}\n", encoding="utf-8")
+
+    pending = RenameJournal(path).open()
+
+    assert pending == {"a.png": _pending_name("MSFS_{datetime}_{geocode}")}
+    assert pending["a.png"].compose("Zermatt") == "MSFS_2021-10-03-142205_Zermatt"
+
+
+def test_journal_skips_unknown_and_broken_lines(tmp_path):
+    path = tmp_path / "renames.journal"
+    lines = [
+        ["a.png", 99, "{datetime}", {"datetime": "x"}, 46.02, 7.75],
+        [99, "b.png", "{datetime}", {"datetime": "x"}, 46.02, 7.75],
+        [2, "c.png", "{datetime}", "not fields", 46.02, 7.75],
+        [2, "d.png", "{datetime}", {"datetime": "x"}, 46.02, 7.75],
+    ]
+    path.write_text(
+        "".join(f"add\t{json.dumps(line)}\n" for line in lines)
+        + 'add\t[2, "e.png", "{dat',  # cut short by a crash
+        encoding="utf-8",
+    )
+
+    pending = RenameJournal(path).open()
+
+    assert pending == {
+        "d.png": PendingName("{datetime}", {"datetime": "x"}, 46.02, 7.75)
+    }
+
+
+@pytest.fixture
+def renamer(qapp, tmp_path):
+    renamer = DeferredRenamer(
+        FileNameComposer(StubGeocoder()), tmp_path / "renames.journal"
+    )
+    renamer.start()
+    yield renamer
+    renamer.stop()
+
+
+def _wait_until_renamed(renamer: DeferredRenamer, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while renamer.pending_count:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_image_is_renamed_once_released(renamer, tmp_path):
+    image_path = tmp_path / "provisional.png"
+    image_path.write_bytes(b"image data")
+
+    renamer.add(image_path, _pending_name())
+    time.sleep(0.1)
+    assert image_path.exists()
+    renamer.release(image_path)
+    _wait_until_renamed(renamer)
+
+    assert (tmp_path / "2021-10-03-142205_Switzerland-Valais-Zermatt.png").exists()
+    assert not image_path.exists()
+
+
+def test_unexpected_error_does_not_stop_renaming(renamer, tmp_path):
+    broken_path = tmp_path / "broken.png"
+    image_path = tmp_path / "provisional.png"
+    for path in (broken_path, image_path):
+        path.write_bytes(b"image data")
+
+    # a field the name was not composed with
+    renamer.add(broken_path, _pending_name("{datetime}_{unknown}"))
+    renamer.add(image_path, _pending_name())
+    renamer.release(broken_path)
+    renamer.release(image_path)
+    _wait_until_renamed(renamer)
+
+    assert broken_path.exists()
+    assert (tmp_path / "2021-10-03-142205_Switzerland-Valais-Zermatt.png").exists()
+    # not retried in the next session
+    renamer.stop()
+    assert RenameJournal(tmp_path / "renames.journal").open() == {}
@@ -0,0 +1,142 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from msfs_geoshot.debug import (
+    FakeWindowBackend,
+    MockSimConnect,
+    create_synthetic_track,
+)
+from msfs_geoshot.sim import (
+    SimConnectSource,
+    SimService,
+    SimServiceError,
+    _BatchedSimConnect,
+    _sim_var_definition,
+)
+from msfs_geoshot.simvars import CAPTURE_SIM_VARS, SimVarDefinition, SimVarPeriod
+from msfs_geoshot.telemetry import RateController
+from msfs_geoshot.tracks import ReplaySource, load_track
+
+
+class _FakeDll:
+    """Answers data requests with the values of a MockSimConnect"""
+
+    def __init__(self, session: _BatchedSimConnect, mock: MockSimConnect):
+        self._session = session
+        self._mock = mock
+        self.requests = 0
+
+    def RequestDataOnSimObjectType(self, *args):
+        self.requests += 1
+        values = self._mock.request()
+        self._session._data = self._session._definition.encode(values)
+        self._session._data_received.set()
+
+
+def _open_batched_session(mock: MockSimConnect) -> _BatchedSimConnect:
+    # the SimConnect DLL is only available on Windows, so skip connecting
+    session = _BatchedSimConnect.__new__(_BatchedSimConnect)
+    session._definition = _sim_var_definition
+    session._definition_id = 1
+    session._request_id = 1
+    session._data = None
+    session._data_received = threading.Event()
+    session.round_trips = 0
+    session.hSimConnect = None
+    session.dll = _FakeDll(session, mock)
+    return session
+
+
+def test_batched_session_requests_all_variables_at_once():
+    mock = MockSimConnect(_sim_var_definition)
+    session = _open_batched_session(mock)
+
+    for _ in range(10):
+        values = session.request()
+
+    assert session.dll.requests == 10
+    assert session.round_trips == 10
+    assert set(values) == {sim_var.field for sim_var in CAPTURE_SIM_VARS}
+    assert values["latitude"] == mock.values["latitude"]
+
+
+def test_source_reads_one_round_trip_per_sample():
+    sessions = []
+
+    def open_session(definition: SimVarDefinition) -> MockSimConnect:
+        sessions.append(MockSimConnect(definition))
+        return sessions[-1]
+
+    source = SimConnectSource(process_watcher=None, session_factory=open_session)
+    source.connect()
+    samples = [source.read() for _ in range(8)]
+
+    (session,) = sessions
+    assert session.round_trips == len(samples)
+    # per variable definitions would take a round trip each
+    assert len(CAPTURE_SIM_VARS) > 1
+
+
+def test_subscribed_source_makes_no_requests():
+    sessions = []
+
+    def open_session(definition: SimVarDefinition) -> MockSimConnect:
+        sessions.append(MockSimConnect(definition))
+        return sessions[-1]
+
+    source = SimConnectSource(
+        process_watcher=None,
+        subscription_period=SimVarPeriod.second,
+        session_factory=open_session,
+    )
+    source.connect()
+    for _ in range(5):
+        source.read()
+
+    assert sessions[0].round_trips == 0
+
+
+class SteppingClock:
+    """Advances by step on every reading until frozen, so that a replay covers
+    a long period in no time"""
+
+    def __init__(self, start: float, step: float):
+        self.time = start
+        self.is_frozen = False
+        self._step = step
+        self._lock = threading.Lock()
+
+    def __call__(self) -> float:
+        with self._lock:
+            if not self.is_frozen:
+                self.time += self._step
+            return self.time
+
+
+def test_flight_data_is_refused_before_the_history(qapp, tmp_path: Path):
+    track = load_track(create_synthetic_track(tmp_path / "synthetic.gstrack"))
+    start = float(track["time"][0])
+    clock = SteppingClock(start, step=0.25)
+    sim_service = SimService(
+        source=ReplaySource(track, clock=clock),
+        window_backend=FakeWindowBackend(),
+        rate_controller=RateController(min_interval=0.005, max_interval=0.005),
+    )
+    sim_service.start()
+    try:
+        deadline = time.monotonic() + 10.0
+        while clock.time < start + 30.0:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        clock.is_frozen = True
+        now = clock.time
+
+        # older than the last 32 samples, but within the last 15 s
+        assert sim_service.get_flight_data(timestamp=now - 12.0) is not None
+        with pytest.raises(SimServiceError):
+            sim_service.get_flight_data(timestamp=now - 25.0)
+    finally:
+        sim_service.stop()
@@ -0,0 +1,136 @@
+import time
+from dataclasses import replace
+from typing import List
+
+import pytest
+
+from msfs_geoshot.geo import haversine_distance
+from msfs_geoshot.telemetry import (
+    TelemetryError,
+    TelemetrySampler,
+    TelemetrySource,
+    estimate_sample,
+)
+
+from .test_tracks import make_sample
+
+
+class FlakySource(TelemetrySource):
+    """Fails with unexpected errors a few times before delivering samples"""
+
+    def __init__(self, connect_errors: int = 0, read_errors: int = 0):
+        self.connect_errors = connect_errors
+        self.read_errors = read_errors
+        self.connections = 0
+
+    def connect(self):
+        if self.connect_errors:
+            self.connect_errors -= 1
+            raise OSError("SimConnect DLL failed")
+        self.connections += 1
+
+    def read(self):
+        if self.read_errors:
+            self.read_errors -= 1
+            raise TypeError("Invalid sim data")
+        return make_sample(time.time())
+
+    def disconnect(self):
+        pass
+
+
+def _wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def _start_sampler(source: TelemetrySource, changes: List[bool]) -> TelemetrySampler:
+    sampler = TelemetrySampler(
+        source,
+        interval=0.01,
+        reconnect_interval=0.05,
+        on_connection_changed=changes.append,
+    )
+    sampler.start()
+    return sampler
+
+
+def test_sampler_reconnects_after_unexpected_read_error():
+    source = FlakySource(read_errors=2)
+    changes: List[bool] = []
+    sampler = _start_sampler(source, changes)
+    try:
+        assert _wait_for(lambda: len(sampler.history()) >= 3)
+        assert sampler.is_connected
+    finally:
+        sampler.stop()
+
+    assert source.connections == 3
+    assert changes[:4] == [True, False, True, False]
+
+
+def test_sampler_retries_after_unexpected_connect_error():
+    source = FlakySource(connect_errors=2)
+    sampler = _start_sampler(source, [])
+    try:
+        assert _wait_for(lambda: sampler.latest() is not None)
+        assert sampler.is_connected
+    finally:
+        sampler.stop()
+
+
+def _flight(start: float = 100.0, count: int = 32):
+    # northbound at 120 m/s, a sample every 0.1 s
+    return [
+        replace(
+            make_sample(start + index * 0.1),
+            latitude=46.5 + index * 0.1 * 120 / 111195,
+            longitude=8.0,
+            heading=0.0,
+        )
+        for index in range(count)
+    ]
+
+
+def test_estimate_interpolates_within_history():
+    samples = _flight()
+
+    estimate, age = estimate_sample(samples, 100.25)
+
+    assert estimate.latitude == pytest.approx(46.5 + 0.25 * 120 / 111195)
+    assert age == pytest.approx(0.05)
+
+
+def test_estimate_extrapolates_shortly_outside_history():
+    samples = _flight()
+
+    after, after_age = estimate_sample(samples, 104.1, max_extrapolation=2.0)
+    before, before_age = estimate_sample(samples, 99.0, max_extrapolation=2.0)
+
+    assert after_age == pytest.approx(1.0)
+    assert before_age == pytest.approx(1.0)
+    assert haversine_distance(
+        before.latitude, before.longitude, samples[0].latitude, samples[0].longitude
+    ) == pytest.approx(120.0, rel=0.01)
+
+
+def test_estimate_refuses_timestamps_before_history():
+    with pytest.raises(TelemetryError):
+        estimate_sample(_flight(), 90.0, max_extrapolation=2.0)
+
+
+def test_sampler_keeps_history_by_duration():
+    sampler = TelemetrySampler(FlakySource(), interval=0.005, history_duration=0.5)
+    sampler.start()
+    try:
+        time.sleep(1.0)
+        samples = sampler.history()
+    finally:
+        sampler.stop()
+
+    assert len(samples) > 32
+    assert samples[-1].timestamp - samples[0].timestamp <= 0.5
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from msfs_geoshot.timezones import (
+    TimezoneIndex,
+    TimezoneIndexError,
+    write_timezone_index,
+)
+
+
+def _ring(*points):
+    """Closed ring of longitude, latitude points"""
+    return np.array([*points, points[0]], dtype=np.float64)
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = tmp_path / "timezones.npz"
+    write_timezone_index(
+        path,
+        [
+            # a triangle with a hole, as a lake without timezone
+            (
+                "Asia/Kolkata",
+                [
+                    _ring((30.0, 30.0), (40.0, 30.0), (35.0, 40.0)),
+                    _ring((33.0, 31.0), (37.0, 31.0), (37.0, 35.0), (33.0, 35.0)),
+                ],
+            ),
+            # boundaries within cells
+            (
+                "Europe/Zurich",
+                [_ring((5.8, 45.8), (8.4, 45.8), (8.4, 47.3), (5.8, 47.3))],
+            ),
+            (
+                "Europe/Vienna",
+                [_ring((8.4, 45.8), (10.5, 45.8), (10.5, 47.3), (8.4, 47.3))],
+            ),
+        ],
+    )
+    return TimezoneIndex(path)
+
+
+def test_names_are_kept(index):
+    assert len(index) == 3
+    assert index.zone_name(38.0, 35.0) == "Asia/Kolkata"
+    assert index.zone_name(46.5, 7.0) == "Europe/Zurich"
+    assert index.zone_name(46.5, 10.0) == "Europe/Vienna"
+
+
+def test_boundary_within_a_cell(index):
+    assert index.zone_name(46.5, 8.35) == "Europe/Zurich"
+    assert index.zone_name(46.5, 8.45) == "Europe/Vienna"
+
+
+def test_hole_is_not_covered(index):
+    # in cells touched by the edges of the hole only
+    assert index.zone_name(31.5, 34.5) is None
+    assert index.zone_name(33.0, 35.0) is None
+    # next to the hole
+    assert index.zone_name(30.5, 34.5) == "Asia/Kolkata"
+    assert index.zone_name(33.0, 32.5) == "Asia/Kolkata"
+
+
+def test_outside_of_a_timezone_edge(index):
+    # the top edge lies below the center of its cell
+    assert index.zone_name(47.2, 7.0) == "Europe/Zurich"
+    assert index.zone_name(47.4, 7.0) is None
+    assert index.zone_name(45.7, 7.0) is None
+    assert index.zone_name(0.0, 0.0) is None
+
+
+def test_uncovered_position_gets_nautical_time(index):
+    timezone = index.get_timezone(0.0, -44.0)
+
+    assert timezone.utcoffset(datetime(2024, 1, 1)) == timedelta(hours=-3)
+
+
+def test_other_files_are_refused(tmp_path):
+    path = tmp_path / "timezones.npz"
+    path.write_bytes(b"not an index")
+
+    with pytest.raises(TimezoneIndexError):
+        TimezoneIndex(path)
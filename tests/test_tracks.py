@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from msfs_geoshot.telemetry import TelemetrySample
+from msfs_geoshot.tracks import (
+    ReplaySource,
+    TrackFileError,
+    TrackRecorder,
+    load_track,
+)
+
+
+def make_sample(timestamp: float) -> TelemetrySample:
+    return TelemetrySample(
+        timestamp=timestamp,
+        latitude=46.5,
+        longitude=8.0 + timestamp / 1000,
+        altitude=3000.0,
+        speed=120.0,
+        heading=0.5,
+        dest_latitude=None,
+        dest_longitude=None,
+        aircraft_type=None,
+    )
+
+
+def _record(path, timestamps, chunk_size=4):
+    recorder = TrackRecorder(path, chunk_size=chunk_size)
+    for timestamp in timestamps:
+        recorder.add(make_sample(timestamp))
+    recorder.close()
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "flight.gstrack"
+    _record(path, range(10))
+
+    track = load_track(path)
+
+    np.testing.assert_array_equal(track["time"], np.arange(10))
+    np.testing.assert_allclose(track["longitude"], 8.0 + np.arange(10) / 1000)
+
+
+def test_reopened_track_is_appended_to(tmp_path):
+    path = tmp_path / "flight.gstrack"
+    _record(path, range(0, 8))
+    _record(path, range(8, 12))
+
+    np.testing.assert_array_equal(load_track(path)["time"], np.arange(12))
+
+
+def test_partial_chunk_is_cut_off_before_appending(tmp_path):
+    path = tmp_path / "flight.gstrack"
+    _record(path, range(0, 8))
+    complete_size = path.stat().st_size
+    _record(path, range(8, 12))
+    # crash in the middle of writing the last chunk
+    with path.open("r+b") as track_file:
+        track_file.truncate(complete_size + 20)
+
+    _record(path, range(100, 104))
+
+    np.testing.assert_array_equal(
+        load_track(path)["time"], [*range(0, 8), *range(100, 104)]
+    )
+
+
+def test_foreign_file_is_not_appended_to(tmp_path):
+    path = tmp_path / "flight.gstrack"
+    path.write_bytes(b"not a track file at all")
+
+    with pytest.raises(TrackFileError):
+        TrackRecorder(path)
+    assert path.read_bytes() == b"not a track file at all"
+
+
+def test_track_spanning_no_time_is_not_replayed(tmp_path):
+    path = tmp_path / "flight.gstrack"
+    _record(path, [5.0, 5.0, 5.0])
+
+    with pytest.raises(TrackFileError):
+        ReplaySource(load_track(path))
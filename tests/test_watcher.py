@@ -0,0 +1,138 @@
+import json
+from pathlib import Path
+from typing import List
+
+import pytest
+from PIL import Image
+from PyQt5.QtCore import QSettings
+
+from msfs_geoshot.debug import FakeWindowBackend, create_synthetic_track
+from msfs_geoshot.gui.controller import ScreenShotController, ScreenShotResult
+from msfs_geoshot.gui.settings import AppSettings
+from msfs_geoshot.gui.watcher import FolderWatcher
+from msfs_geoshot.metadata import MetadataService
+from msfs_geoshot.names import FileNameComposer
+from msfs_geoshot.screenshots import ScreenshotService
+from msfs_geoshot.sim import SimService
+from msfs_geoshot.tracks import ReplaySource, load_track
+
+from .conftest import process_events_for, process_events_until
+
+
+class FastFolderWatcher(FolderWatcher):
+    _scan_delay = 50  # ms
+    _poll_interval = 50  # ms
+    _settle_time = 0.3  # s
+
+
+@pytest.fixture
+def watcher(qapp):
+    watcher = FastFolderWatcher()
+    yield watcher
+    watcher.watch(None)
+
+
+def _collect(watcher: FolderWatcher) -> List[Path]:
+    ready: List[Path] = []
+    watcher.file_ready.connect(ready.append)  # type: ignore
+    return ready
+
+
+def test_settled_file_is_reported_once(watcher, tmp_path):
+    (tmp_path / "before.png").write_bytes(b"existing")
+    ready = _collect(watcher)
+    watcher.watch(tmp_path)
+
+    (tmp_path / "Screenshot 1.png").write_bytes(b"image data")
+    (tmp_path / "notes.txt").write_text("not an image")
+
+    assert process_events_until(lambda: bool(ready))
+    process_events_for(1.0)
+    assert ready == [tmp_path.resolve() / "Screenshot 1.png"]
+
+
+def test_file_being_written_is_held_back(watcher, tmp_path):
+    ready = _collect(watcher)
+    watcher.watch(tmp_path)
+
+    path = tmp_path / "Screenshot 1.png"
+    with path.open("wb") as image_file:
+        # a slow writer, appending for longer than the settle time
+        for _ in range(10):
+            image_file.write(b"image data")
+            image_file.flush()
+            process_events_for(0.1)
+            assert not ready
+
+    assert process_events_until(lambda: bool(ready))
+    assert ready == [tmp_path.resolve() / "Screenshot 1.png"]
+
+
+def test_files_marked_known_are_not_reported(watcher, tmp_path):
+    ready = _collect(watcher)
+    watcher.watch(tmp_path)
+
+    own_path = tmp_path / "MSFS_2021-10-03-142205.png"
+    own_path.write_bytes(b"written by the app")
+    watcher.mark_known(own_path)
+    (tmp_path / "Screenshot 1.png").write_bytes(b"image data")
+
+    assert process_events_until(lambda: bool(ready))
+    process_events_for(0.5)
+    assert ready == [tmp_path.resolve() / "Screenshot 1.png"]
+
+
+def test_added_screenshot_is_renamed_and_geotagged(
+    qapp, watcher, tmp_path, fake_exiftool_command
+):
+    # keeps the settings of the installed app untouched
+    QSettings.setPath(
+        QSettings.Format.IniFormat, QSettings.Scope.UserScope, str(tmp_path)
+    )
+    settings = AppSettings(qapp)
+    settings.file_name_format = "MSFS_{datetime}"  # no geocoding requests
+    settings.write_sidecar = False
+
+    track = load_track(create_synthetic_track(tmp_path / "synthetic.gstrack"))
+    sim_service = SimService(
+        source=ReplaySource(track), window_backend=FakeWindowBackend()
+    )
+    metadata_service = MetadataService(fake_exiftool_command)
+    file_name_composer = FileNameComposer()
+    controller = ScreenShotController(
+        sim_service=sim_service,
+        metadata_service=metadata_service,
+        screenshot_service=ScreenshotService(file_name_composer),
+        file_name_composer=file_name_composer,
+        settings=settings,
+    )
+    watcher.file_ready.connect(controller.tag_screenshot_file)  # type: ignore
+    controller.file_saved.connect(watcher.mark_known)  # type: ignore
+    results: List[ScreenShotResult] = []
+    controller.screenshot_taken.connect(results.append)  # type: ignore
+    ready = _collect(watcher)
+
+    folder = tmp_path / "Captures"
+    folder.mkdir()
+    watcher.watch(folder)
+    sim_service.start()
+    try:
+        assert process_events_until(lambda: sim_service.is_connected, timeout=10.0)
+        process_events_for(0.5)  # let a few samples come in
+
+        Image.new("RGB", (64, 36)).save(folder / "Screenshot 1.png")
+        assert process_events_until(lambda: bool(results), timeout=10.0)
+        process_events_for(1.0)
+    finally:
+        sim_service.stop()
+        metadata_service.close()
+
+    (result,) = results
+    assert ready == [folder.resolve() / "Screenshot 1.png"]
+    assert result.path.name.startswith("MSFS_")
+    assert result.path.is_file()
+    assert not (folder / "Screenshot 1.png").exists()
+    tags = json.loads(
+        result.path.with_name(f"{result.path.name}.tags.json").read_text()
+    )
+    assert float(tags["GPSLatitude"]) == pytest.approx(result.metadata.GPSLatitude)
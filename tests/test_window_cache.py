@@ -0,0 +1,85 @@
+import pytest
+
+from msfs_geoshot.debug import FakeWindow, FakeWindowBackend
+from msfs_geoshot.window_cache import WindowCache, WindowCacheError, WindowRectangle
+
+SIM_PID = 4242
+SIM_WINDOW_ID = 100
+TITLE = "Microsoft Flight Simulator"
+
+
+@pytest.fixture
+def backend() -> FakeWindowBackend:
+    return FakeWindowBackend(
+        {
+            SIM_WINDOW_ID: FakeWindow(
+                SIM_PID, f"{TITLE} - 1.20.6.0", WindowRectangle(0, 0, 1936, 1096)
+            ),
+            101: FakeWindow(SIM_PID, "Loading", WindowRectangle(0, 0, 400, 300)),
+            200: FakeWindow(1, TITLE, WindowRectangle(0, 0, 800, 600)),
+        }
+    )
+
+
+def test_window_id_is_looked_up_once(backend):
+    cache = WindowCache(backend, TITLE)
+
+    for _ in range(5):
+        assert cache.get_window_id(SIM_PID) == SIM_WINDOW_ID
+
+    assert backend.enumerations == 1
+    assert (cache.window_id_hits, cache.window_id_misses) == (4, 1)
+
+
+def test_rectangle_is_computed_once(backend):
+    cache = WindowCache(backend, TITLE)
+
+    for _ in range(5):
+        rectangle = cache.get_rectangle(SIM_WINDOW_ID)
+
+    assert rectangle == WindowRectangle(8, 8, 1928, 1088)
+    assert backend.client_rectangle_queries == 1
+    assert (cache.rectangle_hits, cache.rectangle_misses) == (4, 1)
+
+
+def test_moved_window_recomputes_rectangle(backend):
+    cache = WindowCache(backend, TITLE)
+    cache.get_rectangle(SIM_WINDOW_ID)
+
+    backend.move_window(SIM_WINDOW_ID, WindowRectangle(100, 50, 1380, 770))
+
+    assert cache.get_rectangle(SIM_WINDOW_ID) == WindowRectangle(108, 58, 1372, 762)
+    assert cache.get_rectangle(SIM_WINDOW_ID) == WindowRectangle(108, 58, 1372, 762)
+    assert backend.client_rectangle_queries == 2
+    assert (cache.rectangle_hits, cache.rectangle_misses) == (1, 2)
+
+
+def test_closed_window_is_looked_up_again(backend):
+    cache = WindowCache(backend, TITLE)
+    cache.get_window_id(SIM_PID)
+    cache.get_rectangle(SIM_WINDOW_ID)
+
+    backend.close_window(SIM_WINDOW_ID)
+    backend.windows[300] = FakeWindow(SIM_PID, TITLE, WindowRectangle(0, 0, 1280, 720))
+
+    assert cache.get_window_id(SIM_PID) == 300
+    assert backend.enumerations == 2
+    assert cache.window_id_misses == 2
+    assert cache.get_rectangle(300) == WindowRectangle(8, 8, 1272, 712)
+    assert cache.rectangle_misses == 2
+
+
+def test_other_process_is_looked_up_again(backend):
+    cache = WindowCache(backend, TITLE)
+    cache.get_window_id(SIM_PID)
+
+    assert cache.get_window_id(1) == 200
+    assert cache.window_id_misses == 2
+
+
+def test_missing_window_raises(backend):
+    cache = WindowCache(backend, TITLE)
+    backend.close_window(SIM_WINDOW_ID)
+
+    with pytest.raises(WindowCacheError):
+        cache.get_window_id(SIM_PID)
@@ -0,0 +1,971 @@
+#!/usr/bin/env python
+
+"""Micro-benchmarks for the capture pipeline, runnable without a simulator"""
+
+import argparse
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+from PyQt5.QtCore import QCoreApplication, QSettings, QTimer
+
+from msfs_geoshot.airports import AirportIndex, write_airport_index
+from msfs_geoshot.catalog import BoundingBox, Catalog, CatalogEntry
+from msfs_geoshot.codec import MetadataCodec
+from msfs_geoshot.debug import (
+    FakeWindowBackend,
+    MockSimConnect,
+    create_synthetic_track,
+    get_mock_metadata,
+)
+from msfs_geoshot.exif import encode_exif, encode_xmp
+from msfs_geoshot.exiftool import ExifTool
+from msfs_geoshot.export import export_folder
+from msfs_geoshot.geocoding import (
+    CachedGeocoder,
+    Geocoder,
+    OfflineGeocoder,
+    write_place_index,
+)
+from msfs_geoshot.geotag import geotag_folder
+from msfs_geoshot.gui.controller import ScreenShotController
+from msfs_geoshot.gui.settings import AppSettings, _SettingsData
+from msfs_geoshot.gui.watcher import FolderWatcher
+from msfs_geoshot.metadata import (
+    EXIF_DATE_FORMAT,
+    BatchMetadataWriter,
+    MetadataService,
+    metadata_to_exiftool_arguments,
+)
+from msfs_geoshot.geo import destination_point, haversine_distance
+from msfs_geoshot.names import (
+    FileNameComposer,
+    _check_date_format,
+    _check_name_format,
+)
+from msfs_geoshot.prefetch import GeocodePrefetcher
+from msfs_geoshot.screenshots import ScreenshotService
+from msfs_geoshot.sim import SimService
+from msfs_geoshot.simvars import CAPTURE_SIM_VARS, SimVarDefinition
+from msfs_geoshot.telemetry import RateController, TelemetrySample
+from msfs_geoshot.timezones import TimezoneIndex, write_timezone_index
+from msfs_geoshot.tracks import ReplaySource, load_track
+
+
+def benchmark_simconnect(arguments: argparse.Namespace):
+    # one definition per variable mirrors what AircraftRequests does
+    per_variable_sessions = [
+        MockSimConnect(SimVarDefinition([sim_var]), latency=arguments.latency)
+        for sim_var in CAPTURE_SIM_VARS
+    ]
+    batched_session = MockSimConnect(
+        SimVarDefinition(CAPTURE_SIM_VARS), latency=arguments.latency
+    )
+
+    def read_per_variable():
+        for session in per_variable_sessions:
+            session.request()
+
+    strategies: Dict[str, Callable[[], None]] = {
+        "per-variable": read_per_variable,
+        "batched": batched_session.request,
+    }
+    sessions_by_strategy = {
+        "per-variable": per_variable_sessions,
+        "batched": [batched_session],
+    }
+
+    for name, read in strategies.items():
+        start = time.perf_counter()
+        for _ in range(arguments.samples):
+            read()
+        elapsed = time.perf_counter() - start
+        round_trips = sum(session.round_trips for session in sessions_by_strategy[name])
+        print(
+            f"{name:>14}: {round_trips / arguments.samples:.0f} round trips/sample, "
+            f"{elapsed / arguments.samples * 1000:.3f} ms/sample"
+        )
+
+
+def benchmark_replay(arguments: argparse.Namespace):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        track_path = arguments.track or create_synthetic_track(
+            Path(temp_dir) / "synthetic.gstrack"
+        )
+        track = load_track(track_path)
+
+    sim_service = SimService(
+        source=ReplaySource(track, speed=arguments.speed),
+        window_backend=FakeWindowBackend(),
+    )
+    sim_service.start()
+    try:
+        while not sim_service.is_connected:
+            time.sleep(0.01)
+        time.sleep(0.5)  # let a few samples come in
+
+        captures = 0
+        skipped = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < arguments.duration:
+            if sim_service.get_flight_data() is None:
+                skipped += 1
+            captures += 1
+        elapsed = time.perf_counter() - start
+    finally:
+        sim_service.stop()
+
+    print(
+        f"{len(track['time'])} track points at {arguments.speed:g}x: "
+        f"{captures / elapsed:.0f} captures/s, "
+        f"{elapsed / captures * 1e6:.1f} us/capture, {skipped} not in flight"
+    )
+
+
+def benchmark_sampling(arguments: argparse.Namespace):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        track_path = arguments.track or create_synthetic_track(
+            Path(temp_dir) / "synthetic.gstrack"
+        )
+        track = load_track(track_path)
+
+    duration = float(track["time"][-1] - track["time"][0])
+    rate_controller = RateController(
+        min_interval=arguments.min_interval,
+        max_interval=arguments.max_interval,
+        target_error=arguments.target_error,
+    )
+    clock = [0.0]  # simulated, so the whole track is sampled in an instant
+    source = ReplaySource(track, loop=False, clock=lambda: clock[0])
+    source.connect()
+
+    sample_count = 0
+    max_distance = 0.0
+    while clock[0] < duration:
+        sample = source.read()
+        sample_count += 1
+        interval = rate_controller.update(sample)
+        max_distance = max(max_distance, sample.speed * interval)
+        clock[0] += interval
+
+    fixed_count = duration / arguments.min_interval
+    print(
+        f"adaptive: {sample_count} samples over {duration:.0f} s "
+        f"({sample_count / fixed_count:.0%} of a fixed {arguments.min_interval:g} s "
+        f"interval), at most {max_distance:.1f} m flown between samples"
+    )
+
+
+FAKE_EXIFTOOL_PATH = Path(__file__).parent / "fake_exiftool.py"
+
+
+def benchmark_exiftool(arguments: argparse.Namespace):
+    command: List[str] = arguments.exiftool or [sys.executable, str(FAKE_EXIFTOOL_PATH)]
+    os.environ["FAKE_EXIFTOOL_STARTUP"] = str(arguments.startup)
+    common_arguments = ["-n", "-overwrite_original"]
+    tag_arguments = metadata_to_exiftool_arguments(get_mock_metadata())
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        image_paths = []
+        for index in range(arguments.files):
+            image_path = Path(temp_dir) / f"{index}.jpg"
+            image_path.write_bytes(b"")
+            image_paths.append(image_path)
+
+        def process_per_file():
+            for image_path in image_paths:
+                subprocess.run(
+                    command + common_arguments + tag_arguments + [str(image_path)],
+                    stdout=subprocess.DEVNULL,
+                    check=True,
+                )
+
+        def stay_open_per_file():
+            exiftool = ExifTool(command, common_arguments)
+            for image_path in image_paths:
+                exiftool.write(tag_arguments + [str(image_path)])
+            exiftool.close()
+
+        def batched():
+            exiftool = ExifTool(command, common_arguments)
+            writer = BatchMetadataWriter(exiftool)
+            for image_path in image_paths:
+                writer.submit(image_path, get_mock_metadata())
+            writer.close()
+            exiftool.close()
+
+        strategies: Dict[str, Callable[[], None]] = {
+            "process per file": process_per_file,
+            "stay_open per file": stay_open_per_file,
+            "batched": batched,
+        }
+        for name, write in strategies.items():
+            start = time.perf_counter()
+            write()
+            elapsed = time.perf_counter() - start
+            print(
+                f"{name:>18}: {arguments.files / elapsed:.1f} files/s, "
+                f"{elapsed / arguments.files * 1000:.1f} ms/file"
+            )
+
+
+def benchmark_metadata(arguments: argparse.Namespace):
+    metadata = get_mock_metadata()
+    codec = MetadataCodec()
+    record = codec.record(metadata)
+
+    def legacy_exiftool_arguments():
+        # what metadata_to_exiftool_arguments did before the compiled schema
+        result = []
+        for attribute, value in asdict(metadata).items():
+            if attribute in ("capture_time", "sample_age") or value is None:
+                continue
+            value = str(value).replace("\r", " ").replace("\n", " ")
+            result.append(f"-{attribute}={value}")
+        return result
+
+    encoders: Dict[str, Callable[[], object]] = {
+        "legacy exiftool args": legacy_exiftool_arguments,
+        "record": lambda: codec.record(metadata),
+        "exiftool args": lambda: metadata_to_exiftool_arguments(metadata),
+        "exif": lambda: encode_exif(record),
+        "xmp": lambda: encode_xmp(record),
+        "json": lambda: codec.to_json(record),
+        "all formats": lambda: codec.encode(metadata),
+    }
+    for name, encode in encoders.items():
+        elapsed = timeit.timeit(encode, number=arguments.repeat)
+        print(f"{name:>20}: {elapsed / arguments.repeat * 1e6:.1f} µs/shot")
+
+
+def benchmark_catalog(arguments: argparse.Namespace):
+    random.seed(0)
+    titles = ["Cessna 152 Asobo", "Airbus A320 Neo Asobo", "Boeing 747-8i Asobo"]
+    start_time = time.time() - 365 * 24 * 3600
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        catalog = Catalog(Path(temp_dir) / "catalog.sqlite")
+        start = time.perf_counter()
+        catalog.update(
+            CatalogEntry(
+                path=f"C:\\Screenshots\\{index}.jpg",
+                mtime_ns=0,
+                size=0,
+                capture_time=start_time + index * 300,
+                latitude=random.uniform(-60, 70),
+                longitude=random.uniform(-180, 180),
+                altitude=random.uniform(0, 12000),
+                title=random.choice(titles),
+            )
+            for index in range(arguments.shots)
+        )
+        print(f"indexing {arguments.shots} shots: {time.perf_counter() - start:.2f} s")
+
+        queries: Dict[str, Callable[[], List[CatalogEntry]]] = {
+            "bounding box": lambda: catalog.query(
+                bounding_box=BoundingBox(45, 5, 48, 10)
+            ),
+            "antimeridian box": lambda: catalog.query(
+                bounding_box=BoundingBox(-20, 175, -10, -175)
+            ),
+            "radius 100 km": lambda: catalog.query(center=(47.4, 8.5), radius=100000),
+            "one day": lambda: catalog.query(
+                start_time=start_time + 100 * 86400,
+                end_time=start_time + 101 * 86400,
+            ),
+            "title": lambda: catalog.query(title="Boeing", limit=100),
+            "box, week, title": lambda: catalog.query(
+                bounding_box=BoundingBox(-60, -180, 70, 0),
+                start_time=start_time + 200 * 86400,
+                end_time=start_time + 207 * 86400,
+                title="cessna",
+            ),
+        }
+        for name, query in queries.items():
+            count = len(query())
+            elapsed = timeit.timeit(query, number=arguments.repeat) / arguments.repeat
+            print(f"{name:>18}: {elapsed * 1000:.2f} ms, {count} shots")
+        catalog.close()
+
+    if not arguments.files:
+        return
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        folder = Path(temp_dir) / "Screenshots"
+        folder.mkdir()
+        image = Image.new("RGB", (64, 36))
+        exif = encode_exif(get_mock_metadata())
+        for index in range(arguments.files):
+            image.save(folder / f"{index}.jpg", exif=exif)
+
+        for max_workers in (1, None):
+            catalog = Catalog(Path(temp_dir) / f"{max_workers}.sqlite")
+            start = time.perf_counter()
+            catalog.scan([folder], max_workers=max_workers)
+            full_scan = time.perf_counter() - start
+            start = time.perf_counter()
+            catalog.scan([folder], max_workers=max_workers)
+            rescan = time.perf_counter() - start
+            catalog.close()
+            print(
+                f"scan of {arguments.files} files with "
+                f"{max_workers or os.cpu_count()} process(es): {full_scan:.2f} s, "
+                f"unchanged rescan: {rescan:.2f} s"
+            )
+
+
+def benchmark_geotag(arguments: argparse.Namespace):
+    os.environ["FAKE_EXIFTOOL_STARTUP"] = str(arguments.startup)
+    command = [sys.executable, str(FAKE_EXIFTOOL_PATH)]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        track_path = create_synthetic_track(Path(temp_dir) / "synthetic.gstrack")
+        start_time = float(load_track(track_path)["time"][0])
+        folder = Path(temp_dir) / "Screenshots"
+        folder.mkdir()
+        image = Image.new("RGB", (64, 36))
+        for index in range(arguments.files):
+            image_time = time.localtime(start_time + index * 3600 / arguments.files)
+            image.save(folder / time.strftime("%Y%m%d%H%M%S_1.png", image_time))
+
+        for workers in arguments.workers:
+            for tags_path in folder.glob("*.tags.json"):
+                tags_path.unlink()
+            start = time.perf_counter()
+            result = geotag_folder(
+                folder, track_path, workers=workers, exiftool_command=command
+            )
+            elapsed = time.perf_counter() - start
+            print(
+                f"{workers} worker(s): {result.tagged / elapsed:.1f} files/s, "
+                f"{result.tagged} tagged, {result.outside_track} outside the track"
+            )
+
+
+def benchmark_export(arguments: argparse.Namespace):
+    random.seed(0)
+    codec = MetadataCodec()
+    start_time = time.time() - 365 * 24 * 3600
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        folder = Path(temp_dir) / "Screenshots"
+        folder.mkdir()
+        image = Image.new("RGB", (64, 36))
+        metadata = get_mock_metadata()
+        for index in range(arguments.files):
+            # written in a different order than they were taken
+            capture_time = start_time + random.uniform(0, 365 * 24 * 3600)
+            metadata.AllDates = time.strftime(
+                EXIF_DATE_FORMAT, time.localtime(capture_time)
+            )
+            metadata.GPSLatitude = random.uniform(-60, 70)
+            metadata.GPSLongitude = random.uniform(-180, 180)
+            image.save(
+                folder / f"{index}.jpg", exif=encode_exif(codec.record(metadata))
+            )
+
+        for max_workers in (1, None):
+            tracemalloc.start()
+            start = time.perf_counter()
+            result = export_folder(
+                folder,
+                geojson_path=Path(temp_dir) / "export.geojson",
+                kml_path=Path(temp_dir) / "export.kml",
+                max_workers=max_workers,
+            )
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(
+                f"{max_workers or os.cpu_count()} process(es): "
+                f"{result.exported / elapsed:.0f} images/s, "
+                f"{result.exported} exported, peak {peak / 2**20:.1f} MiB allocated"
+            )
+
+
+def benchmark_geocode(arguments: argparse.Namespace):
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        index_path = Path(temp_dir) / "places.bin"
+        # GeoNames cities1000 has about 140000 places
+        write_place_index(
+            index_path,
+            (
+                (
+                    random.uniform(-60, 70),
+                    random.uniform(-180, 180),
+                    f"City {index}",
+                    f"Country {index % 250}-State {index % 4000}",
+                )
+                for index in range(arguments.places)
+            ),
+        )
+
+        start = time.perf_counter()
+        geocoder = OfflineGeocoder(index_path)
+        opened = time.perf_counter() - start
+
+        positions = [
+            (random.uniform(-60, 70), random.uniform(-180, 180))
+            for _ in range(arguments.lookups)
+        ]
+        start = time.perf_counter()
+        found = sum(
+            geocoder.reverse(latitude, longitude) is not None
+            for latitude, longitude in positions
+        )
+        elapsed = time.perf_counter() - start
+        geocoder.close()
+
+        print(
+            f"{arguments.places} places ({index_path.stat().st_size / 2**20:.1f} MiB): "
+            f"opened in {opened * 1000:.2f} ms, "
+            f"{elapsed / arguments.lookups * 1e6:.1f} us/lookup, "
+            f"{found / arguments.lookups:.0%} found"
+        )
+
+
+def benchmark_geocode_cache(arguments: argparse.Namespace):
+    class CountingGeocoder(Geocoder):
+        """Stands in for Nominatim, with a lake north of 46.6 deg"""
+
+        lookups = 0
+
+        def reverse(self, latitude: float, longitude: float, offline_only=False):
+            self.lookups += 1
+            if latitude > 46.6:
+                return None
+            return f"Country-State-Place_{latitude:.1f}_{longitude:.1f}"
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        track = load_track(
+            create_synthetic_track(
+                Path(temp_dir) / "track.geoshot", duration=arguments.duration
+            )
+        )
+        # a screenshot every interval
+        step = max(1, int(arguments.interval * 10))
+        positions = list(zip(track["latitude"][::step], track["longitude"][::step]))
+
+        for cell_size in arguments.cell_sizes:
+            cache_path = Path(temp_dir) / f"geocodes-{cell_size}.sqlite"
+            for session in ("first", "second"):
+                inner = CountingGeocoder()
+                geocoder = CachedGeocoder(inner, path=cache_path, cell_size=cell_size)
+                start = time.perf_counter()
+                for latitude, longitude in positions:
+                    geocoder.reverse(latitude, longitude)
+                elapsed = time.perf_counter() - start
+                stats = geocoder.stats
+                geocoder.close()
+                print(
+                    f"cell {cell_size} deg, {session} session: "
+                    f"{stats.hits / len(positions):.0%} hits "
+                    f"({stats.negative_hits} negative), "
+                    f"{inner.lookups} of {len(positions)} shots looked up "
+                    f"(>= {inner.lookups} s at Nominatim's 1 request/s), "
+                    f"{elapsed / len(positions) * 1e6:.0f} us/shot"
+                )
+
+
+def benchmark_prefetch(arguments: argparse.Namespace):
+    class CountingGeocoder(Geocoder):
+        lookups = 0
+
+        def reverse(self, latitude: float, longitude: float, offline_only=False):
+            self.lookups += 1
+            return f"Country-State-Place_{latitude:.2f}_{longitude:.2f}"
+
+    # a straight leg east at 120 m/s, simulated faster than real time
+    speed = 120.0
+    heading = math.pi / 2
+    start_latitude, start_longitude = 46.5, 8.0
+    dest_latitude, dest_longitude = destination_point(
+        start_latitude, start_longitude, heading, speed * arguments.duration
+    )
+
+    def sample_at(elapsed: float) -> TelemetrySample:
+        latitude, longitude = destination_point(
+            start_latitude, start_longitude, heading, speed * elapsed
+        )
+        return TelemetrySample(
+            timestamp=elapsed,
+            latitude=latitude,
+            longitude=longitude,
+            altitude=1500.0,
+            speed=speed,
+            heading=heading,
+            dest_latitude=dest_latitude,
+            dest_longitude=dest_longitude,
+            aircraft_type=None,
+        )
+
+    shot_times = [
+        index * arguments.interval
+        for index in range(int(arguments.duration // arguments.interval))
+    ]
+    for name, budget in (
+        ("no prefetch", None),
+        ("prefetch, unlimited budget", 1e9),
+        ("prefetch, default budget (its burst, time is simulated)", 120.0),
+    ):
+        inner = CountingGeocoder()
+        geocoder = CachedGeocoder(inner)
+        prefetcher = (
+            GeocodePrefetcher(geocoder, lambda: None, budget=budget) if budget else None
+        )
+        local = 0
+        next_prefetch = 0.0
+        start = time.perf_counter()
+        for shot_time in shot_times:
+            while prefetcher and next_prefetch <= shot_time:
+                prefetcher.prefetch(sample_at(next_prefetch))
+                next_prefetch += prefetcher._interval
+            sample = sample_at(shot_time)
+            local += geocoder.is_cached(sample.latitude, sample.longitude)
+            geocoder.reverse(sample.latitude, sample.longitude)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name}: {local / len(shot_times):.0%} of {len(shot_times)} shots "
+            f"named without waiting, {inner.lookups} lookups "
+            f"({(prefetcher.lookups if prefetcher else 0)} prefetched), "
+            f"{elapsed / len(shot_times) * 1000:.2f} ms/shot"
+        )
+
+
+def benchmark_airports(arguments: argparse.Namespace):
+    random.seed(0)
+    # OurAirports lists about 70000 open airports, heliports and seaplane bases
+    airports = [
+        (
+            f"A{index:05d}",
+            f"Airport {index}",
+            math.degrees(math.asin(random.uniform(-1, 1))),
+            random.uniform(-180, 180),
+        )
+        for index in range(arguments.airports)
+    ]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        index_path = Path(temp_dir) / "airports.npz"
+        start = time.perf_counter()
+        write_airport_index(index_path, airports)
+        built = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = AirportIndex(index_path)
+        loaded = time.perf_counter() - start
+
+    positions = [
+        (math.degrees(math.asin(random.uniform(-1, 1))), random.uniform(-180, 180))
+        for _ in range(arguments.lookups)
+    ]
+    for name, max_distance in (("unlimited", math.inf), ("within 50 km", 50000.0)):
+        start = time.perf_counter()
+        for latitude, longitude in positions:
+            index.nearest(latitude, longitude, max_distance)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name}: {elapsed / arguments.lookups * 1e6:.1f} us/lookup "
+            f"in {len(index)} airports"
+        )
+
+    # the tree must find what comparing against every airport finds
+    mismatches = 0
+    checked = positions[: arguments.checks]
+    for latitude, longitude in checked:
+        nearest = min(
+            airports,
+            key=lambda airport: haversine_distance(
+                latitude, longitude, airport[2], airport[3]
+            ),
+        )
+        airport = index.nearest(latitude, longitude)
+        mismatches += airport is None or airport.ident != nearest[0]
+    print(
+        f"built in {built * 1000:.0f} ms, loaded in {loaded * 1000:.1f} ms, "
+        f"{mismatches} of {len(checked)} lookups differ from a linear search"
+    )
+
+
+def benchmark_timezones(arguments: argparse.Namespace):
+    random.seed(0)
+    # 24 zones of 15 degrees with wiggly borders, one of them with an enclave,
+    # about as many edges as the simplified timezone-boundary-builder data
+    latitudes = np.linspace(-90, 90, arguments.vertices)
+
+    def border(longitude: float) -> np.ndarray:
+        if abs(longitude) == 180:
+            return np.full(len(latitudes), longitude)
+        return longitude + 2 * np.sin(np.radians(latitudes) * 40 + longitude)
+
+    enclave = np.array([[-25, 10], [-20, 10], [-20, 14], [-25, 14]], dtype=float)
+    zones = []
+    for index, west in enumerate(range(-180, 180, 15)):
+        east = west + 15
+        ring = np.vstack(
+            (
+                np.column_stack((border(east), latitudes)),
+                np.column_stack((border(west)[::-1], latitudes[::-1])),
+            )
+        )
+        rings = [ring, enclave] if west <= -25 and -20 <= east else [ring]
+        zones.append((f"Etc/GMT{-index + 12:+d}", rings))
+    zones.append(("Asia/Tokyo", [enclave]))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        index_path = Path(temp_dir) / "timezones.npz"
+        start = time.perf_counter()
+        write_timezone_index(index_path, zones)
+        built = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = TimezoneIndex(index_path)
+        loaded = time.perf_counter() - start
+
+    positions = [
+        (random.uniform(-89.9, 89.9), random.uniform(-179.9, 179.9))
+        for _ in range(arguments.lookups)
+    ]
+    start = time.perf_counter()
+    names = [index.zone_name(latitude, longitude) for latitude, longitude in positions]
+    uncached = (time.perf_counter() - start) / len(positions)
+
+    # screenshots every few seconds, a few km apart
+    latitude, longitude = positions[0]
+    start = time.perf_counter()
+    for step in range(arguments.lookups):
+        index.get_timezone(latitude + step * 1e-5, longitude)
+    cached = (time.perf_counter() - start) / arguments.lookups
+
+    # the index must find what testing every polygon finds
+    def brute_force(latitude: float, longitude: float) -> Optional[str]:
+        for name, rings in zones:
+            crossings = 0
+            for ring in rings:
+                next_ring = np.roll(ring, -1, axis=0)
+                for (x0, y0), (x1, y1) in zip(ring.tolist(), next_ring.tolist()):
+                    if (y0 > latitude) != (y1 > latitude):
+                        x = x0 + (latitude - y0) * (x1 - x0) / (y1 - y0)
+                        crossings += x > longitude
+            if crossings % 2:
+                return name
+        return None
+
+    checked = positions[: arguments.checks]
+    mismatches = sum(
+        name != brute_force(latitude, longitude)
+        for (latitude, longitude), name in zip(checked, names)
+    )
+    edge_count = sum(len(ring) for _, rings in zones for ring in rings)
+    print(
+        f"{len(zones)} zones, {edge_count} edges: built in {built * 1000:.0f} ms, "
+        f"loaded in {loaded * 1000:.1f} ms, "
+        f"{uncached * 1e6:.1f} us/lookup, {cached * 1e6:.2f} us/cached lookup, "
+        f"{mismatches} of {len(checked)} lookups differ from testing every polygon"
+    )
+
+
+def benchmark_names(arguments: argparse.Namespace):
+    class ConstantGeocoder(Geocoder):
+        def reverse(self, latitude: float, longitude: float, offline_only=False):
+            return "United_States-Texas-Austin"
+
+    composer = FileNameComposer(ConstantGeocoder())
+    settings = _SettingsData()
+    name_format, date_format = settings.file_name_format, settings.date_format
+    metadata = get_mock_metadata()
+    template = composer.compile(name_format, date_format)
+
+    def check_formats():
+        # what composing each name used to repeat, bypassing the cache
+        assert _check_name_format.__wrapped__(name_format)[0]
+        assert _check_date_format.__wrapped__(date_format)[0]
+
+    for name, run in (
+        ("checking the formats", check_formats),
+        (
+            "compiling the template (cached checks)",
+            lambda: composer.compile(name_format, date_format),
+        ),
+        (
+            "composing from the template",
+            lambda: composer.compose_name(template, metadata),
+        ),
+        ("example for the preview", lambda: composer.preview(template)),
+    ):
+        seconds = min(timeit.repeat(run, number=arguments.names, repeat=5))
+        print(f"{name}: {seconds / arguments.names * 1e6:.1f} us")
+
+
+def benchmark_watch(arguments: argparse.Namespace):
+    os.environ["FAKE_EXIFTOOL_STARTUP"] = str(arguments.startup)
+    app = QCoreApplication([])
+
+    def run_event_loop(timeout: float, is_done: Callable[[], bool] = lambda: False):
+        poll_timer = QTimer()
+        poll_timer.timeout.connect(lambda: is_done() and app.quit())  # type: ignore
+        poll_timer.start(50)
+        timeout_timer = QTimer()
+        timeout_timer.setSingleShot(True)
+        timeout_timer.timeout.connect(app.quit)  # type: ignore
+        timeout_timer.start(round(timeout * 1000))
+        app.exec_()
+        poll_timer.stop()
+        timeout_timer.stop()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        # keeps the settings of the installed app untouched
+        QSettings.setPath(
+            QSettings.Format.IniFormat, QSettings.Scope.UserScope, temp_dir
+        )
+        settings = AppSettings(app)
+        settings.file_name_format = "MSFS_{datetime}"  # no geocoding requests
+
+        track = load_track(create_synthetic_track(temp_path / "synthetic.gstrack"))
+        sim_service = SimService(
+            source=ReplaySource(track), window_backend=FakeWindowBackend()
+        )
+        metadata_service = MetadataService([sys.executable, str(FAKE_EXIFTOOL_PATH)])
+        file_name_composer = FileNameComposer()
+        controller = ScreenShotController(
+            sim_service=sim_service,
+            metadata_service=metadata_service,
+            screenshot_service=ScreenshotService(file_name_composer),
+            file_name_composer=file_name_composer,
+            settings=settings,
+        )
+        folder = temp_path / "Captures"
+        folder.mkdir()
+        watcher = FolderWatcher()
+        watcher.file_ready.connect(controller.tag_screenshot_file)  # type: ignore
+        controller.file_saved.connect(watcher.mark_known)  # type: ignore
+        tagged_times: List[float] = []
+        controller.screenshot_taken.connect(  # type: ignore
+            lambda result: tagged_times.append(time.perf_counter())
+        )
+        controller.error.connect(print)  # type: ignore
+
+        watcher.watch(folder)
+        cpu_start = time.process_time()
+        run_event_loop(arguments.idle)
+        idle_cpu = time.process_time() - cpu_start
+
+        sim_service.start()
+        try:
+            run_event_loop(10.0, lambda: sim_service.is_connected)
+            run_event_loop(1.0)  # let a few samples come in
+
+            image = Image.new("RGB", (1920, 1080))
+            start = time.perf_counter()
+            for index in range(arguments.files):
+                image.save(folder / f"Screenshot {index}.png")
+            written = time.perf_counter()
+            run_event_loop(
+                arguments.timeout, lambda: len(tagged_times) >= arguments.files
+            )
+        finally:
+            sim_service.stop()
+            metadata_service.close()
+
+        images = list(folder.glob("*.png"))
+        renamed = sum(path.name.startswith("MSFS_") for path in images)
+        with_position = sum(
+            "GPSLatitude" in path.with_name(f"{path.name}.tags.json").read_text()
+            for path in images
+            if path.with_name(f"{path.name}.tags.json").is_file()
+        )
+        print(f"idle: {idle_cpu / arguments.idle:.2%} CPU over {arguments.idle:g} s")
+        if not tagged_times:
+            print(f"burst of {arguments.files}: nothing tagged")
+            return
+        print(
+            f"burst of {arguments.files} written in {written - start:.2f} s: "
+            f"first tagged after {tagged_times[0] - written:.2f} s, "
+            f"last after {tagged_times[-1] - written:.2f} s, "
+            f"{len(tagged_times)} tagged, {renamed} renamed, "
+            f"{with_position} with a position"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    simconnect_parser = subparsers.add_parser(
+        "simconnect", help="Per-variable vs. batched SimConnect requests"
+    )
+    simconnect_parser.add_argument("--samples", type=int, default=100)
+    simconnect_parser.add_argument(
+        "--latency", type=float, default=0.002, help="Simulated s per round trip"
+    )
+    simconnect_parser.set_defaults(run=benchmark_simconnect)
+
+    replay_parser = subparsers.add_parser(
+        "replay", help="Flight data lookups against a replayed track"
+    )
+    replay_parser.add_argument(
+        "--track", type=Path, help="Recorded track, a synthetic one by default"
+    )
+    replay_parser.add_argument("--speed", type=float, default=10.0)
+    replay_parser.add_argument("--duration", type=float, default=2.0, help="s")
+    replay_parser.set_defaults(run=benchmark_replay)
+
+    sampling_parser = subparsers.add_parser(
+        "sampling", help="Samples taken by the adaptive rate controller"
+    )
+    sampling_parser.add_argument(
+        "--track", type=Path, help="Recorded track, a synthetic one by default"
+    )
+    sampling_parser.add_argument("--min-interval", type=float, default=0.1)
+    sampling_parser.add_argument("--max-interval", type=float, default=2.0)
+    sampling_parser.add_argument("--target-error", type=float, default=10.0)
+    sampling_parser.set_defaults(run=benchmark_sampling)
+
+    exiftool_parser = subparsers.add_parser(
+        "exiftool", help="exiftool per file vs. kept running vs. batched"
+    )
+    exiftool_parser.add_argument("--files", type=int, default=50)
+    exiftool_parser.add_argument(
+        "--startup",
+        type=float,
+        default=0.3,
+        help="Simulated start-up time of the stand-in exiftool, in s",
+    )
+    exiftool_parser.add_argument(
+        "--exiftool",
+        nargs="+",
+        help="Command of a real exiftool to use instead of the stand-in",
+    )
+    exiftool_parser.set_defaults(run=benchmark_exiftool)
+
+    metadata_parser = subparsers.add_parser(
+        "metadata", help="Serialization of Metadata into each output format"
+    )
+    metadata_parser.add_argument("--repeat", type=int, default=10000)
+    metadata_parser.set_defaults(run=benchmark_metadata)
+
+    catalog_parser = subparsers.add_parser(
+        "catalog", help="Catalog queries and folder scans"
+    )
+    catalog_parser.add_argument("--shots", type=int, default=100000)
+    catalog_parser.add_argument("--repeat", type=int, default=20)
+    catalog_parser.add_argument(
+        "--files", type=int, default=2000, help="Images to scan, 0 to skip"
+    )
+    catalog_parser.set_defaults(run=benchmark_catalog)
+
+    geotag_parser = subparsers.add_parser(
+        "geotag", help="Geotagging a folder from a track with parallel exiftools"
+    )
+    geotag_parser.add_argument("--files", type=int, default=1000)
+    geotag_parser.add_argument(
+        "--workers", type=int, nargs="+", default=[1, 2, 4], help="Runs to compare"
+    )
+    geotag_parser.add_argument(
+        "--startup",
+        type=float,
+        default=0.3,
+        help="Simulated start-up time of the stand-in exiftool, in s",
+    )
+    geotag_parser.set_defaults(run=benchmark_geotag)
+
+    export_parser = subparsers.add_parser(
+        "export", help="Export of a folder of images to GeoJSON and KML"
+    )
+    export_parser.add_argument("--files", type=int, default=20000)
+    export_parser.set_defaults(run=benchmark_export)
+
+    geocode_parser = subparsers.add_parser(
+        "geocode", help="Offline reverse geocoding lookups"
+    )
+    geocode_parser.add_argument("--places", type=int, default=140000)
+    geocode_parser.add_argument("--lookups", type=int, default=20000)
+    geocode_parser.set_defaults(run=benchmark_geocode)
+
+    geocode_cache_parser = subparsers.add_parser(
+        "geocode-cache", help="Geocode cache hit rates over a synthetic flight"
+    )
+    geocode_cache_parser.add_argument(
+        "--duration", type=float, default=3600.0, help="s of flight"
+    )
+    geocode_cache_parser.add_argument(
+        "--interval", type=float, default=10.0, help="s between screenshots"
+    )
+    geocode_cache_parser.add_argument(
+        "--cell-sizes", type=float, nargs="+", default=[0.01, 0.02, 0.05]
+    )
+    geocode_cache_parser.set_defaults(run=benchmark_geocode_cache)
+
+    prefetch_parser = subparsers.add_parser(
+        "prefetch", help="Geocode prefetching along a leg to the next waypoint"
+    )
+    prefetch_parser.add_argument(
+        "--duration", type=float, default=1800.0, help="s of flight"
+    )
+    prefetch_parser.add_argument(
+        "--interval", type=float, default=30.0, help="s between screenshots"
+    )
+    prefetch_parser.set_defaults(run=benchmark_prefetch)
+
+    airports_parser = subparsers.add_parser(
+        "airports", help="Nearest airport lookups in the k-d tree"
+    )
+    airports_parser.add_argument("--airports", type=int, default=70000)
+    airports_parser.add_argument("--lookups", type=int, default=10000)
+    airports_parser.add_argument(
+        "--checks", type=int, default=200, help="Lookups to compare to a linear search"
+    )
+    airports_parser.set_defaults(run=benchmark_airports)
+
+    timezones_parser = subparsers.add_parser(
+        "timezones", help="Timezone lookups in the grid of timezone polygons"
+    )
+    timezones_parser.add_argument(
+        "--vertices", type=int, default=5000, help="Per zone border"
+    )
+    timezones_parser.add_argument("--lookups", type=int, default=10000)
+    timezones_parser.add_argument(
+        "--checks", type=int, default=300, help="Lookups to compare to every polygon"
+    )
+    timezones_parser.set_defaults(run=benchmark_timezones)
+
+    names_parser = subparsers.add_parser(
+        "names", help="Composing file names from a compiled template"
+    )
+    names_parser.add_argument("--names", type=int, default=2000)
+    names_parser.set_defaults(run=benchmark_names)
+
+    watch_parser = subparsers.add_parser(
+        "watch", help="Geotagging a burst of images saved to a watched folder"
+    )
+    watch_parser.add_argument("--files", type=int, default=300)
+    watch_parser.add_argument(
+        "--idle", type=float, default=2.0, help="s to measure idle CPU use over"
+    )
+    watch_parser.add_argument("--timeout", type=float, default=120.0, help="s")
+    watch_parser.add_argument(
+        "--startup",
+        type=float,
+        default=0.3,
+        help="Simulated start-up time of the stand-in exiftool, in s",
+    )
+    watch_parser.set_defaults(run=benchmark_watch)
+
+    arguments = parser.parse_args()
+    arguments.run(arguments)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+"""Build the airport index of the {airport} file name field from OurAirports
+
+The airport list is downloaded to the data folder first if missing. Data by
+OurAirports (https://ourairports.com/), released to the public domain.
+"""
+
+import argparse
+import csv
+import sys
+import urllib.request
+from pathlib import Path
+from typing import Iterator, Tuple
+
+from msfs_geoshot.airports import AIRPORT_INDEX_PATH, write_airport_index
+
+DOWNLOAD_URL = "https://davidmegginson.github.io/ourairports-data/airports.csv"
+
+root_project_path = Path(__file__).parent.parent
+
+
+def download(data_folder: Path) -> Path:
+    path = data_folder / "airports.csv"
+    if path.is_file():
+        return path
+    data_folder.mkdir(parents=True, exist_ok=True)
+    print(f"Downloading {DOWNLOAD_URL}")
+    with urllib.request.urlopen(DOWNLOAD_URL) as response:
+        path.write_bytes(response.read())
+    return path
+
+
+def read_airports(airports_path: Path) -> Iterator[Tuple[str, str, float, float]]:
+    with airports_path.open(encoding="utf-8", newline="") as airports_file:
+        for row in csv.DictReader(airports_file):
+            if row["type"] == "closed":
+                continue
+            # icao_code is only in recent exports, gps_code mostly is the
+            # ICAO code, ident is a code made up where there is none
+            ident = row.get("icao_code") or row.get("gps_code") or row["ident"]
+            yield (
+                ident,
+                row["name"],
+                float(row["latitude_deg"]),
+                float(row["longitude_deg"]),
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--data",
+        type=Path,
+        default=root_project_path / "build" / "ourairports",
+        help="Folder of the OurAirports files",
+    )
+    parser.add_argument("--out", type=Path, default=AIRPORT_INDEX_PATH)
+    arguments = parser.parse_args()
+
+    airports_path = download(arguments.data)
+    airports = list(read_airports(airports_path))
+    if not airports:
+        sys.exit(f"No airports found in {airports_path}")
+    write_airport_index(arguments.out, airports)
+    print(f"Wrote {len(airports)} airports to {arguments.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+"""Build the place index of the offline geocoder from GeoNames data
+
+Missing GeoNames files are downloaded to the data folder first. Data by
+GeoNames (https://www.geonames.org/), licensed under CC BY 4.0.
+"""
+
+import argparse
+import csv
+import io
+import sys
+import urllib.request
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+from msfs_geoshot.geocoding import PLACE_INDEX_PATH, write_place_index
+
+DOWNLOAD_URL = "https://download.geonames.org/export/dump/"
+
+root_project_path = Path(__file__).parent.parent
+
+
+def download(data_folder: Path, file_name: str) -> Path:
+    path = data_folder / file_name
+    if path.is_file():
+        return path
+    data_folder.mkdir(parents=True, exist_ok=True)
+    zip_name = f"{path.stem}.zip" if file_name.startswith("cities") else None
+    url = DOWNLOAD_URL + (zip_name or file_name)
+    print(f"Downloading {url}")
+    with urllib.request.urlopen(url) as response:
+        data = response.read()
+    if zip_name:
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            data = archive.read(file_name)
+    path.write_bytes(data)
+    return path
+
+
+def read_table(path: Path) -> Iterator[list]:
+    with path.open(encoding="utf-8", newline="") as table_file:
+        for row in csv.reader(table_file, delimiter="\t", quoting=csv.QUOTE_NONE):
+            if row and not row[0].startswith("#"):
+                yield row
+
+
+def read_places(
+    cities_path: Path, admin1_path: Path, countries_path: Path
+) -> Iterator[Tuple[float, float, str, str]]:
+    countries: Dict[str, str] = {row[0]: row[4] for row in read_table(countries_path)}
+    states: Dict[str, str] = {row[0]: row[1] for row in read_table(admin1_path)}
+
+    for row in read_table(cities_path):
+        name = row[1]
+        latitude = float(row[4])
+        longitude = float(row[5])
+        country_code = row[8]
+        country = countries.get(country_code, country_code)
+        state = states.get(f"{country_code}.{row[10]}")
+        region = f"{country}-{state}" if state else country
+        yield latitude, longitude, name, region
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--data",
+        type=Path,
+        default=root_project_path / "build" / "geonames",
+        help="Folder of the GeoNames files",
+    )
+    parser.add_argument(
+        "--cities",
+        default="cities1000",
+        choices=["cities500", "cities1000", "cities5000", "cities15000"],
+        help="GeoNames extract of places with at least this many inhabitants",
+    )
+    parser.add_argument("--out", type=Path, default=PLACE_INDEX_PATH)
+    arguments = parser.parse_args()
+
+    cities_path = download(arguments.data, f"{arguments.cities}.txt")
+    admin1_path = download(arguments.data, "admin1CodesASCII.txt")
+    countries_path = download(arguments.data, "countryInfo.txt")
+
+    places = list(read_places(cities_path, admin1_path, countries_path))
+    if not places:
+        sys.exit(f"No places found in {cities_path}")
+    write_place_index(arguments.out, places)
+    print(f"Wrote {len(places)} places to {arguments.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+"""Build the timezone index from timezone-boundary-builder data
+
+The boundaries are downloaded to the data folder first if missing, and
+simplified before indexing. Data by timezone-boundary-builder
+(https://github.com/evansiroky/timezone-boundary-builder), derived from
+OpenStreetMap and licensed under the ODbL.
+"""
+
+import argparse
+import json
+import sys
+import urllib.request
+import zipfile
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+from msfs_geoshot.timezones import TIMEZONE_INDEX_PATH, write_timezone_index
+
+DOWNLOAD_URL = (
+    "https://github.com/evansiroky/timezone-boundary-builder/releases/latest/"
+    "download/timezones-with-oceans.geojson.zip"
+)
+
+root_project_path = Path(__file__).parent.parent
+
+
+def download(data_folder: Path) -> Path:
+    path = data_folder / "timezones-with-oceans.geojson.zip"
+    if path.is_file():
+        return path
+    data_folder.mkdir(parents=True, exist_ok=True)
+    print(f"Downloading {DOWNLOAD_URL}")
+    with urllib.request.urlopen(DOWNLOAD_URL) as response:
+        path.write_bytes(response.read())
+    return path
+
+
+def simplify(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """Douglas-Peucker simplification of a ring, tolerance in degrees"""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    ranges = [(0, len(points) - 1)]
+    while ranges:
+        start, end = ranges.pop()
+        if end - start < 2:
+            continue
+        first, last = points[start], points[end]
+        inner = points[start + 1 : end]
+        dx, dy = last - first
+        length = np.hypot(dx, dy)
+        if length == 0:
+            # the first and last point of a closed ring
+            distances = np.hypot(*(inner - first).T)
+        else:
+            distances = (
+                np.abs(dx * (inner[:, 1] - first[1]) - dy * (inner[:, 0] - first[0]))
+                / length
+            )
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            middle = start + 1 + index
+            keep[middle] = True
+            ranges.append((start, middle))
+            ranges.append((middle, end))
+    simplified = points[keep]
+    # rings smaller than the tolerance are kept as they are
+    return simplified if len(simplified) >= 4 else points
+
+
+def read_zones(
+    archive_path: Path, tolerance: float
+) -> Iterator[Tuple[str, List[np.ndarray]]]:
+    with zipfile.ZipFile(archive_path) as archive:
+        (member,) = (name for name in archive.namelist() if name.endswith(".json"))
+        with archive.open(member) as geojson_file:
+            features = json.load(geojson_file)["features"]
+
+    for feature in features:
+        geometry = feature["geometry"]
+        polygons = (
+            [geometry["coordinates"]]
+            if geometry["type"] == "Polygon"
+            else geometry["coordinates"]
+        )
+        rings = [
+            simplify(np.array(ring, dtype=np.float64), tolerance)
+            for polygon in polygons
+            for ring in polygon
+        ]
+        yield feature["properties"]["tzid"], rings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--data",
+        type=Path,
+        default=root_project_path / "build" / "timezones",
+        help="Folder of the timezone-boundary-builder files",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.005,
+        help="Simplification tolerance in degrees",
+    )
+    parser.add_argument("--out", type=Path, default=TIMEZONE_INDEX_PATH)
+    arguments = parser.parse_args()
+
+    archive_path = download(arguments.data)
+    zones = list(read_zones(archive_path, arguments.tolerance))
+    if not zones:
+        sys.exit(f"No timezones found in {archive_path}")
+    write_timezone_index(arguments.out, zones)
+    edge_count = sum(len(ring) for _, rings in zones for ring in rings)
+    print(f"Wrote {len(zones)} timezones ({edge_count} edges) to {arguments.out}")
+
+
+if __name__ == "__main__":
+    main()
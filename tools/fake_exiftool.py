@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""Stand-in for exiftool speaking its command line and -stay_open protocol
+
+Tags are not written to the image itself but to a JSON file next to it
+(<image>.tags.json), which is enough to exercise MetadataService without the
+real exiftool.exe. Set FAKE_EXIFTOOL_STARTUP to the number of seconds startup
+should take to mimic Perl's start-up cost, FAKE_EXIFTOOL_CRASH_ON to a file
+name to make the process exit when asked to write to it.
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+VERSION = "12.30"
+
+
+def run_block(arguments: List[str]) -> str:
+    """Process one block of arguments, returning its output"""
+    tags: Dict[str, str] = {}
+    files: List[Path] = []
+    output: List[str] = []
+
+    iterator = iter(arguments)
+    for argument in iterator:
+        if argument == "-ver":
+            output.append(VERSION)
+        elif argument in ("-charset", "-echo", "-echo4"):
+            next(iterator, None)
+        elif argument.startswith("-") and "=" in argument:
+            name, value = argument[1:].split("=", 1)
+            tags[name] = value
+        elif not argument.startswith("-"):
+            files.append(Path(argument))
+
+    if not files:
+        return "".join(f"{line}\n" for line in output)
+
+    crash_on = os.environ.get("FAKE_EXIFTOOL_CRASH_ON")
+    updated = 0
+    failed = 0
+    for path in files:
+        if crash_on and path.name == crash_on:
+            sys.exit(1)
+        if not path.is_file():
+            output.append(f"Error: File not found - {path}")
+            failed += 1
+            continue
+        tags_path = path.with_name(f"{path.name}.tags.json")
+        tags_path.write_text(json.dumps(tags, indent=2), encoding="utf-8")
+        updated += 1
+
+    output.append(f"    {updated} image files updated")
+    if failed:
+        output.append(f"    {failed} files weren't updated due to errors")
+    return "".join(f"{line}\n" for line in output)
+
+
+def stay_open(stream):
+    block: List[str] = []
+    for line in stream:
+        argument = line.rstrip("\r\n")
+        if argument == "-stay_open":
+            continue
+        if argument == "False":
+            return
+        if argument.startswith("-execute"):
+            sys.stdout.write(run_block(block))
+            sys.stdout.write(f"{{ready{argument[len('-execute'):]}}}\n")
+            sys.stdout.flush()
+            block = []
+        else:
+            block.append(argument)
+
+
+def main(arguments: List[str]):
+    time.sleep(float(os.environ.get("FAKE_EXIFTOOL_STARTUP", 0.0)))
+
+    if arguments[:4] == ["-stay_open", "True", "-@", "-"]:
+        stay_open(sys.stdin)
+        return
+
+    # one-shot invocation, blocks separated by -execute
+    block: List[str] = []
+    has_errors = False
+    for argument in arguments + ["-execute"]:
+        if argument == "-execute":
+            output = run_block(block)
+            has_errors = has_errors or "weren't updated" in output
+            sys.stdout.write(output)
+            block = []
+        else:
+            block.append(argument)
+    sys.exit(1 if has_errors else 0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])